@@ -36,6 +36,10 @@ class SMTPProviderAdmin(admin.ModelAdmin):
             'fields': ('emails_per_day', 'emails_per_hour', 'emails_per_second'),
             'classes': ('collapse',)
         }),
+        ('Connection Pool', {
+            'fields': ('max_connections', 'max_messages_per_connection', 'max_connection_age'),
+            'classes': ('collapse',)
+        }),
         ('Statistics', {
             'fields': ('total_sent', 'total_delivered', 'total_bounced', 'total_opened', 'total_clicked', 'last_used'),
             'classes': ('collapse',)
@@ -150,7 +154,7 @@ class CampaignAdmin(admin.ModelAdmin):
             'fields': ('subscriber_lists',)
         }),
         ('SMTP Provider', {
-            'fields': ('smtp_provider',)
+            'fields': ('smtp_provider', 'send_mode', 'allowed_providers')
         }),
 
         ('Statistics', {
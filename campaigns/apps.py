@@ -4,4 +4,7 @@ class CampaignsConfig(AppConfig):
 
     default_auto_field = 'django.db.models.BigAutoField'
 
-    name = 'campaigns'
\ No newline at end of file
+    name = 'campaigns'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import ssl
+import time
+from dataclasses import dataclass
+from email.utils import make_msgid
+from typing import Dict, Any, List, Optional, Union
+
+import aiosmtplib
+
+from .circuit_breaker import is_connection_error
+from .domain_throttle import smtp_reply_code
+
+logger = logging.getLogger(__name__)
+
+
+def _failure(error: Exception) -> Dict[str, Any]:
+    return {
+        'success': False,
+        'error': str(error),
+        'smtp_code': smtp_reply_code(error),
+        'connection_error': is_connection_error(error),
+    }
+
+
+@dataclass
+class OutgoingMessage:
+    """A fully rendered message ready to go out over SMTP"""
+    from_email: str
+    recipients: List[str]
+    content: Union[str, bytes]
+    message_id: Optional[str] = None
+
+
+class AsyncDeliveryEngine:
+    """
+    asyncio SMTP delivery engine: pipes messages concurrently over up to
+    ``concurrency`` reused sessions to one provider. Call close() when done.
+    """
+
+    def __init__(self, provider, concurrency: Optional[int] = None, timeout: float = 60):
+        self.provider = provider
+        self.concurrency = max(1, concurrency or provider.max_connections)
+        self.timeout = timeout
+        self._loop = None
+        self._idle_sessions = []
+
+    def deliver(self, messages: List[OutgoingMessage]) -> List[Dict[str, Any]]:
+        """
+        Deliver messages from synchronous code (Celery tasks, management commands).
+        Sessions stay open between calls until close() is called.
+        Returns: List of result dicts, one per message and in the same order
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(self.deliver_async(messages))
+
+    def resize(self, concurrency: int):
+        """Use up to ``concurrency`` sessions from the next deliver() on, quitting idle ones beyond that"""
+        self.concurrency = max(1, concurrency)
+        surplus = self._idle_sessions[self.concurrency:]
+        del self._idle_sessions[self.concurrency:]
+        if surplus and self._loop is not None:
+            self._loop.run_until_complete(self._close_all(surplus))
+
+    def close(self):
+        """Quit every open session and shut down the engine's event loop"""
+        if self._loop is None:
+            return
+        sessions, self._idle_sessions = self._idle_sessions, []
+        self._loop.run_until_complete(self._close_all(sessions))
+        self._loop.close()
+        self._loop = None
+
+    async def deliver_async(self, messages: List[OutgoingMessage]) -> List[Dict[str, Any]]:
+        """Deliver messages concurrently over up to ``concurrency`` SMTP sessions"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        queue: asyncio.Queue = asyncio.Queue()
+        for index, message in enumerate(messages):
+            queue.put_nowait((index, message))
+
+        workers = [
+            asyncio.create_task(self._session_worker(queue, results))
+            for _ in range(min(self.concurrency, len(messages)))
+        ]
+        await asyncio.gather(*workers)
+        return results
+
+    async def _session_worker(self, queue: asyncio.Queue, results: list):
+        """Drain the queue over a single, reused SMTP session"""
+        session = self._idle_sessions.pop() if self._idle_sessions else None
+        while True:
+            try:
+                index, message = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+
+            for attempt in range(2):
+                try:
+                    if session is None or self._is_expired(session):
+                        await self._close(session)
+                        session = await self._open_session()
+                    await session['client'].sendmail(message.from_email, message.recipients, message.content)
+                    session['message_count'] += 1
+                    results[index] = {
+                        'success': True,
+                        'message_id': message.message_id or make_msgid(domain=self.provider.host)
+                    }
+                    break
+                except aiosmtplib.SMTPServerDisconnected as e:
+                    # Stale session: reconnect and retry the message once
+                    session = None
+                    if attempt:
+                        results[index] = _failure(e)
+                except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused,
+                        aiosmtplib.SMTPDataError) as e:
+                    # Per-message refusal: the session itself is still usable
+                    results[index] = _failure(e)
+                    try:
+                        await session['client'].rset()
+                    except aiosmtplib.SMTPException:
+                        session = None
+                    break
+                except Exception as e:
+                    await self._close(session)
+                    session = None
+                    results[index] = _failure(e)
+                    break
+
+        if session is not None:
+            self._idle_sessions.append(session)
+
+    async def _open_session(self) -> dict:
+        """Open, secure and authenticate an SMTP session, mirroring open_smtp_connection"""
+        provider = self.provider
+        context = ssl.create_default_context()
+        if provider.skip_tls_verify and provider.host != 'smtp.gmail.com':
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+
+        use_ssl = provider.use_ssl and provider.host != 'smtp.gmail.com'
+        use_starttls = provider.host == 'smtp.gmail.com' or (provider.use_tls and not use_ssl)
+
+        client = aiosmtplib.SMTP(
+            hostname=provider.host,
+            port=provider.port,
+            use_tls=use_ssl,
+            start_tls=False,
+            tls_context=context,
+            timeout=self.timeout,
+        )
+        await client.connect()
+        if use_starttls:
+            await client.starttls(tls_context=context)
+        if provider.username and provider.password:
+            await client.login(provider.username, provider.password)
+
+        return {'client': client, 'opened_at': time.monotonic(), 'message_count': 0}
+
+    def _is_expired(self, session: dict) -> bool:
+        return (
+            session['message_count'] >= self.provider.max_messages_per_connection
+            or time.monotonic() - session['opened_at'] >= self.provider.max_connection_age
+        )
+
+    async def _close_all(self, sessions: list):
+        await asyncio.gather(*(self._close(session) for session in sessions))
+
+    @staticmethod
+    async def _close(session: Optional[dict]):
+        if session is None:
+            return
+        try:
+            await session['client'].quit()
+        except Exception:
+            session['client'].close()
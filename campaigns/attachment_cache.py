@@ -0,0 +1,124 @@
+import base64
+import logging
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from email.header import Header
+from typing import List, Union
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CRLF = b'\r\n'
+
+
+@dataclass
+class EncodedAttachment:
+    """
+    A campaign attachment read and base64-encoded once.
+
+    ``body`` holds the CRLF-wrapped base64 payload, either in memory or, for
+    files above CAMPAIGN_ATTACHMENT_SPOOL_THRESHOLD, as a read-only memory map
+    of an anonymous spool file. Every message of the campaign shares it.
+    """
+    attachment_id: int
+    filename: str
+    size: int
+    headers: bytes
+    body: Union[bytes, mmap.mmap]
+
+    @property
+    def signature(self) -> tuple:
+        return (self.attachment_id, self.filename, self.size)
+
+    def payload(self) -> str:
+        """The encoded payload as text, for email.mime parts"""
+        return bytes(self.body).decode('ascii')
+
+
+def _base64_lines(content: bytes) -> bytes:
+    """Base64-encode content into 76-character CRLF-terminated lines"""
+    return base64.encodebytes(content).replace(b'\n', CRLF)
+
+
+def _spool(data: bytes) -> mmap.mmap:
+    """Move encoded bytes out of the heap into a memory-mapped temporary file"""
+    with tempfile.TemporaryFile() as spool_file:
+        spool_file.write(data)
+        spool_file.flush()
+        return mmap.mmap(spool_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def encode_attachment(attachment) -> EncodedAttachment:
+    """Read an Attachment's file from the start and encode it as a MIME part"""
+    attachment_file = attachment.file
+    attachment_file.open('rb')
+    try:
+        content = attachment_file.read()
+    finally:
+        attachment_file.close()
+
+    filename = os.path.basename(attachment_file.name)
+    try:
+        filename.encode('ascii')
+        disposition = b'attachment; filename="' + filename.encode('ascii') + b'"'
+    except UnicodeEncodeError:
+        disposition = b'attachment; filename="' + Header(filename, 'utf-8').encode().encode('ascii') + b'"'
+
+    headers = (
+        b'Content-Type: application/octet-stream' + CRLF
+        + b'MIME-Version: 1.0' + CRLF
+        + b'Content-Transfer-Encoding: base64' + CRLF
+        + b'Content-Disposition: ' + disposition + CRLF + CRLF
+    )
+    body = _base64_lines(content)
+    if len(body) > settings.CAMPAIGN_ATTACHMENT_SPOOL_THRESHOLD:
+        body = _spool(body)
+
+    return EncodedAttachment(
+        attachment_id=attachment.pk,
+        filename=filename,
+        size=len(content),
+        headers=headers,
+        body=body,
+    )
+
+
+_campaign_attachments = OrderedDict()
+_campaign_attachments_lock = threading.Lock()
+MAX_CACHED_CAMPAIGNS = 8
+
+
+def get_campaign_attachments(campaign) -> List[EncodedAttachment]:
+    """
+    Encoded attachments for a campaign, read from storage once per process.
+    The cache is rebuilt if attachments are added or removed.
+    """
+    attachments = list(campaign.attachments.order_by('id'))
+    signature = tuple((attachment.pk, attachment.file.name) for attachment in attachments)
+
+    with _campaign_attachments_lock:
+        cached = _campaign_attachments.get(campaign.pk)
+        if cached is not None and cached[0] == signature:
+            _campaign_attachments.move_to_end(campaign.pk)
+            return cached[1]
+
+    encoded = [encode_attachment(attachment) for attachment in attachments]
+    with _campaign_attachments_lock:
+        _campaign_attachments[campaign.pk] = (signature, encoded)
+        _campaign_attachments.move_to_end(campaign.pk)
+        while len(_campaign_attachments) > MAX_CACHED_CAMPAIGNS:
+            _campaign_attachments.popitem(last=False)
+    if encoded:
+        logger.info(f"Encoded {len(encoded)} attachments for campaign {campaign.pk}")
+    return encoded
+
+
+def evict_campaign_attachments(campaign_id: int):
+    """Drop a campaign's encoded attachments; spooled files go away with their last reference"""
+    with _campaign_attachments_lock:
+        _campaign_attachments.pop(campaign_id, None)
@@ -0,0 +1,62 @@
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from typing import Dict
+from urllib.parse import parse_qsl, quote, urlsplit
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode('utf-8'), hashlib.sha256).digest()
+
+
+def sign_request(method: str, url: str, body: bytes, access_key: str, secret_key: str,
+                 region: str, service: str, headers: Dict[str, str] = None,
+                 now: datetime = None) -> Dict[str, str]:
+    """
+    Sign an AWS API request with Signature Version 4.
+    Returns: The request headers plus Host, X-Amz-Date and Authorization
+    """
+    parsed = urlsplit(url)
+    now = now or datetime.now(timezone.utc)
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    date = now.strftime('%Y%m%d')
+
+    signed = {name.lower(): ' '.join(str(value).split()) for name, value in (headers or {}).items()}
+    signed['host'] = parsed.netloc
+    signed['x-amz-date'] = amz_date
+    signed_names = ';'.join(sorted(signed))
+
+    query = sorted(
+        (quote(name, safe='-_.~'), quote(value, safe='-_.~'))
+        for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+    )
+    canonical_request = '\n'.join([
+        method.upper(),
+        quote(parsed.path or '/', safe='/-_.~'),
+        '&'.join(f'{name}={value}' for name, value in query),
+        ''.join(f'{name}:{signed[name]}\n' for name in sorted(signed)),
+        signed_names,
+        hashlib.sha256(body or b'').hexdigest(),
+    ])
+
+    scope = f'{date}/{region}/{service}/aws4_request'
+    string_to_sign = '\n'.join([
+        'AWS4-HMAC-SHA256',
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode('utf-8')).hexdigest(),
+    ])
+
+    key = _hmac(f'AWS4{secret_key}'.encode('utf-8'), date)
+    for part in (region, service, 'aws4_request'):
+        key = _hmac(key, part)
+    signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+    result = dict(headers or {})
+    result['Host'] = parsed.netloc
+    result['X-Amz-Date'] = amz_date
+    result['Authorization'] = (
+        f'AWS4-HMAC-SHA256 Credential={access_key}/{scope}, '
+        f'SignedHeaders={signed_names}, Signature={signature}'
+    )
+    return result
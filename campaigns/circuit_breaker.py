@@ -0,0 +1,233 @@
+import logging
+import smtplib
+import socket
+import time
+from typing import Dict, Iterable, Tuple
+
+import requests
+from django.conf import settings
+
+from .rate_limit import get_script
+
+logger = logging.getLogger(__name__)
+
+# SMTP replies and API statuses that mean the provider itself refused us,
+# not the recipient: authentication failures
+PROVIDER_FAILURE_CODES = {530, 534, 535}
+PROVIDER_FAILURE_STATUS_CODES = {401, 403}
+
+# Errors raised before the provider could answer a send. aiosmtplib's
+# connection, disconnection and timeout errors are ConnectionError and
+# TimeoutError subclasses.
+CONNECTION_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    socket.gaierror,
+    smtplib.SMTPConnectError,
+    smtplib.SMTPServerDisconnected,
+    requests.ConnectionError,
+    requests.Timeout,
+)
+
+# KEYS[1] is the provider's circuit hash, ARGV is (probe timeout ms, claim).
+# Returns {allowed, milliseconds to wait}: allowed is 2 when the caller has
+# been given the half-open probe, which only happens with claim = 1.
+ALLOW_SCRIPT = """
+local circuit = redis.call('HMGET', KEYS[1], 'state', 'open_until', 'probe_until')
+if circuit[1] ~= 'open' and circuit[1] ~= 'half_open' then
+    return {1, 0}
+end
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local open_until = tonumber(circuit[2]) or 0
+if now < open_until then
+    return {0, open_until - now}
+end
+local probe_until = tonumber(circuit[3]) or 0
+if circuit[1] == 'half_open' and now < probe_until then
+    return {0, probe_until - now}
+end
+if ARGV[2] == '1' then
+    redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_until', now + tonumber(ARGV[1]))
+    return {2, 0}
+end
+return {1, 0}
+"""
+
+# KEYS[1] is the provider's circuit hash, ARGV is (successes, failures,
+# window ms, minimum requests, failure rate, cool-down ms, maximum cool-down
+# ms). Counts outcomes over a fixed window while closed and opens the circuit
+# once the failure rate is reached; a half-open probe closes it again or
+# reopens it with twice the cool-down. Returns {state, changed, cool-down ms}.
+RECORD_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local successes = tonumber(ARGV[1])
+local failures = tonumber(ARGV[2])
+local window_ms = tonumber(ARGV[3])
+local max_cooldown = tonumber(ARGV[7])
+local circuit = redis.call('HMGET', KEYS[1], 'state', 'window_start', 'requests', 'failures', 'cooldown')
+local state = circuit[1] or 'closed'
+
+if state == 'half_open' then
+    if successes > 0 then
+        redis.call('DEL', KEYS[1])
+        return {'closed', 1, 0}
+    end
+    if failures > 0 then
+        local cooldown = math.min((tonumber(circuit[5]) or tonumber(ARGV[6])) * 2, max_cooldown)
+        redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + cooldown, 'cooldown', cooldown)
+        redis.call('PEXPIRE', KEYS[1], max_cooldown * 2)
+        return {'open', 1, cooldown}
+    end
+    return {state, 0, 0}
+end
+if state == 'open' then
+    return {state, 0, 0}
+end
+
+local window_start = tonumber(circuit[2]) or 0
+local requests = tonumber(circuit[3]) or 0
+local failed = tonumber(circuit[4]) or 0
+if now - window_start >= window_ms then
+    window_start = now
+    requests = 0
+    failed = 0
+end
+requests = requests + successes + failures
+failed = failed + failures
+
+if requests >= tonumber(ARGV[4]) and failed >= requests * tonumber(ARGV[5]) then
+    local cooldown = tonumber(ARGV[6])
+    redis.call('DEL', KEYS[1])
+    redis.call('HSET', KEYS[1], 'state', 'open', 'open_until', now + cooldown, 'cooldown', cooldown)
+    redis.call('PEXPIRE', KEYS[1], max_cooldown * 2)
+    return {'open', 1, cooldown}
+end
+redis.call('HSET', KEYS[1], 'window_start', window_start, 'requests', requests, 'failures', failed)
+redis.call('PEXPIRE', KEYS[1], window_ms * 2)
+return {'closed', 0, 0}
+"""
+
+
+def is_connection_error(error: Exception) -> bool:
+    """Whether a send failed on the connection (refused, dropped or timed out) rather than being answered"""
+    return isinstance(error, CONNECTION_ERRORS)
+
+
+def is_provider_failure(result: dict) -> bool:
+    """
+    Whether a failed send points at the provider rather than the recipient:
+    connection errors and timeouts (flagged ``connection_error`` by the
+    senders), API 5xx responses and authentication failures. Rejections of
+    one recipient and errors rendering one message are not.
+    """
+    if result.get('success'):
+        return False
+    if result.get('connection_error'):
+        return True
+    status_code = result.get('status_code')
+    if status_code is not None:
+        return status_code >= 500 or status_code in PROVIDER_FAILURE_STATUS_CODES
+    return result.get('smtp_code') in PROVIDER_FAILURE_CODES
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker for one SMTPProvider, shared by
+    every worker through Redis. Fails open (closed) when Redis is unavailable.
+    """
+
+    KEY_PREFIX = 'smtp_circuit'
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.key = f'{self.KEY_PREFIX}:{{{provider.pk}}}'
+        self.probing = False
+
+    def allow(self) -> Tuple[bool, float]:
+        """
+        Whether a send may go through the provider now, claiming the
+        half-open probe if the cool-down is over.
+        Returns: (allowed, seconds to wait when not allowed)
+        """
+        return self._check(claim=True)
+
+    def available(self) -> bool:
+        """Whether the provider can be picked, without claiming the probe"""
+        return self._check(claim=False)[0]
+
+    def _check(self, claim: bool) -> Tuple[bool, float]:
+        # The probe is held until its outcome is recorded
+        if claim and self.probing:
+            return True, 0.0
+        wait = _open_until.get(self.provider.pk, 0) - time.monotonic()
+        if wait > 0:
+            return False, wait
+
+        try:
+            allowed, wait_ms = get_script(ALLOW_SCRIPT)(
+                keys=[self.key],
+                args=[int(settings.CAMPAIGN_CIRCUIT_PROBE_TIMEOUT * 1000), int(claim)],
+            )
+        except Exception as e:
+            logger.warning(f"Circuit breaker unavailable for provider {self.provider.name}, allowing send: {str(e)}")
+            return True, 0.0
+
+        if int(allowed) == 2:
+            self.probing = True
+            logger.info(f"Probing provider {self.provider.name} after its cool-down")
+        elif not int(allowed):
+            wait = int(wait_ms) / 1000
+            _open_until[self.provider.pk] = time.monotonic() + wait
+            return False, wait
+        return True, 0.0
+
+    def record(self, successes: int = 0, failures: int = 0) -> str:
+        """
+        Count send outcomes against the provider.
+        Returns: The circuit state afterwards: 'closed', 'open' or 'half_open'
+        """
+        if not successes and not failures:
+            return 'closed'
+        self.probing = False
+        try:
+            state, changed, cooldown_ms = get_script(RECORD_SCRIPT)(
+                keys=[self.key],
+                args=[
+                    successes,
+                    failures,
+                    int(settings.CAMPAIGN_CIRCUIT_WINDOW * 1000),
+                    settings.CAMPAIGN_CIRCUIT_MIN_REQUESTS,
+                    settings.CAMPAIGN_CIRCUIT_FAILURE_RATE,
+                    int(settings.CAMPAIGN_CIRCUIT_COOLDOWN * 1000),
+                    int(settings.CAMPAIGN_CIRCUIT_COOLDOWN_MAX * 1000),
+                ],
+            )
+        except Exception as e:
+            logger.warning(f"Could not record outcomes for provider {self.provider.name}: {str(e)}")
+            return 'closed'
+
+        state = state.decode() if isinstance(state, bytes) else state
+        if state == 'open':
+            if int(changed):
+                cooldown = int(cooldown_ms) / 1000
+                logger.warning(f"Circuit opened for provider {self.provider.name}, skipping it for {cooldown:.0f}s")
+                _open_until[self.provider.pk] = time.monotonic() + cooldown
+        elif int(changed):
+            logger.info(f"Provider {self.provider.name} recovered, circuit closed")
+            _open_until.pop(self.provider.pk, None)
+        return state
+
+    def record_results(self, results: Iterable[dict]) -> str:
+        """Count a block of send results; recipient-level rejections count as successes"""
+        failures = 0
+        total = 0
+        for result in results:
+            total += 1
+            failures += is_provider_failure(result)
+        return self.record(total - failures, failures)
+
+
+# Provider id -> monotonic time until which its circuit is known to be open
+_open_until: Dict[int, float] = {}
@@ -0,0 +1,242 @@
+import logging
+from collections import Counter, OrderedDict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from .rate_limit import TokenBucket, get_redis, get_script
+
+logger = logging.getLogger(__name__)
+
+# SMTP replies with which a receiving domain asks us to slow down and try later
+DEFERRAL_CODES = {421, 451}
+
+# Concurrency slots. KEYS[1] counts the messages in flight for a domain,
+# ARGV is (slots wanted, limit, expiry seconds). Returns the slots taken.
+# The expiry returns slots held by a worker that died mid-block.
+ACQUIRE_SLOTS_SCRIPT = """
+local inflight = tonumber(redis.call('GET', KEYS[1]) or '0')
+local granted = math.min(tonumber(ARGV[1]), tonumber(ARGV[2]) - inflight)
+if granted > 0 then
+    redis.call('INCRBY', KEYS[1], granted)
+else
+    granted = 0
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[3]))
+return granted
+"""
+
+RELEASE_SLOTS_SCRIPT = """
+if tonumber(redis.call('DECRBY', KEYS[1], tonumber(ARGV[1]))) <= 0 then
+    redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# How long a worker waits before asking again for a domain's busy slots
+SLOT_POLL_INTERVAL = 0.5
+SLOT_EXPIRY = 300
+
+
+def recipient_domain(email: str) -> str:
+    return email.rpartition('@')[2].lower()
+
+
+def smtp_reply_code(error: Exception) -> Optional[int]:
+    """The SMTP reply code behind a smtplib or aiosmtplib send failure, if there is one"""
+    code = getattr(error, 'smtp_code', None)
+    if code is None:
+        code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+
+    # Refused recipients carry one reply per address
+    recipients = getattr(error, 'recipients', None)
+    if isinstance(recipients, dict):
+        codes = [reply[0] for reply in recipients.values()]
+    else:
+        codes = [getattr(recipient, 'code', None) for recipient in recipients or []]
+    codes = [code for code in codes if isinstance(code, int)]
+    return codes[0] if codes else None
+
+
+def is_deferral(result: dict) -> bool:
+    """Whether a failed send result is a temporary, domain-level deferral"""
+    return not result.get('success') and result.get('smtp_code') in DEFERRAL_CODES
+
+
+class DomainThrottle:
+    """
+    Per-minute, concurrency and deferral backoff limits for one recipient
+    domain, shared by every worker through Redis
+    """
+
+    KEY_PREFIX = 'domain_rate'
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        limits = settings.CAMPAIGN_DOMAIN_THROTTLES.get(domain, {})
+        self.per_minute = limits.get('per_minute', settings.CAMPAIGN_DOMAIN_PER_MINUTE)
+        self.concurrency = limits.get('concurrency', settings.CAMPAIGN_DOMAIN_CONCURRENCY)
+        self.bucket = TokenBucket(f'{self.KEY_PREFIX}:{{{domain}}}', [(self.per_minute, 60)], label=f'domain {domain}')
+        self.slots_key = f'domain_inflight:{{{domain}}}'
+
+    @property
+    def is_limited(self) -> bool:
+        return bool(self.bucket.windows) or self.concurrency > 0
+
+    def acquire(self, count: int) -> Tuple[int, float]:
+        """
+        Take up to ``count`` concurrency slots and per-minute tokens.
+        Returns: (sends allowed, seconds to wait when none were allowed)
+        """
+        granted = count
+        if self.concurrency > 0:
+            granted = self._run(ACQUIRE_SLOTS_SCRIPT, [count, self.concurrency, SLOT_EXPIRY], count)
+            if not granted:
+                return 0, SLOT_POLL_INTERVAL
+
+        allowed, wait = self.bucket.reserve(granted)
+        if allowed < granted:
+            self.release(granted - allowed)
+        return allowed, wait
+
+    def release(self, count: int):
+        """Give back concurrency slots once their messages are done"""
+        if self.concurrency > 0 and count > 0:
+            self._run(RELEASE_SLOTS_SCRIPT, [count], 0)
+
+    def defer(self) -> float:
+        """
+        Pause the domain after a deferral.
+        Returns: Seconds the domain is paused for
+        """
+        try:
+            client = get_redis()
+            streak = client.incr(_streak_key(self.domain))
+            backoff = min(settings.CAMPAIGN_DOMAIN_BACKOFF * 2 ** (streak - 1), settings.CAMPAIGN_DOMAIN_BACKOFF_MAX)
+            client.expire(_streak_key(self.domain), int(settings.CAMPAIGN_DOMAIN_BACKOFF_MAX * 2))
+            client.set(_backoff_key(self.domain), streak, px=int(backoff * 1000))
+        except Exception as e:
+            logger.warning(f"Could not record deferral for domain {self.domain}: {str(e)}")
+            return 0.0
+        logger.info(f"Domain {self.domain} deferred our mail, pausing it for {backoff:.0f}s")
+        return backoff
+
+    def recovered(self):
+        """Reset the backoff after the domain accepts mail again"""
+        try:
+            get_redis().delete(_streak_key(self.domain))
+        except Exception as e:
+            logger.warning(f"Could not reset deferral backoff for domain {self.domain}: {str(e)}")
+
+    def _run(self, source: str, args: list, default: int) -> int:
+        try:
+            return int(get_script(source)(keys=[self.slots_key], args=args))
+        except Exception as e:
+            logger.warning(f"Domain throttle unavailable for {self.domain}, allowing send: {str(e)}")
+            return default
+
+
+def _backoff_key(domain: str) -> str:
+    return f'domain_backoff:{{{domain}}}'
+
+
+def _streak_key(domain: str) -> str:
+    return f'domain_backoff_streak:{{{domain}}}'
+
+
+def deferred_domains(domains: List[str]) -> Dict[str, float]:
+    """
+    Domains currently paused after a deferral, in one pipelined round-trip.
+    Returns: Dict of domain to seconds until it may be tried again
+    """
+    if not domains:
+        return {}
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for domain in domains:
+            pipe.pttl(_backoff_key(domain))
+        remaining = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not read domain backoffs: {str(e)}")
+        return {}
+    return {domain: ttl / 1000 for domain, ttl in zip(domains, remaining) if ttl and ttl > 0}
+
+
+class DomainBatcher:
+    """
+    A chunk's recipients grouped by domain, handed out in blocks that skip
+    domains which are paused or at their limits
+    """
+
+    def __init__(self, recipients: Iterable):
+        self.queues: Dict[str, deque] = OrderedDict()
+        for recipient in recipients:
+            self.queues.setdefault(recipient_domain(recipient.email), deque()).append(recipient)
+        self._throttles: Dict[str, DomainThrottle] = {}
+        self._deferred = set()
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def throttle(self, domain: str) -> DomainThrottle:
+        if domain not in self._throttles:
+            self._throttles[domain] = DomainThrottle(domain)
+        return self._throttles[domain]
+
+    def next_block(self, size: int) -> Tuple[list, float]:
+        """
+        Up to ``size`` recipients the domain limits allow right now.
+        Returns: (block, seconds until a domain may be tried again when the block is empty)
+        """
+        block = []
+        waits = []
+        paused = deferred_domains(list(self.queues))
+
+        for domain in list(self.queues):
+            if len(block) >= size:
+                break
+            if domain in paused:
+                waits.append(paused[domain])
+                continue
+            queue = self.queues[domain]
+            wanted = min(len(queue), size - len(block))
+            throttle = self.throttle(domain)
+            if throttle.is_limited:
+                wanted, wait = throttle.acquire(wanted)
+                if not wanted:
+                    waits.append(wait)
+                    continue
+            block.extend(queue.popleft() for _ in range(wanted))
+
+        # Drop finished domains and rotate so the next block starts elsewhere
+        for domain in [domain for domain, queue in self.queues.items() if not queue]:
+            del self.queues[domain]
+        if self.queues:
+            self.queues.move_to_end(next(iter(self.queues)))
+
+        return block, (min(waits) if not block and waits else 0.0)
+
+    def release(self, block: list):
+        """Return the concurrency slots held by a sent block"""
+        for domain, count in Counter(recipient_domain(recipient.email) for recipient in block).items():
+            self.throttle(domain).release(count)
+
+    def requeue(self, recipients: list):
+        """Give back the slots of recipients taken but not sent, and queue them again"""
+        self.release(recipients)
+        for recipient in reversed(recipients):
+            self.queues.setdefault(recipient_domain(recipient.email), deque()).appendleft(recipient)
+
+    def defer(self, recipients: list):
+        """Back off the domains that deferred ``recipients``; the retry queue takes care of the recipients"""
+        for domain in {recipient_domain(recipient.email) for recipient in recipients}:
+            self.throttle(domain).defer()
+            self._deferred.add(domain)
+
+    def delivered(self, recipients: list):
+        """Reset the backoff of previously deferred domains that accepted mail"""
+        for domain in {recipient_domain(recipient.email) for recipient in recipients} & self._deferred:
+            self.throttle(domain).recovered()
+            self._deferred.discard(domain)
@@ -19,7 +19,7 @@ class CampaignForm(forms.ModelForm):
 
         model = Campaign
 
-        fields = ['name', 'subject', 'from_name', 'from_email', 'reply_to_email', 'cc_recipients', 'bcc_recipients', 'template', 'html_content', 'text_content', 'subscriber_segments', 'smtp_provider']
+        fields = ['name', 'subject', 'from_name', 'from_email', 'reply_to_email', 'cc_recipients', 'bcc_recipients', 'template', 'html_content', 'text_content', 'subscriber_segments', 'smtp_provider', 'send_mode', 'allowed_providers', 'scheduled_at', 'send_window_hours']
 
     def __init__(self, *args, **kwargs):
 
@@ -46,6 +46,17 @@ class CampaignForm(forms.ModelForm):
         self.fields['smtp_provider'].queryset = SMTPProvider.objects.filter(is_active=True)
         self.fields['smtp_provider'].widget.attrs.update({'class': 'form-control'})
         self.fields['smtp_provider'].empty_label = 'Use default if available'
+
+        # Providers a multi-provider send may spread the campaign over
+        self.fields['send_mode'].widget.attrs.update({'class': 'form-select'})
+        self.fields['allowed_providers'].widget = forms.CheckboxSelectMultiple()
+        self.fields['allowed_providers'].queryset = SMTPProvider.objects.filter(is_active=True)
+
+        # Optional start time and send window
+        self.fields['scheduled_at'].widget = forms.DateTimeInput(
+            attrs={'class': 'form-control', 'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'
+        )
+        self.fields['send_window_hours'].widget.attrs.update({'class': 'form-control', 'min': 0})
         
         # Add placeholders and help text
         self.fields['name'].widget.attrs.update({'class': 'form-control', 'placeholder': 'Enter campaign name'})
@@ -105,6 +116,7 @@ class SMTPProviderForm(forms.ModelForm):
             'host', 'port', 'use_tls', 'use_ssl', 'skip_tls_verify',
             'username', 'password', 'api_key', 'api_secret',
             'emails_per_day', 'emails_per_hour', 'emails_per_second',
+            'max_connections', 'max_messages_per_connection', 'max_connection_age',
             'from_email', 'from_name', 'reply_to_email',
         ]
         widgets = {
@@ -122,6 +134,9 @@ class SMTPProviderForm(forms.ModelForm):
             'emails_per_day': forms.NumberInput(attrs={'class': 'form-control'}),
             'emails_per_hour': forms.NumberInput(attrs={'class': 'form-control'}),
             'emails_per_second': forms.NumberInput(attrs={'class': 'form-control'}),
+            'max_connections': forms.NumberInput(attrs={'class': 'form-control'}),
+            'max_messages_per_connection': forms.NumberInput(attrs={'class': 'form-control'}),
+            'max_connection_age': forms.NumberInput(attrs={'class': 'form-control'}),
             'from_email': forms.EmailInput(attrs={'class': 'form-control'}),
             'from_name': forms.TextInput(attrs={'class': 'form-control'}),
             'reply_to_email': forms.EmailInput(attrs={'class': 'form-control'}),
@@ -0,0 +1,106 @@
+import atexit
+import logging
+import os
+import threading
+from typing import Dict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Responses retried when they carry a Retry-After header: the provider
+# turned the request away without acting on it
+RETRY_STATUSES = frozenset({429, 503})
+
+
+class SendRetry(Retry):
+    """
+    Retry policy that is safe for non-idempotent sends: connection errors,
+    where nothing reached the provider, and 429/503 replies with a
+    Retry-After header. A read timeout or another 5xx may come after the
+    provider accepted a whole batch, so those are left to the task-level
+    retry queue instead of being re-sent here.
+    """
+
+    RETRY_AFTER_STATUS_CODES = RETRY_STATUSES
+
+
+class ProviderSession(requests.Session):
+    """
+    Keep-alive HTTP session for one API provider.
+
+    Requests go through a connection pool of CAMPAIGN_API_POOL_SIZE sockets,
+    get the CAMPAIGN_API_CONNECT_TIMEOUT / CAMPAIGN_API_READ_TIMEOUT timeouts
+    unless the caller passes its own, and are retried with exponential
+    backoff by SendRetry.
+    """
+
+    def __init__(self, provider):
+        super().__init__()
+        self.fingerprint = make_fingerprint(provider)
+        self.timeout = (settings.CAMPAIGN_API_CONNECT_TIMEOUT, settings.CAMPAIGN_API_READ_TIMEOUT)
+
+        retry = SendRetry(
+            total=settings.CAMPAIGN_API_MAX_RETRIES,
+            read=0,
+            other=0,
+            backoff_factor=settings.CAMPAIGN_API_RETRY_BACKOFF,
+            allowed_methods=None,  # sends are POSTs
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        pool_size = max(1, settings.CAMPAIGN_API_POOL_SIZE)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def make_fingerprint(provider) -> tuple:
+    """Settings which, when changed, require a new session"""
+    return (provider.provider_type, provider.api_key, provider.api_secret, provider.host)
+
+
+_sessions: Dict[int, ProviderSession] = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(provider) -> ProviderSession:
+    """Return the process-wide HTTP session for a provider, rebuilding it if the provider settings changed"""
+    fingerprint = make_fingerprint(provider)
+    with _sessions_lock:
+        session = _sessions.get(provider.pk)
+        if session is not None and session.fingerprint == fingerprint:
+            return session
+        stale = session
+        session = _sessions[provider.pk] = ProviderSession(provider)
+    if stale is not None:
+        logger.info(f'API settings changed for provider {provider.name}, closing old HTTP session')
+        stale.close()
+    return session
+
+
+def close_all_sessions():
+    """Close every pooled HTTP connection in this process"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def _forget_sessions_after_fork():
+    # Sockets inherited from the parent must not be shared with it
+    global _sessions_lock
+    _sessions.clear()
+    _sessions_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_sessions_after_fork)
+atexit.register(close_all_sessions)
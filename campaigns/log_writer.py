@@ -0,0 +1,268 @@
+import abc
+import atexit
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+from typing import Iterable
+
+from celery.signals import worker_process_shutdown, worker_shutdown
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter(abc.ABC):
+    """
+    Base for per-process write-behind buffers, flushed when full, from a
+    background thread and on shutdown
+    """
+
+    name = 'buffered-writer'
+
+    def __init__(self):
+        self._reset()
+        _writers.append(self)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._flusher = None
+        self._stop = threading.Event()
+        self._clear()
+
+    @abc.abstractmethod
+    def _clear(self):
+        """Empty the buffer"""
+
+    @abc.abstractmethod
+    def _pending(self) -> int:
+        """Number of buffered items; called with the lock held"""
+
+    @abc.abstractmethod
+    def _take(self):
+        """Swap out and return the buffered data; called with the lock held"""
+
+    @abc.abstractmethod
+    def _write(self, data) -> int:
+        """Write data returned by _take(). Returns: Number of items written"""
+
+    @abc.abstractmethod
+    def _restore(self, data):
+        """Put data that could not be written back in the buffer; called without the lock"""
+
+    def _buffered(self):
+        """Call after adding to the buffer, outside the lock"""
+        self._ensure_flusher()
+        with self._lock:
+            full = self._pending() >= settings.CAMPAIGN_LOG_FLUSH_SIZE
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write everything buffered. Returns: Number of items written"""
+        with self._lock:
+            if not self._pending():
+                return 0
+            data = self._take()
+        try:
+            return self._write(data)
+        except Exception as e:
+            # _write() writes everything or raises having written nothing
+            logger.error(f"{self.name} flush failed, keeping the data for the next flush: {str(e)}")
+            self._restore(data)
+            return 0
+
+    def _ensure_flusher(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._flusher = threading.Thread(target=self._run_flusher, name=self.name, daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        interval = settings.CAMPAIGN_LOG_FLUSH_INTERVAL
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+        connection.close()
+
+    def close(self):
+        """Stop the background flusher and write whatever is still buffered"""
+        self._stop.set()
+        self.flush()
+
+
+class EmailLogWriter(BufferedWriter):
+    """
+    Write-behind buffer of new and updated EmailLog rows, written with one
+    bulk_create / bulk_update per flush
+    """
+
+    name = 'email-log-flusher'
+
+    def _clear(self):
+        self._creates = []
+        self._updates = defaultdict(dict)  # field names -> {pk: log}
+
+    def add(self, log):
+        """Buffer an unsaved EmailLog for insertion"""
+        with self._lock:
+            self._creates.append(log)
+        self._buffered()
+
+    def add_many(self, logs: Iterable):
+        with self._lock:
+            self._creates.extend(logs)
+        self._buffered()
+
+    def update(self, log, fields: Iterable[str]):
+        """Buffer a change to ``fields`` of a saved EmailLog"""
+        with self._lock:
+            self._updates[tuple(sorted(fields))][log.pk] = log
+        self._buffered()
+
+    def _pending(self) -> int:
+        return len(self._creates) + sum(len(logs) for logs in self._updates.values())
+
+    def _take(self):
+        data = (self._creates, self._updates)
+        self._clear()
+        return data
+
+    def _write(self, data) -> int:
+        from .models import EmailLog
+
+        creates, updates = data
+        batch_size = settings.CAMPAIGN_LOG_FLUSH_SIZE
+        try:
+            with transaction.atomic():
+                if creates:
+                    EmailLog.objects.bulk_create(creates, batch_size=batch_size)
+                for fields, logs in updates.items():
+                    EmailLog.objects.bulk_update(list(logs.values()), list(fields), batch_size=batch_size)
+        except Exception as e:
+            logger.warning(
+                f"Bulk flush of {len(creates)} new and {sum(map(len, updates.values()))} updated email logs "
+                f"failed, writing them one by one: {str(e)}"
+            )
+            return self._write_rows(creates, updates)
+        return len(creates) + sum(map(len, updates.values()))
+
+    def _write_rows(self, creates: list, updates: dict) -> int:
+        """Fallback for a failed bulk write. Returns: Number of rows written"""
+        rows = [(log, None) for log in creates]
+        rows += [(log, fields) for fields, logs in updates.items() for log in logs.values()]
+        written = 0
+        for index, (log, fields) in enumerate(rows):
+            try:
+                if fields is None:
+                    # The rolled back bulk_create may have assigned a pk
+                    log.pk = None
+                    log.save(force_insert=True)
+                else:
+                    log.save(update_fields=list(fields))
+                written += 1
+            except (IntegrityError, DataError) as e:
+                logger.error(f"Dropping email log for {log.subscriber_email}: {str(e)}")
+            except Exception as e:
+                logger.error(f"Email log flush failed, keeping {len(rows) - index} rows for the next flush: {str(e)}")
+                self._restore(self._group(rows[index:]))
+                break
+        return written
+
+    @staticmethod
+    def _group(rows: list):
+        creates, updates = [], defaultdict(dict)
+        for log, fields in rows:
+            if fields is None:
+                creates.append(log)
+            else:
+                updates[fields][log.pk] = log
+        return creates, updates
+
+    def _restore(self, data):
+        creates, updates = data
+        with self._lock:
+            self._creates[:0] = creates
+            for fields, logs in updates.items():
+                # Updates buffered since keep precedence
+                self._updates[fields] = {**logs, **self._updates[fields]}
+
+
+class StatCounterWriter(BufferedWriter):
+    """
+    Coalesces counter increments (total_sent, total_bounced, ...) of Campaign
+    and SMTPProvider rows into one F() UPDATE per row and flush
+    """
+
+    name = 'stat-counter-flusher'
+
+    def _clear(self):
+        self._deltas = defaultdict(Counter)  # (model, pk) -> {field: delta}
+        self._increments = 0
+
+    def increment(self, model, pk: int, **deltas: int):
+        """Add to counter fields of one row, e.g. increment(Campaign, 1, total_sent=1)"""
+        if pk is None:
+            return
+        with self._lock:
+            self._deltas[(model, pk)].update(deltas)
+            self._increments += 1
+        self._buffered()
+
+    def _pending(self) -> int:
+        return self._increments
+
+    def _take(self):
+        data = self._deltas
+        self._clear()
+        return data
+
+    def _write(self, data) -> int:
+        with transaction.atomic():
+            for (model, pk), deltas in data.items():
+                changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+                if changes:
+                    model.objects.filter(pk=pk).update(**changes)
+        return len(data)
+
+    def _restore(self, data):
+        with self._lock:
+            for row, deltas in data.items():
+                self._deltas[row].update(deltas)
+            self._increments += len(data)
+
+
+_writers = []
+
+email_log_writer = EmailLogWriter()
+stat_counters = StatCounterWriter()
+
+
+def _reset_writers_after_fork():
+    # Data buffered by the parent is the parent's to write
+    for writer in _writers:
+        writer._reset()
+
+
+def flush_email_logs(**kwargs):
+    """Write every buffered log row and counter delta in this process"""
+    for writer in _writers:
+        writer.close()
+
+
+os.register_at_fork(after_in_child=_reset_writers_after_fork)
+atexit.register(flush_email_logs)
+# Prefork children may exit without running atexit handlers
+worker_process_shutdown.connect(flush_email_logs, weak=False)
+worker_shutdown.connect(flush_email_logs, weak=False)
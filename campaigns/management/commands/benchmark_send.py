@@ -0,0 +1,264 @@
+import json
+import smtplib
+import statistics
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import aiosmtplib
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+from campaigns.log_writer import email_log_writer, stat_counters
+from campaigns.models import Campaign, EmailLog, SMTPProvider
+from campaigns.smtp_service import SMTPService
+from campaigns.smtp_sink import SMTPSink
+from campaigns.tasks import dispatch_campaign_send
+from mail.celery import app as celery_app
+from subscribers.models import Segment, Subscriber
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures send throughput end to end against a local SMTP sink: seeds subscribers, sends them a '
+        'campaign and reports messages/sec, per-message latency, DB queries per message and peak RSS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=1000, help='Subscribers to seed and send to.')
+        parser.add_argument('--domains', type=int, default=10, help='Recipient domains the subscribers are spread over.')
+        parser.add_argument(
+            '--scenario', choices=['service', 'tasks', 'view'], default='tasks',
+            help="What to drive: 'service' calls SMTPService.send_email per subscriber, 'tasks' runs the "
+                 "campaign's Celery pipeline in this process and 'view' posts to campaign_send.",
+        )
+        parser.add_argument('--engine', choices=['sync', 'async'], help='Delivery engine for campaign chunks (defaults to CAMPAIGN_DELIVERY_ENGINE).')
+        parser.add_argument('--max-connections', type=int, default=10, help='SMTP sessions the benchmark provider may open.')
+        parser.add_argument('--sink-host', default='127.0.0.1', help='Host of an already running smtp_sink.')
+        parser.add_argument('--sink-port', type=int, help='Port of an already running smtp_sink; one is started in this process if omitted.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds the in-process sink holds each message.')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency of the in-process sink.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of recipients the in-process sink refuses with a 550.')
+        parser.add_argument('--defer-rate', type=float, default=0.0, help='Share of recipients the in-process sink defers with a 451.')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded subscribers, campaign and provider.')
+        parser.add_argument('--json', action='store_true', help='Output the results in JSON format.')
+
+    def handle(self, *args, **options):
+        if options['subscribers'] < 1 or options['domains'] < 1:
+            raise CommandError('--subscribers and --domains must be at least 1.')
+
+        sink = None
+        if options['sink_port']:
+            host, port = options['sink_host'], options['sink_port']
+        else:
+            sink = SMTPSink(
+                port=0, latency=options['latency'], jitter=options['jitter'],
+                error_rate=options['error_rate'], defer_rate=options['defer_rate'],
+            )
+            host, port = sink.start()
+
+        tag = uuid.uuid4().hex[:8]
+        provider, segment, campaign, user = self._seed(tag, host, port, options)
+        measurement = _Measurement()
+        try:
+            if not options['json']:
+                self.stdout.write(
+                    f'Sending to {options["subscribers"]} subscribers through {host}:{port} '
+                    f'({options["scenario"]} scenario)...'
+                )
+            with measurement.measure():
+                self._run(options['scenario'], options['engine'], provider, segment, campaign, user)
+        finally:
+            if not options['keep']:
+                self._clean_up(provider, segment, campaign, user)
+            if sink is not None:
+                sink.stop()
+
+        results = measurement.results(options['subscribers'])
+        results['scenario'] = options['scenario']
+        if sink is not None:
+            results['sink'] = dict(sink.stats)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{results["delivered"]} of {results["messages"]} messages delivered in {results["elapsed"]:.2f}s: '
+            f'{results["messages_per_second"]:.1f} messages/sec'
+        ))
+        self.stdout.write(f'  Per-message latency: p50 {results["latency_p50_ms"]:.2f} ms, p99 {results["latency_p99_ms"]:.2f} ms')
+        self.stdout.write(f'  DB queries: {results["queries"]} ({results["queries_per_message"]:.2f} per message)')
+        if results['peak_rss_mb'] is not None:
+            self.stdout.write(f'  Peak RSS: {results["peak_rss_mb"]:.1f} MB')
+        if sink is not None:
+            self.stdout.write(
+                f'  Sink: {sink.stats["accepted"]} accepted, {sink.stats["refused"]} refused, '
+                f'{sink.stats["deferred"]} deferred over {sink.stats["connections"]} connections'
+            )
+
+    def _seed(self, tag: str, host: str, port: int, options: dict):
+        """Create the benchmark provider, subscribers, segment, campaign and user"""
+        provider = SMTPProvider.objects.create(
+            name=f'Benchmark sink {tag}', provider_type='custom', host=host, port=port,
+            use_tls=False, use_ssl=False, from_email='benchmark@example.com',
+            emails_per_second=0, emails_per_hour=0, emails_per_day=0,
+            max_connections=options['max_connections'], is_active=True,
+        )
+
+        subscribers = Subscriber.objects.bulk_create(
+            [
+                Subscriber(email=f'bench-{tag}-{i}@bench{i % options["domains"]}.example', name=f'Subscriber {i}')
+                for i in range(options['subscribers'])
+            ],
+            batch_size=1000,
+        )
+        segment = Segment.objects.create(name=f'Benchmark {tag}')
+        Segment.subscribers.through.objects.bulk_create(
+            [Segment.subscribers.through(segment_id=segment.pk, subscriber_id=subscriber.pk) for subscriber in subscribers],
+            batch_size=1000,
+        )
+
+        user = get_user_model().objects.create_user(username=f'benchmark-{tag}')
+        campaign = Campaign.objects.create(
+            name=f'Benchmark {tag}', subject='Benchmark for {subscriber.name}',
+            from_email='benchmark@example.com', from_name='Benchmark',
+            html_content='<p>Hello {subscriber.name|there},</p><p>This message was sent by benchmark_send.</p>',
+            smtp_provider=provider, created_by=user,
+        )
+        campaign.subscriber_segments.add(segment)
+        return provider, segment, campaign, user
+
+    def _run(self, scenario: str, engine: str, provider, segment, campaign, user):
+        if scenario == 'service':
+            service = SMTPService(provider)
+            for subscriber in segment.subscribers.all():
+                service.send_email(
+                    to_email=subscriber.email, subject=campaign.subject, html_content=campaign.html_content,
+                    from_email=campaign.from_email, from_name=campaign.from_name,
+                )
+            return
+
+        # Run the campaign's Celery tasks in this process so they are measured
+        always_eager = celery_app.conf.task_always_eager
+        celery_app.conf.task_always_eager = True
+        try:
+            with override_settings(CAMPAIGN_DELIVERY_ENGINE=engine or settings.CAMPAIGN_DELIVERY_ENGINE):
+                if scenario == 'tasks':
+                    campaign.status = 'sending'
+                    campaign.save(update_fields=['status'])
+                    dispatch_campaign_send(campaign)
+                else:
+                    client = Client()
+                    client.force_login(user)
+                    response = client.post(reverse('campaigns:campaign_send', args=[campaign.pk]))
+                    if response.status_code != 302:
+                        raise CommandError(f'campaign_send answered {response.status_code}')
+        finally:
+            celery_app.conf.task_always_eager = always_eager
+
+    def _clean_up(self, provider, segment, campaign, user):
+        EmailLog.objects.filter(campaign=campaign).delete()
+        campaign.delete()
+        Subscriber.objects.filter(segments=segment).delete()
+        segment.delete()
+        EmailLog.objects.filter(smtp_provider=provider).delete()
+        provider.delete()
+        user.delete()
+
+
+class _Measurement:
+    """Wall time, SMTP transaction latencies and DB queries of one benchmark run"""
+
+    def __init__(self):
+        self.latencies = []
+        self.delivered = 0
+        self.queries = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def _count_query(self, execute, sql, params, many, context):
+        with self._lock:
+            self.queries += 1
+        return execute(sql, params, many, context)
+
+    def _install(self, sender, connection, **kwargs):
+        # Connections opened by other threads, like the EmailLog flusher
+        connection.execute_wrappers.append(self._count_query)
+
+    def _record(self, started: float, succeeded: bool):
+        with self._lock:
+            self.latencies.append(time.perf_counter() - started)
+            self.delivered += succeeded
+
+    @contextmanager
+    def measure(self):
+        measurement = self
+        sync_sendmail = smtplib.SMTP.sendmail
+        async_sendmail = aiosmtplib.SMTP.sendmail
+
+        def timed_sendmail(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = sync_sendmail(self, *args, **kwargs)
+            except Exception:
+                measurement._record(started, False)
+                raise
+            measurement._record(started, True)
+            return result
+
+        async def timed_async_sendmail(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await async_sendmail(self, *args, **kwargs)
+            except Exception:
+                measurement._record(started, False)
+                raise
+            measurement._record(started, True)
+            return result
+
+        smtplib.SMTP.sendmail = timed_sendmail
+        aiosmtplib.SMTP.sendmail = timed_async_sendmail
+        connection.execute_wrappers.append(self._count_query)
+        connection_created.connect(self._install)
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            # Buffered EmailLog rows belong to the run; flush() keeps the flushers running
+            email_log_writer.flush()
+            stat_counters.flush()
+            self.elapsed = time.perf_counter() - started
+            connection_created.disconnect(self._install)
+            connection.execute_wrappers.remove(self._count_query)
+            smtplib.SMTP.sendmail = sync_sendmail
+            aiosmtplib.SMTP.sendmail = async_sendmail
+
+    def results(self, messages: int) -> dict:
+        latencies = sorted(self.latencies) or [0.0]
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+        peak_rss_mb = None
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux
+            peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {
+            'messages': messages,
+            'delivered': self.delivered,
+            'elapsed': self.elapsed,
+            'messages_per_second': self.delivered / self.elapsed if self.elapsed else 0.0,
+            'latency_p50_ms': percentiles[49] * 1000,
+            'latency_p99_ms': percentiles[98] * 1000,
+            'queries': self.queries,
+            'queries_per_message': self.queries / messages,
+            'peak_rss_mb': peak_rss_mb,
+        }
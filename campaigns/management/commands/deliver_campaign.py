@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from campaigns.models import Campaign, CampaignRecipient
+from campaigns.tasks import send_campaign_chunk, finalize_campaign_send
+
+
+class Command(BaseCommand):
+    help = 'Delivers the pending recipients of a campaign in this process, using the asyncio delivery engine by default.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id', type=int, help='The ID of the campaign to deliver.')
+        parser.add_argument('--engine', choices=['async', 'sync'], default='async', help='Delivery engine to use.')
+        parser.add_argument('--concurrency', type=int, help='Concurrent SMTP sessions (defaults to the provider\'s max connections).')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Recipients loaded per chunk.')
+
+    def handle(self, *args, **options):
+        campaign_id = options['campaign_id']
+        try:
+            campaign = Campaign.objects.select_related('smtp_provider').get(pk=campaign_id)
+        except Campaign.DoesNotExist:
+            raise CommandError(f'Campaign with ID "{campaign_id}" does not exist.')
+
+        if campaign.send_mode != 'multi' and not campaign.smtp_provider:
+            raise CommandError(f'Campaign "{campaign.name}" has no SMTP provider selected.')
+
+        if campaign.status == 'draft':
+            campaign.total_recipients = CampaignRecipient.populate(campaign)
+            campaign.status = 'sending'
+            campaign.save(update_fields=['total_recipients', 'status'])
+        elif campaign.status != 'sending':
+            raise CommandError(f'Campaign "{campaign.name}" is {campaign.status} and cannot be delivered.')
+
+        self.stdout.write(f'Delivering campaign "{campaign.name}" with the {options["engine"]} engine...')
+
+        results = []
+        after_id = 0
+        while True:
+            batch = CampaignRecipient.next_batch(campaign.id, after_id=after_id, limit=options['chunk_size'])
+            if not batch:
+                break
+            after_id = batch[-1].id
+
+            result = send_campaign_chunk(
+                campaign.id, batch[0].id, batch[-1].id,
+                engine=options['engine'], concurrency=options['concurrency']
+            )
+            results.append(result)
+            self.stdout.write(f'  {result.get("emails_sent", 0)} sent, {result.get("emails_failed", 0)} failed')
+            if result.get('halted') or not result.get('success'):
+                break
+
+        summary = finalize_campaign_send(results, campaign.id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Finished: {summary["emails_sent"]} sent, {summary["emails_failed"]} failed.'
+        ))
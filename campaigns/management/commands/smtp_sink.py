@@ -0,0 +1,40 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+from campaigns.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = 'Runs a local SMTP server that accepts and discards mail, for load testing without a real provider.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+        parser.add_argument('--port', type=int, default=2525, help='Port to listen on.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds each message is held before it is accepted.')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many extra seconds of random latency per message.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of recipients refused with a 550.')
+        parser.add_argument('--defer-rate', type=float, default=0.0, help='Share of recipients deferred with a 451.')
+
+    def handle(self, *args, **options):
+        if options['error_rate'] + options['defer_rate'] > 1:
+            raise CommandError('--error-rate and --defer-rate add up to more than 1.')
+
+        sink = SMTPSink(
+            host=options['host'], port=options['port'], latency=options['latency'], jitter=options['jitter'],
+            error_rate=options['error_rate'], defer_rate=options['defer_rate'],
+        )
+        self.stdout.write(
+            f'SMTP sink listening on {options["host"]}:{options["port"]}. '
+            f'Point a provider at it with TLS and SSL off; press Ctrl+C to stop.'
+        )
+        try:
+            asyncio.run(sink.serve())
+        except OSError as e:
+            raise CommandError(f'Could not listen on {options["host"]}:{options["port"]}: {e}')
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Stopped: {sink.stats["accepted"]} accepted, {sink.stats["refused"]} refused, '
+            f'{sink.stats["deferred"]} deferred over {sink.stats["connections"]} connections.'
+        ))
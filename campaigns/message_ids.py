@@ -0,0 +1,51 @@
+import hashlib
+import hmac
+import secrets
+from typing import Optional, Tuple
+
+from django.conf import settings
+
+# Characters of the HMAC tag kept in each Message-ID
+TAG_LENGTH = 10
+
+
+def _base36(number: int) -> str:
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    encoded = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = digits[remainder] + encoded
+        if not number:
+            return encoded
+
+
+def _tag(body: str) -> str:
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), body.encode('utf-8'), hashlib.sha256).hexdigest()[:TAG_LENGTH]
+
+
+def make_message_id(domain: str, campaign_id: int, recipient_id: int) -> str:
+    """
+    RFC 5322 Message-ID that carries the campaign and CampaignRecipient a
+    message was sent to, e.g. <1z.2n9.5f0a9c3e71d2.8d2c41f0ab@example.com>.
+    A random nonce keeps every send attempt unique and an HMAC tag keyed on
+    SECRET_KEY stops forged ids from decoding.
+    """
+    body = f'{_base36(campaign_id)}.{_base36(recipient_id)}.{secrets.token_hex(6)}'
+    return f'<{body}.{_tag(body)}@{domain}>'
+
+
+def decode_message_id(message_id: str) -> Optional[Tuple[int, int]]:
+    """
+    Recover the identity from a Message-ID made by make_message_id, without
+    any database lookup.
+    Returns: (campaign id, recipient id), or None for any other Message-ID
+    """
+    local_part = (message_id or '').strip().strip('<>').rpartition('@')[0]
+    body, _, tag = local_part.rpartition('.')
+    parts = body.split('.')
+    if len(parts) != 3 or not hmac.compare_digest(tag.encode('utf-8'), _tag(body).encode('ascii')):
+        return None
+    try:
+        return int(parts[0], 36), int(parts[1], 36)
+    except ValueError:
+        return None
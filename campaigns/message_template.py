@@ -0,0 +1,192 @@
+import base64
+import secrets
+import threading
+from collections import OrderedDict
+from email import policy
+from email.header import Header
+from email.mime.text import MIMEText
+from email.utils import formataddr, formatdate, make_msgid
+from typing import List, Optional
+
+from .attachment_cache import EncodedAttachment, get_campaign_attachments
+from .message_ids import make_message_id
+from .personalization import CompiledTemplate, get_campaign_personalization
+
+CRLF = b'\r\n'
+
+
+def _encode_header(value: str, header_name: str) -> bytes:
+    """RFC 2047-encode a header value when it is not plain ASCII, folding long lines"""
+    try:
+        value.encode('ascii')
+        charset = 'us-ascii'
+    except UnicodeEncodeError:
+        charset = 'utf-8'
+    encoded = Header(value, charset, header_name=header_name).encode().replace('\n', '\r\n')
+    return header_name.encode('ascii') + b': ' + encoded.encode('ascii') + CRLF
+
+
+def _address_header(header_name: str, value: str) -> bytes:
+    return header_name.encode('ascii') + b': ' + value.encode('utf-8') + CRLF
+
+
+def _encode_part(part) -> bytes:
+    """Serialize a MIME part with CRLF line endings"""
+    return part.as_bytes(policy=policy.SMTP)
+
+
+class MessageTemplate:
+    """
+    A campaign message compiled once into pre-encoded byte fragments, so
+    rendering a recipient only encodes its personalized parts
+    """
+
+    def __init__(self, subject: CompiledTemplate, html_content: CompiledTemplate,
+                 text_content: Optional[CompiledTemplate], from_email: str, from_name: str,
+                 reply_to_email: str = None, cc_recipients: list = None,
+                 bcc_recipients: list = None, attachments: List[EncodedAttachment] = None,
+                 campaign_id: int = None):
+        self.campaign_id = campaign_id
+        self.from_email = from_email
+        self.message_id_domain = from_email.rsplit('@', 1)[-1]
+        self.cc_recipients = cc_recipients or []
+        self.bcc_recipients = bcc_recipients or []
+
+        self.subject = subject
+        self.static_subject_header = _encode_header(subject.static_content, 'Subject') if subject.is_static else None
+
+        alternative_boundary = ('=_alt_' + secrets.token_hex(16)).encode('ascii')
+        mixed_boundary = ('=_mixed_' + secrets.token_hex(16)).encode('ascii') if attachments else None
+
+        headers = [_address_header('From', formataddr((from_name, from_email), charset='utf-8'))]
+        if self.cc_recipients:
+            headers.append(_address_header('Cc', ', '.join(self.cc_recipients)))
+        if reply_to_email:
+            headers.append(_address_header('Reply-To', reply_to_email))
+        headers.append(b'MIME-Version: 1.0' + CRLF)
+        top_boundary = mixed_boundary or alternative_boundary
+        top_type = b'multipart/mixed' if mixed_boundary else b'multipart/alternative'
+        headers.append(b'Content-Type: ' + top_type + b'; boundary="' + top_boundary + b'"' + CRLF + CRLF)
+        self.static_headers = b''.join(headers)
+
+        # The body is a list of byte fragments; a (content, subtype) tuple marks a
+        # part that has to be personalized and encoded per recipient
+        body = []
+        if mixed_boundary:
+            body.append(
+                b'--' + mixed_boundary + CRLF
+                + b'Content-Type: multipart/alternative; boundary="' + alternative_boundary + b'"' + CRLF + CRLF
+            )
+        for content, subtype in ((text_content, 'plain'), (html_content, 'html')):
+            if content is None:
+                continue
+            body.append(b'--' + alternative_boundary + CRLF)
+            if content.is_static:
+                body.append(_encode_part(MIMEText(content.static_content, subtype, 'utf-8')))
+            else:
+                body.append((content, subtype))
+            body.append(CRLF)
+        body.append(b'--' + alternative_boundary + b'--' + CRLF)
+
+        if mixed_boundary:
+            for attachment in attachments:
+                body.append(b'--' + mixed_boundary + CRLF + attachment.headers)
+                body.append(attachment.body)
+                body.append(CRLF)
+            body.append(b'--' + mixed_boundary + b'--' + CRLF)
+
+        # Collapse runs of static fragments so rendering joins as few pieces as
+        # possible; spooled attachment bodies stay separate memory maps
+        self.body = []
+        for fragment in body:
+            if type(fragment) is bytes and self.body and type(self.body[-1]) is bytes:
+                self.body[-1] += fragment
+            else:
+                self.body.append(fragment)
+
+    @staticmethod
+    def _encode_dynamic_part(content: str, subtype: str) -> bytes:
+        return (
+            b'Content-Type: text/' + subtype.encode('ascii') + b'; charset="utf-8"' + CRLF
+            + b'MIME-Version: 1.0' + CRLF
+            + b'Content-Transfer-Encoding: base64' + CRLF + CRLF
+            + base64.encodebytes(content.encode('utf-8')).replace(b'\n', CRLF)
+        )
+
+    def envelope_recipients(self, to_email: str) -> List[str]:
+        return [to_email] + self.cc_recipients + self.bcc_recipients
+
+    def new_message_id(self, recipient=None) -> str:
+        """A fresh Message-ID, encoding the campaign and recipient when both are known"""
+        if self.campaign_id is not None and recipient is not None:
+            return make_message_id(self.message_id_domain, self.campaign_id, recipient.id)
+        return make_msgid(domain=self.message_id_domain)
+
+    def render_subject(self, recipient) -> str:
+        return self.subject.render(recipient)
+
+    def render(self, recipient, message_id: str) -> bytes:
+        """Produce the final message bytes for one recipient"""
+        pieces = [
+            _address_header('To', recipient.email),
+            b'Message-ID: ' + message_id.encode('ascii') + CRLF,
+            b'Date: ' + formatdate(localtime=False).encode('ascii') + CRLF,
+            self.static_subject_header or _encode_header(self.render_subject(recipient), 'Subject'),
+            self.static_headers,
+        ]
+        for fragment in self.body:
+            if isinstance(fragment, tuple):
+                content, subtype = fragment
+                pieces.append(self._encode_dynamic_part(content.render(recipient), subtype))
+            else:
+                pieces.append(fragment)
+        return b''.join(pieces)
+
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+MAX_CACHED_TEMPLATES = 8
+
+
+def get_campaign_message_template(campaign, provider) -> MessageTemplate:
+    """
+    Compiled MessageTemplate for a campaign, built once per process and
+    reused by every chunk until the campaign or its provider changes
+    """
+    attachments = get_campaign_attachments(campaign)
+    key = (
+        campaign.pk, campaign.updated_at, provider.pk, provider.updated_at,
+        tuple(attachment.signature for attachment in attachments),
+    )
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+            return template
+
+    personalization = get_campaign_personalization(campaign)
+    template = MessageTemplate(
+        subject=personalization.subject,
+        html_content=personalization.html_content,
+        text_content=personalization.text_content,
+        from_email=campaign.from_email or provider.from_email,
+        from_name=campaign.from_name or provider.from_name,
+        reply_to_email=provider.reply_to_email,
+        cc_recipients=campaign.cc_recipients.split(',') if campaign.cc_recipients else None,
+        bcc_recipients=campaign.bcc_recipients.split(',') if campaign.bcc_recipients else None,
+        attachments=attachments,
+        campaign_id=campaign.pk,
+    )
+
+    with _templates_lock:
+        _templates[key] = template
+        while len(_templates) > MAX_CACHED_TEMPLATES:
+            _templates.popitem(last=False)
+    return template
+
+
+def evict_campaign_message_template(campaign_id: int):
+    """Drop every compiled template held for a campaign"""
+    with _templates_lock:
+        for key in [key for key in _templates if key[0] == campaign_id]:
+            del _templates[key]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0010_smtpprovider_is_warming_up_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='smtpprovider',
+            name='max_connection_age',
+            field=models.PositiveIntegerField(default=300, help_text='Recycle an SMTP session after it has been open this long.', verbose_name='Max Connection Age (seconds)'),
+        ),
+        migrations.AddField(
+            model_name='smtpprovider',
+            name='max_connections',
+            field=models.PositiveIntegerField(default=4, help_text='Maximum number of simultaneous SMTP sessions per worker process.', verbose_name='Max Open Connections'),
+        ),
+        migrations.AddField(
+            model_name='smtpprovider',
+            name='max_messages_per_connection',
+            field=models.PositiveIntegerField(default=100, help_text='Recycle an SMTP session after it has sent this many messages.', verbose_name='Messages Per Connection'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0011_smtpprovider_connection_pool'),
+        ('subscribers', '0002_subscriber_created_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CampaignRecipient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('name', models.CharField(blank=True, max_length=100, verbose_name='Name')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='State')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Processed At')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipients', to='campaigns.campaign')),
+                ('subscriber', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='subscribers.subscriber')),
+            ],
+            options={
+                'verbose_name': 'Campaign Recipient',
+                'verbose_name_plural': 'Campaign Recipients',
+                'indexes': [models.Index(fields=['campaign', 'state', 'id'], name='campaigns_c_campaig_b5728c_idx')],
+            },
+        ),
+    ]
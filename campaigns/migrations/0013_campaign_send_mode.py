@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0012_campaignrecipient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='allowed_providers',
+            field=models.ManyToManyField(blank=True, help_text='Providers a multi-provider send may use. Leave empty to use every active provider.', related_name='sharded_campaigns', to='campaigns.smtpprovider', verbose_name='Allowed Providers'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_mode',
+            field=models.CharField(choices=[('single', 'Single provider'), ('multi', 'Spread across providers')], default='single', max_length=10, verbose_name='Send Mode'),
+        ),
+    ]
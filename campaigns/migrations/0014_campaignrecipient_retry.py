@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0013_campaign_send_mode'),
+        ('subscribers', '0002_subscriber_created_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaignrecipient',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Retry Attempts'),
+        ),
+        migrations.AddField(
+            model_name='campaignrecipient',
+            name='deferred_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='First Deferred At'),
+        ),
+        migrations.AddField(
+            model_name='campaignrecipient',
+            name='retry_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Retry At'),
+        ),
+        migrations.AlterField(
+            model_name='campaignrecipient',
+            name='state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('deferred', 'Deferred'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='State'),
+        ),
+        migrations.AddIndex(
+            model_name='campaignrecipient',
+            index=models.Index(fields=['state', 'retry_at'], name='campaigns_c_state_b39639_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:20
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicate_recipients(apps, schema_editor):
+    """Keep the first row of each (campaign, email) so the constraint can be added"""
+    CampaignRecipient = apps.get_model('campaigns', 'CampaignRecipient')
+    duplicates = (
+        CampaignRecipient.objects.values('campaign_id', 'email')
+        .annotate(keep=Min('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        CampaignRecipient.objects.filter(
+            campaign_id=duplicate['campaign_id'], email=duplicate['email']
+        ).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0014_campaignrecipient_retry'),
+        ('subscribers', '0002_subscriber_created_by'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='campaignrecipient',
+            name='state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('sending', 'Sending'), ('deferred', 'Deferred'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='State'),
+        ),
+        migrations.RunPython(drop_duplicate_recipients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='campaignrecipient',
+            constraint=models.UniqueConstraint(fields=('campaign', 'email'), name='unique_campaign_recipient'),
+        ),
+    ]
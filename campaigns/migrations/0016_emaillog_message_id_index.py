@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0015_campaignrecipient_delivery_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emaillog',
+            name='message_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, verbose_name='Message ID'),
+        ),
+    ]
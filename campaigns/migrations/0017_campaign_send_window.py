@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0016_emaillog_message_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='release_cursor',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='released_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, help_text='Start sending at this time. Leave empty to start as soon as the campaign is sent.', null=True, verbose_name='Scheduled At'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='send_window_hours',
+            field=models.PositiveIntegerField(default=0, help_text='Spread the send evenly over this many hours. 0 sends as fast as the providers allow.', verbose_name='Send Window (hours)'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import EmailValidator
 import json
@@ -57,6 +58,11 @@ class SMTPProvider(models.Model):
     emails_per_second = models.IntegerField(_('Per Second Limit'), default=2)
     bounce_rate_threshold = models.FloatField(_('Bounce Rate Threshold (%)'), default=5.0, help_text=_('The bounce rate at which to deactivate the provider.'))
 
+    # Connection Pool
+    max_connections = models.PositiveIntegerField(_('Max Open Connections'), default=4, help_text=_('Maximum number of simultaneous SMTP sessions per worker process.'))
+    max_messages_per_connection = models.PositiveIntegerField(_('Messages Per Connection'), default=100, help_text=_('Recycle an SMTP session after it has sent this many messages.'))
+    max_connection_age = models.PositiveIntegerField(_('Max Connection Age (seconds)'), default=300, help_text=_('Recycle an SMTP session after it has been open this long.'))
+
     # Additional Settings
     from_email = models.EmailField(_('From Email'), validators=[EmailValidator()])
     from_name = models.CharField(_('From Name'), max_length=255, default='Mail System')
@@ -111,7 +117,7 @@ class SMTPProvider(models.Model):
             return 0
         return (self.total_bounced / self.total_sent) * 100
 
-    def is_within_warmup_limits(self):
+    def is_within_warmup_limits(self, sent_today=None):
         """Check if the provider is within the warm-up sending limits."""
         if not self.is_warming_up or not self.warmup_started_at:
             return True, None  # Not in warm-up mode
@@ -128,10 +134,13 @@ class SMTPProvider(models.Model):
             self.save()
             return True, None
 
-        today_sent = EmailLog.objects.filter(
-            smtp_provider=self,
-            sent_at__date=timezone.now().date()
-        ).count()
+        if sent_today is not None:
+            today_sent = sent_today
+        else:
+            today_sent = EmailLog.objects.filter(
+                smtp_provider=self,
+                sent_at__date=timezone.now().date()
+            ).count()
 
         if today_sent >= daily_limit:
             return False, daily_limit
@@ -140,27 +149,9 @@ class SMTPProvider(models.Model):
 
     def is_within_limits(self):
         """Check if provider is within rate limits"""
-        from django.utils import timezone
-        from datetime import timedelta
-
-        # Check daily limit
-        today = timezone.now().date()
-        today_sent = EmailLog.objects.filter(
-            smtp_provider=self,
-            sent_at__date=today
-        ).count()
-
-        if today_sent >= self.emails_per_day:
-            return False
+        from .rate_limit import ProviderRateLimiter
 
-        # Check hourly limit
-        hour_ago = timezone.now() - timedelta(hours=1)
-        hour_sent = EmailLog.objects.filter(
-            smtp_provider=self,
-            sent_at__gte=hour_ago
-        ).count()
-
-        return hour_sent < self.emails_per_hour
+        return ProviderRateLimiter(self).has_capacity()
 
 
 class EmailTemplate(models.Model):
@@ -201,6 +192,11 @@ class Campaign(models.Model):
         ('cancelled', 'Cancelled'),
     ]
 
+    SEND_MODE_CHOICES = [
+        ('single', 'Single provider'),
+        ('multi', 'Spread across providers'),
+    ]
+
     name = models.CharField(_('Campaign Name'), max_length=255)
     subject = models.CharField(_('Email Subject'), max_length=500)
     from_email = models.EmailField(_('From Email'))
@@ -221,10 +217,25 @@ class Campaign(models.Model):
 
     # Settings
     smtp_provider = models.ForeignKey(SMTPProvider, on_delete=models.PROTECT, null=True, blank=True)
+    send_mode = models.CharField(_('Send Mode'), max_length=10, choices=SEND_MODE_CHOICES, default='single')
+    allowed_providers = models.ManyToManyField(
+        SMTPProvider, verbose_name=_('Allowed Providers'), blank=True, related_name='sharded_campaigns',
+        help_text=_('Providers a multi-provider send may use. Leave empty to use every active provider.')
+    )
     status = models.CharField(_('Status'), max_length=20, choices=STATUS_CHOICES, default='draft')
 
     # Scheduling
-
+    scheduled_at = models.DateTimeField(
+        _('Scheduled At'), null=True, blank=True,
+        help_text=_('Start sending at this time. Leave empty to start as soon as the campaign is sent.')
+    )
+    send_window_hours = models.PositiveIntegerField(
+        _('Send Window (hours)'), default=0,
+        help_text=_('Spread the send evenly over this many hours. 0 sends as fast as the providers allow.')
+    )
+    # Progress of a paced send: the last recipient handed to the pipeline and when
+    release_cursor = models.BigIntegerField(default=0)
+    released_at = models.DateTimeField(null=True, blank=True)
     sent_at = models.DateTimeField(_('Sent At'), null=True, blank=True)
 
     # Tracking
@@ -241,6 +252,9 @@ class Campaign(models.Model):
     created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Updated At'), auto_now=True)
 
+    # Campaign status is mirrored into the cache so send workers can poll it cheaply
+    STATUS_CACHE_TIMEOUT = 60 * 60 * 24
+
     class Meta:
         verbose_name = _('Campaign')
         verbose_name_plural = _('Campaigns')
@@ -249,6 +263,26 @@ class Campaign(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'status' in update_fields:
+            cache.set(self.status_cache_key(self.pk), self.status, self.STATUS_CACHE_TIMEOUT)
+
+    @staticmethod
+    def status_cache_key(campaign_id: int) -> str:
+        return f"campaign_status_{campaign_id}"
+
+    @classmethod
+    def get_cached_status(cls, campaign_id: int) -> str:
+        """Current campaign status, read from the cache and falling back to the database"""
+        status = cache.get(cls.status_cache_key(campaign_id))
+        if status is None:
+            status = cls.objects.filter(pk=campaign_id).values_list('status', flat=True).first()
+            if status is not None:
+                cache.set(cls.status_cache_key(campaign_id), status, cls.STATUS_CACHE_TIMEOUT)
+        return status
+
     def get_delivery_rate(self):
         """Calculate delivery rate percentage"""
         if self.total_sent == 0:
@@ -274,6 +308,137 @@ class Attachment(models.Model):
 
 
 
+class CampaignRecipient(models.Model):
+    """Materialized recipient queue for a campaign, built once when the send starts"""
+
+    STATE_CHOICES = [
+        ('pending', 'Pending'),
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('deferred', 'Deferred'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    campaign = models.ForeignKey(Campaign, related_name='recipients', on_delete=models.CASCADE)
+    subscriber = models.ForeignKey('subscribers.Subscriber', on_delete=models.SET_NULL, null=True, blank=True)
+
+    # Personalization fields copied from the subscriber at send time
+    email = models.EmailField(_('Email'))
+    name = models.CharField(_('Name'), max_length=100, blank=True)
+
+    state = models.CharField(_('State'), max_length=20, choices=STATE_CHOICES, default='pending')
+    processed_at = models.DateTimeField(_('Processed At'), null=True, blank=True)
+
+    # Retries of temporary (4xx) failures
+    attempts = models.PositiveSmallIntegerField(_('Retry Attempts'), default=0)
+    deferred_at = models.DateTimeField(_('First Deferred At'), null=True, blank=True)
+    retry_at = models.DateTimeField(_('Retry At'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('Campaign Recipient')
+        verbose_name_plural = _('Campaign Recipients')
+        indexes = [
+            models.Index(fields=['campaign', 'state', 'id']),
+            models.Index(fields=['state', 'retry_at']),
+        ]
+        constraints = [
+            # The delivery key: a campaign reaches each address at most once
+            models.UniqueConstraint(fields=['campaign', 'email'], name='unique_campaign_recipient'),
+        ]
+
+    def __str__(self):
+        return f"{self.email} - {self.campaign_id} ({self.state})"
+
+    @classmethod
+    def populate(cls, campaign) -> int:
+        """
+        Fill the recipient queue for a campaign from its segments, skipping
+        blacklisted, inactive and already queued subscribers.
+        Returns: Number of rows inserted
+        """
+        from django.db import transaction
+        from subscribers.models import Subscriber
+
+        subscribers = (
+            Subscriber.objects.filter(status='active', segments__campaign=campaign)
+            .exclude(email__in=Blacklist.objects.values('email'))
+            .exclude(email__in=cls.objects.filter(campaign=campaign).values('email'))
+            .distinct()
+            .order_by('id')
+            .values_list('id', 'email', 'name')
+        )
+        batch_size = settings.CAMPAIGN_POPULATE_BATCH_SIZE
+
+        with transaction.atomic():
+            queued = cls.objects.filter(campaign=campaign).count()
+            last_id = 0
+            while True:
+                batch = list(subscribers.filter(id__gt=last_id)[:batch_size])
+                if not batch:
+                    break
+                # A concurrent populate may have queued some of these already
+                cls.objects.bulk_create(
+                    [
+                        cls(campaign=campaign, subscriber_id=subscriber_id, email=email, name=name)
+                        for subscriber_id, email, name in batch
+                    ],
+                    ignore_conflicts=True,
+                )
+                last_id = batch[-1][0]
+            return cls.objects.filter(campaign=campaign).count() - queued
+
+    @classmethod
+    def lock_for_claim(cls):
+        """
+        Call first thing in a claim's transaction. SQLite has no row locks
+        and a transaction that reads before it writes can deadlock with
+        another writer, such as the EmailLog flusher, when it upgrades its
+        read lock; a no-op UPDATE takes the write lock up front so other
+        writers wait for the claim instead. Other databases rely on the
+        claim's select_for_update.
+        """
+        from django.db import connection
+        from django.db.models import F
+
+        if connection.vendor == 'sqlite':
+            cls.objects.filter(pk=0).update(state=F('state'))
+
+    @classmethod
+    def claim(cls, ids, state: str = 'pending', to_state: str = 'sending') -> set:
+        """
+        Atomically move the recipients among ``ids`` that are still in
+        ``state`` to ``to_state``. Rows another worker has claimed, or
+        already sent, are left alone, so only one caller ever sends to a
+        recipient.
+        Returns: Set of the ids claimed by this caller
+        """
+        from django.db import transaction
+
+        with transaction.atomic():
+            cls.lock_for_claim()
+            claimed = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(id__in=ids, state=state)
+                .values_list('id', flat=True)
+            )
+            cls.objects.filter(id__in=claimed, state=state).update(state=to_state)
+        return set(claimed)
+
+    @classmethod
+    def next_batch(cls, campaign_id: int, after_id: int = 0, limit: int = 500, state: str = 'pending'):
+        """
+        Keyset-paginated slice of the queue: the next ``limit`` recipients in
+        ``state`` with an id greater than ``after_id``. Served straight from the
+        (campaign, state, id) index, so each page costs the same however far
+        into the campaign we are.
+        """
+        return list(
+            cls.objects.filter(campaign_id=campaign_id, state=state, id__gt=after_id)
+            .order_by('id')[:limit]
+        )
+
+
 class EmailLog(models.Model):
     """Email delivery log"""
 
@@ -310,7 +475,7 @@ class EmailLog(models.Model):
     bounce_reason = models.TextField(_('Bounce Reason'), blank=True)
 
     # Tracking IDs
-    message_id = models.CharField(_('Message ID'), max_length=255, blank=True)
+    message_id = models.CharField(_('Message ID'), max_length=255, blank=True, db_index=True)
     tracking_id = models.CharField(_('Tracking ID'), max_length=255, blank=True)
 
     # Metadata
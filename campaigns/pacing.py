@@ -0,0 +1,204 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from .circuit_breaker import is_provider_failure
+from .rate_limit import bulk_share, get_redis, get_script
+
+logger = logging.getLogger(__name__)
+
+# Replies with which a provider asks us to slow down: too many connections or
+# messages (421), try again later (451) and API rate limiting (429)
+CONGESTION_CODES = {421, 451}
+CONGESTION_STATUS_CODES = {429}
+
+# Per-message latency below this is never compared against the baseline:
+# jitter at a few milliseconds says more about the worker than the provider
+LATENCY_FLOOR_MS = 50
+
+# KEYS[1] is the provider's pacing hash, ARGV is (messages, congestion signals,
+# provider failures, milliseconds per message, minimum rate, maximum rate,
+# maximum concurrency, rate step, increase interval ms, decrease factor,
+# decrease interval ms, error rate, latency factor, latency smoothing, latency
+# floor ms). A provider starts at its maximum rate and concurrency. Keeps an
+# EWMA of the per-message latency and its lowest recent value as the
+# baseline. Congestion, too many failures or a latency well over the baseline
+# cut the rate and concurrency multiplicatively, at most once per decrease
+# interval; otherwise both go back up additively, at most once per increase
+# interval. Returns {rate, concurrency, latency ms, action}.
+RECORD_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local messages = tonumber(ARGV[1])
+local congested = tonumber(ARGV[2])
+local failures = tonumber(ARGV[3])
+local latency = tonumber(ARGV[4])
+local min_rate = tonumber(ARGV[5])
+local max_rate = tonumber(ARGV[6])
+local max_concurrency = tonumber(ARGV[7])
+local alpha = tonumber(ARGV[14])
+
+local state = redis.call('HMGET', KEYS[1], 'rate', 'concurrency', 'latency', 'baseline', 'increased_at', 'decreased_at')
+local rate = math.min(tonumber(state[1]) or max_rate, max_rate)
+local concurrency = math.min(tonumber(state[2]) or max_concurrency, max_concurrency)
+local ewma = tonumber(state[3])
+local baseline = tonumber(state[4])
+local increased_at = tonumber(state[5]) or 0
+local decreased_at = tonumber(state[6]) or 0
+
+if latency > 0 then
+    ewma = ewma and ewma + alpha * (latency - ewma) or latency
+    -- The baseline follows lasting latency changes slowly
+    baseline = baseline and math.min(baseline + (ewma - baseline) * alpha / 10, ewma) or ewma
+end
+
+local slow = ewma and baseline and ewma > math.max(baseline, tonumber(ARGV[15])) * tonumber(ARGV[13])
+local failing = messages > 0 and failures >= messages * tonumber(ARGV[12])
+local action = 'hold'
+if congested > 0 or failing or slow then
+    if now - decreased_at >= tonumber(ARGV[11]) then
+        rate = math.max(min_rate, math.floor(rate * tonumber(ARGV[10])))
+        concurrency = math.max(1, math.floor(concurrency * tonumber(ARGV[10])))
+        decreased_at = now
+        increased_at = now
+        action = 'decrease'
+    end
+elseif messages > 0 and now - increased_at >= tonumber(ARGV[9]) then
+    rate = math.min(max_rate, rate + tonumber(ARGV[8]))
+    concurrency = math.min(max_concurrency, concurrency + 1)
+    increased_at = now
+    action = 'increase'
+end
+
+redis.call('HSET', KEYS[1], 'rate', rate, 'concurrency', concurrency, 'increased_at', increased_at,
+    'decreased_at', decreased_at, 'action', action)
+if ewma then
+    redis.call('HSET', KEYS[1], 'latency', tostring(ewma), 'baseline', tostring(baseline))
+end
+redis.call('EXPIRE', KEYS[1], 86400)
+return {rate, concurrency, tostring(ewma or 0), action}
+"""
+
+
+def is_congestion(result: dict) -> bool:
+    """Whether a failed send is the provider asking us to slow down"""
+    if result.get('success'):
+        return False
+    return result.get('smtp_code') in CONGESTION_CODES or result.get('status_code') in CONGESTION_STATUS_CODES
+
+
+class PacingController:
+    """
+    AIMD send rate and concurrency targets for one SMTPProvider, shared by
+    every worker through Redis. Starts at the provider's limits and only slows
+    down after it pushes back.
+    """
+
+    KEY_PREFIX = 'smtp_pacing'
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.key = f'{self.KEY_PREFIX}:{{{provider.pk}}}'
+
+    @property
+    def max_rate(self) -> int:
+        if self.provider.emails_per_second > 0:
+            return max(1, bulk_share(self.provider.emails_per_second))
+        return settings.CAMPAIGN_PACING_MAX_RATE
+
+    @property
+    def max_concurrency(self) -> int:
+        return max(1, self.provider.max_connections)
+
+    def targets(self) -> Optional[Tuple[int, int]]:
+        """
+        The current targets, or the maximum ones for a provider without any.
+        Returns: (messages per second, sessions per worker), or None when Redis is unavailable
+        """
+        try:
+            rate, concurrency = get_redis().hmget(self.key, 'rate', 'concurrency')
+        except Exception as e:
+            logger.warning(f"Pacing unavailable for provider {self.provider.name}: {str(e)}")
+            return None
+        if rate is None or concurrency is None:
+            return self.max_rate, self.max_concurrency
+        return min(int(rate), self.max_rate), min(int(concurrency), self.max_concurrency)
+
+    def record(self, results: Iterable[dict], latency: float) -> Optional[Tuple[int, int]]:
+        """
+        Adjust the targets after a block of sends that took ``latency``
+        seconds per message on each session.
+        Returns: The new (messages per second, sessions per worker), or None when Redis is unavailable
+        """
+        messages = congested = failures = 0
+        for result in results:
+            messages += 1
+            congested += is_congestion(result)
+            failures += is_provider_failure(result)
+        if not messages:
+            return self.targets()
+
+        try:
+            rate, concurrency, ewma, action = get_script(RECORD_SCRIPT)(
+                keys=[self.key],
+                args=[
+                    messages,
+                    congested,
+                    failures,
+                    round(latency * 1000, 3),
+                    settings.CAMPAIGN_PACING_MIN_RATE,
+                    self.max_rate,
+                    self.max_concurrency,
+                    settings.CAMPAIGN_PACING_RATE_STEP,
+                    int(settings.CAMPAIGN_PACING_INCREASE_INTERVAL * 1000),
+                    settings.CAMPAIGN_PACING_DECREASE_FACTOR,
+                    int(settings.CAMPAIGN_PACING_DECREASE_INTERVAL * 1000),
+                    settings.CAMPAIGN_PACING_ERROR_RATE,
+                    settings.CAMPAIGN_PACING_LATENCY_FACTOR,
+                    settings.CAMPAIGN_PACING_LATENCY_SMOOTHING,
+                    LATENCY_FLOOR_MS,
+                ],
+            )
+        except Exception as e:
+            logger.warning(f"Could not update pacing for provider {self.provider.name}: {str(e)}")
+            return None
+
+        action = action.decode() if isinstance(action, bytes) else action
+        if action == 'decrease':
+            logger.info(
+                f"Provider {self.provider.name} pushed back ({congested} congestion replies, {failures} failures, "
+                f"{float(ewma):.0f} ms per message), slowing to {int(rate)}/s over {int(concurrency)} sessions"
+            )
+        return int(rate), int(concurrency)
+
+
+def get_pacing(providers: List) -> Dict[int, dict]:
+    """
+    Current pacing state of several providers, in one pipelined round-trip,
+    for display.
+    Returns: Dict of provider id to rate, concurrency, latency_ms and action;
+    providers that have not sent yet are left out
+    """
+    if not providers:
+        return {}
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for provider in providers:
+            pipe.hmget(PacingController(provider).key, 'rate', 'concurrency', 'latency', 'action')
+        states = pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not read provider pacing: {str(e)}")
+        return {}
+
+    pacing = {}
+    for provider, (rate, concurrency, latency, action) in zip(providers, states):
+        if rate is None:
+            continue
+        pacing[provider.pk] = {
+            'rate': int(rate),
+            'concurrency': int(concurrency),
+            'latency_ms': float(latency) if latency is not None else None,
+            'action': action.decode() if isinstance(action, bytes) else action,
+        }
+    return pacing
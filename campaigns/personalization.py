@@ -0,0 +1,219 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+from django.utils.html import escape
+
+# {subscriber.field}, {subscriber.field|default}, {if subscriber.field},
+# {if not subscriber.field}, {else} and {endif}. Anything else in braces,
+# such as inline CSS, is literal text.
+TAG_RE = re.compile(
+    r'\{(?:subscriber\.(?P<field>[a-z][a-z0-9_]*)(?:\|(?P<default>[^{}]*))?'
+    r'|if (?P<negate>not )?subscriber\.(?P<condition>[a-z][a-z0-9_]*)'
+    r'|(?P<else>else)|(?P<endif>endif))\}'
+)
+
+
+def personalization_fields() -> set:
+    """Subscriber fields that may be used as placeholders"""
+    from subscribers.models import Subscriber
+    return {
+        field.name for field in Subscriber._meta.concrete_fields
+        if not field.is_relation
+    }
+
+
+def _subscriber_for(recipient):
+    """The Subscriber behind a CampaignRecipient, or the recipient itself"""
+    subscriber = getattr(recipient, 'subscriber', None)
+    return subscriber if subscriber is not None else recipient
+
+
+def _value(recipient, field: str) -> str:
+    # name and email are copied onto CampaignRecipient, so they never need the subscriber row
+    if field in ('name', 'email'):
+        value = getattr(recipient, field, None)
+    else:
+        value = getattr(_subscriber_for(recipient), field, None)
+    return '' if value is None else str(value)
+
+
+class CompiledTemplate:
+    """
+    Campaign content parsed once into literal, placeholder and conditional
+    segments, HTML-escaping values when ``html`` is set
+    """
+
+    def __init__(self, content: str, html: bool = False, fields: set = None):
+        self.html = html
+        self.fields = fields if fields is not None else personalization_fields()
+        self.segments = self._parse(content or '')
+        self.is_static = all(isinstance(segment, str) for segment in self.segments)
+        self.static_content = ''.join(self.segments) if self.is_static else None
+
+    def _parse(self, content: str) -> list:
+        root: List = []
+        stack = []  # open conditionals: (segments before the {if}, field, negate, then_segments, else_segments)
+        segments = root
+        position = 0
+
+        for match in TAG_RE.finditer(content):
+            if match.start() > position:
+                segments.append(content[position:match.start()])
+            position = match.end()
+
+            if match.group('field'):
+                field = match.group('field')
+                if field in self.fields:
+                    segments.append((field, match.group('default') or ''))
+                else:
+                    # Unknown fields stay visible so typos show up in test sends
+                    segments.append(match.group(0))
+            elif match.group('condition'):
+                condition = [match.group('condition'), bool(match.group('negate')), [], None]
+                stack.append((segments, condition))
+                segments = condition[2]
+            elif match.group('else') and stack and stack[-1][1][3] is None:
+                stack[-1][1][3] = segments = []
+            elif match.group('endif') and stack:
+                segments, condition = stack.pop()
+                segments.append((condition[0], condition[1], condition[2], condition[3] or []))
+            else:
+                segments.append(match.group(0))
+
+        if position < len(content):
+            segments.append(content[position:])
+
+        # Unclosed conditionals are treated as if they ended with the content
+        while stack:
+            segments, condition = stack.pop()
+            segments.append((condition[0], condition[1], condition[2], condition[3] or []))
+
+        return self._merge(root)
+
+    @classmethod
+    def _merge(cls, segments: list) -> list:
+        """Join adjacent literals so rendering appends as few pieces as possible"""
+        merged = []
+        for segment in segments:
+            if isinstance(segment, tuple) and len(segment) == 4:
+                field, negate, then_segments, else_segments = segment
+                segment = (field, negate, cls._merge(then_segments), cls._merge(else_segments))
+            if isinstance(segment, str) and merged and isinstance(merged[-1], str):
+                merged[-1] += segment
+            elif segment != '':
+                merged.append(segment)
+        return merged
+
+    def render(self, recipient) -> str:
+        """Render the content for one recipient"""
+        if self.is_static:
+            return self.static_content
+        pieces = []
+        self._render_into(self.segments, recipient, pieces)
+        return ''.join(pieces)
+
+    def _render_into(self, segments: list, recipient, pieces: list):
+        for segment in segments:
+            if isinstance(segment, str):
+                pieces.append(segment)
+            elif len(segment) == 2:
+                value = _value(recipient, segment[0]) or segment[1]
+                pieces.append(escape(value) if self.html else value)
+            else:
+                field, negate, then_segments, else_segments = segment
+                if bool(_value(recipient, field)) != negate:
+                    self._render_into(then_segments, recipient, pieces)
+                else:
+                    self._render_into(else_segments, recipient, pieces)
+
+
+class SubstitutionTemplate:
+    """
+    Campaign content with every placeholder replaced by a substitution tag,
+    for API providers that personalize one shared message per recipient
+    (SendGrid substitutions). Conditionals cannot be expressed as tags, so
+    content using them has no SubstitutionTemplate.
+    """
+
+    def __init__(self, personalization: 'CampaignPersonalization'):
+        self._tags = {}  # (field, default, html) -> tag
+        self.subject = self._tagged(personalization.subject)
+        self.html_content = self._tagged(personalization.html_content)
+        self.text_content = self._tagged(personalization.text_content) if personalization.text_content else None
+
+    def _tagged(self, template: CompiledTemplate) -> str:
+        pieces = []
+        for segment in template.segments:
+            if isinstance(segment, str):
+                pieces.append(segment)
+            else:
+                key = (segment[0], segment[1], template.html)
+                pieces.append(self._tags.setdefault(key, f'-sub{len(self._tags)}-'))
+        return ''.join(pieces)
+
+    def values(self, recipient) -> dict:
+        """Substitution tag values for one recipient"""
+        values = {}
+        for (field, default, html), tag in self._tags.items():
+            value = _value(recipient, field) or default
+            values[tag] = str(escape(value)) if html else value
+        return values
+
+
+class CampaignPersonalization:
+    """Compiled subject, HTML and text content of one campaign version"""
+
+    def __init__(self, subject: str, html_content: str, text_content: str = None):
+        fields = personalization_fields()
+        self.subject = CompiledTemplate(subject, fields=fields)
+        self.html_content = CompiledTemplate(html_content, html=True, fields=fields)
+        self.text_content = CompiledTemplate(text_content, fields=fields) if text_content else None
+
+        templates = [self.subject, self.html_content, self.text_content]
+        conditional = any(
+            len(segment) == 4
+            for template in templates if template
+            for segment in template.segments if isinstance(segment, tuple)
+        )
+        self.substitution = None if conditional else SubstitutionTemplate(self)
+
+    def render(self, recipient) -> dict:
+        return {
+            'subject': self.subject.render(recipient),
+            'html_content': self.html_content.render(recipient),
+            'text_content': self.text_content.render(recipient) if self.text_content else None,
+        }
+
+
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+MAX_CACHED_CAMPAIGNS = 8
+
+
+def get_campaign_personalization(campaign) -> CampaignPersonalization:
+    """
+    Compiled personalization for a campaign, parsed once per process and
+    reused until the campaign is edited
+    """
+    key = (campaign.pk, campaign.updated_at)
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            return compiled
+
+    compiled = CampaignPersonalization(campaign.subject, campaign.html_content, campaign.text_content)
+    with _compiled_lock:
+        _compiled[key] = compiled
+        while len(_compiled) > MAX_CACHED_CAMPAIGNS:
+            _compiled.popitem(last=False)
+    return compiled
+
+
+def evict_campaign_personalization(campaign_id: int):
+    """Drop every compiled version of a campaign's content"""
+    with _compiled_lock:
+        for key in [key for key in _compiled if key[0] == campaign_id]:
+            del _compiled[key]
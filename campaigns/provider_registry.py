@@ -0,0 +1,119 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Tuple
+
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Provider fields that change on every send; saving only these does not
+# invalidate the cached provider configs
+RUNTIME_FIELDS = {
+    'total_sent', 'total_delivered', 'total_bounced', 'total_opened',
+    'total_clicked', 'last_used',
+}
+
+
+class ProviderRegistry:
+    """
+    In-process cache of the active SMTPProvider configs.
+
+    Every process keeps its own copy and compares it against a version
+    stamp in the shared cache, which is bumped whenever a provider is saved
+    or deleted. Copies are also refreshed after ``ttl`` seconds so that
+    changes made with queryset.update() are eventually seen.
+    """
+
+    VERSION_KEY = 'smtp_provider_registry_version'
+
+    def __init__(self, ttl: float = 60):
+        self.ttl = ttl
+        self._providers = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def providers(self) -> list:
+        """Active providers, loaded from the database only after an invalidation"""
+        from .models import SMTPProvider
+
+        version = cache.get(self.VERSION_KEY)
+        with self._lock:
+            if (self._providers is not None and version == self._version
+                    and time.monotonic() - self._loaded_at < self.ttl):
+                return self._providers
+
+        providers = list(SMTPProvider.objects.filter(is_active=True).order_by('id'))
+        with self._lock:
+            self._providers = providers
+            self._version = version
+            self._loaded_at = time.monotonic()
+        return providers
+
+    def invalidate(self):
+        """Drop the cached configs in this and every other process"""
+        cache.set(self.VERSION_KEY, uuid.uuid4().hex, None)
+        with self._lock:
+            self._providers = None
+
+
+registry = ProviderRegistry()
+
+
+def _counter_keys(provider_id: int, now: datetime) -> Tuple[str, str]:
+    local_now = timezone.localtime(now)
+    return (
+        f"smtp_sent_day_{provider_id}_{local_now:%Y%m%d}",
+        f"smtp_sent_hour_{provider_id}_{local_now:%Y%m%d%H}",
+    )
+
+
+def _last_used_key(provider_id: int) -> str:
+    return f"smtp_last_used_{provider_id}"
+
+
+def record_sent(provider_id: int, count: int = 1):
+    """Add delivered messages to the provider's sent-today and sent-this-hour counters"""
+    if count <= 0:
+        return
+    now = timezone.now()
+    day_key, hour_key = _counter_keys(provider_id, now)
+    try:
+        for key, timeout in ((day_key, 2 * 86400), (hour_key, 2 * 3600)):
+            cache.add(key, 0, timeout)
+            cache.incr(key, count)
+        cache.set(_last_used_key(provider_id), now.timestamp(), None)
+    except Exception as e:
+        logger.warning(f"Could not update send counters for provider {provider_id}: {str(e)}")
+
+
+def get_counters(provider_ids: List[int]) -> Dict[int, dict]:
+    """
+    Live counters for several providers in a single cache round-trip.
+    Returns: Dict of provider id to sent_today, sent_this_hour and last_used
+    """
+    now = timezone.now()
+    keys = {}
+    for provider_id in provider_ids:
+        day_key, hour_key = _counter_keys(provider_id, now)
+        keys[provider_id] = (day_key, hour_key, _last_used_key(provider_id))
+
+    try:
+        values = cache.get_many([key for provider_keys in keys.values() for key in provider_keys])
+    except Exception as e:
+        logger.warning(f"Could not read send counters: {str(e)}")
+        values = {}
+
+    counters = {}
+    for provider_id, (day_key, hour_key, last_used_key) in keys.items():
+        last_used = values.get(last_used_key)
+        counters[provider_id] = {
+            'sent_today': int(values.get(day_key) or 0),
+            'sent_this_hour': int(values.get(hour_key) or 0),
+            'last_used': datetime.fromtimestamp(last_used, tz=dt_timezone.utc) if last_used else None,
+        }
+    return counters
@@ -0,0 +1,166 @@
+import logging
+import time
+from typing import List, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_scripts = {}
+
+# Multi-window token bucket. KEYS holds one hash per window, ARGV is the number
+# of tokens wanted followed by a (capacity, window seconds, share held back
+# from this caller) triple per key. Every bucket refills
+# continuously at capacity / window tokens per second. As many tokens as all
+# windows can cover above their held-back share, up to the amount wanted, are
+# taken atomically. Returns {granted, milliseconds until the next token};
+# asking for 0 tokens only peeks.
+TOKEN_BUCKET_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local wanted = tonumber(ARGV[1])
+
+local available = wanted
+local tokens = {}
+local floors = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local window_ms = tonumber(ARGV[i * 3]) * 1000
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local current = tonumber(state[1])
+    local updated = tonumber(state[2])
+    if current == nil or updated == nil then
+        current = capacity
+    else
+        current = math.min(capacity, current + (now - updated) * capacity / window_ms)
+    end
+    tokens[i] = current
+    -- Always leave at least one token of a window for the caller
+    floors[i] = math.min(capacity * tonumber(ARGV[i * 3 + 1]), capacity - 1)
+    available = math.min(available, math.floor(current - floors[i]))
+end
+
+local granted = math.max(available, 0)
+local wait_ms = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local window_ms = tonumber(ARGV[i * 3]) * 1000
+    local remaining = tokens[i] - granted
+    if remaining - floors[i] < 1 then
+        wait_ms = math.max(wait_ms, math.ceil((floors[i] + 1 - remaining) * window_ms / capacity))
+    end
+    redis.call('HSET', key, 'tokens', tostring(remaining), 'ts', now)
+    redis.call('PEXPIRE', key, window_ms * 2)
+end
+return {granted, wait_ms}
+"""
+
+
+def get_redis():
+    """Raw redis-py client behind the default django_redis cache"""
+    from django_redis import get_redis_connection
+    return get_redis_connection('default')
+
+
+def get_script(source: str):
+    """
+    Lua script registered once per process and run with EVALSHA.
+    Returns: Callable redis-py Script
+    """
+    if source not in _scripts:
+        _scripts[source] = get_redis().register_script(source)
+    return _scripts[source]
+
+
+class TokenBucket:
+    """
+    Redis token bucket over one or more (capacity, window seconds) windows,
+    shared by every worker. Fails open when Redis is unavailable.
+    """
+
+    def __init__(self, key: str, windows: List[Tuple[int, int]], label: str = None, held_back: float = 0.0):
+        self.windows: List[Tuple[int, int]] = [(limit, seconds) for limit, seconds in windows if limit and limit > 0]
+        # The braces in ``key`` keep every window in the same cluster slot
+        self.keys = [f'{key}:{seconds}' for _, seconds in self.windows]
+        self.label = label or key
+        # The share of these windows left to callers sharing the bucket; windows appended later are not held back
+        self.held_back = held_back
+        self.quota_windows = len(self.windows)
+
+    def reserve(self, count: int = 1) -> Tuple[int, float]:
+        """
+        Take up to ``count`` tokens from every window.
+        Returns: (tokens granted, seconds until the next token is available)
+        """
+        if not self.windows:
+            return count, 0.0
+
+        args = [count]
+        for index, (limit, seconds) in enumerate(self.windows):
+            args.extend([limit, seconds, self.held_back if index < self.quota_windows else 0])
+
+        try:
+            granted, wait_ms = get_script(TOKEN_BUCKET_SCRIPT)(keys=self.keys, args=args)
+        except Exception as e:
+            logger.warning(f"Rate limiter unavailable for {self.label}, allowing send: {str(e)}")
+            return count, 0.0
+        return int(granted), int(wait_ms) / 1000
+
+    def acquire(self, count: int = 1, max_wait: float = None) -> Tuple[int, float]:
+        """
+        Reserve up to ``count`` tokens, sleeping while the wait for the next
+        token is no longer than ``max_wait`` seconds
+        (CAMPAIGN_RATE_LIMIT_MAX_SLEEP by default).
+        Returns: (tokens granted, seconds to wait when none were granted)
+        """
+        if max_wait is None:
+            max_wait = settings.CAMPAIGN_RATE_LIMIT_MAX_SLEEP
+        while True:
+            granted, wait = self.reserve(count)
+            if granted or wait > max_wait:
+                return granted, wait
+            time.sleep(wait)
+
+    def has_capacity(self) -> bool:
+        """Whether at least one send is currently allowed, without consuming it"""
+        granted, wait = self.reserve(0)
+        return wait == 0
+
+
+def bulk_share(limit: int) -> int:
+    """How much of a provider rate limit window the bulk lane may use"""
+    if limit <= 0:
+        return limit
+    return int(limit - min(limit * settings.CAMPAIGN_TRANSACTIONAL_RESERVE, limit - 1))
+
+
+class ProviderRateLimiter(TokenBucket):
+    """
+    Per-provider rate limiter over emails_per_second, emails_per_hour and
+    emails_per_day. The 'bulk' lane leaves CAMPAIGN_TRANSACTIONAL_RESERVE of
+    every window to the 'transactional' lane.
+    """
+
+    KEY_PREFIX = 'smtp_rate'
+    PACE_KEY_PREFIX = 'smtp_pace'
+
+    def __init__(self, provider, lane: str = 'bulk'):
+        self.provider = provider
+        self.lane = lane
+        super().__init__(
+            f'{self.KEY_PREFIX}:{{{provider.pk}}}',
+            [
+                (provider.emails_per_second, 1),
+                (provider.emails_per_hour, 3600),
+                (provider.emails_per_day, 86400),
+            ],
+            label=f'provider {provider.name}',
+            held_back=settings.CAMPAIGN_TRANSACTIONAL_RESERVE if lane == 'bulk' else 0.0,
+        )
+
+    def set_pace(self, rate: int = None):
+        """Limit sends to ``rate`` per second on top of the quotas; None removes the limit"""
+        del self.windows[self.quota_windows:], self.keys[self.quota_windows:]
+        if rate and rate > 0:
+            self.windows.append((rate, 1))
+            self.keys.append(f'{self.PACE_KEY_PREFIX}:{{{self.provider.pk}}}:1')
@@ -0,0 +1,93 @@
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Permanent failures that mean the address itself is bad
+HARD_BOUNCE_CODES = {550, 551, 553, 554}
+
+# Recipient fields written when a send is deferred
+RETRY_FIELDS = ['attempts', 'deferred_at', 'retry_at']
+
+
+def classify_failure(result: dict) -> str:
+    """
+    Classify a failed send by its SMTP reply code: 'soft' for temporary 4xx
+    replies worth retrying, 'hard' for permanent 5xx replies and 'error'
+    when the server gave no reply code (connection or API errors).
+    """
+    code = result.get('smtp_code')
+    if code is None:
+        return 'error'
+    return 'soft' if 400 <= code < 500 else 'hard'
+
+
+def is_hard_bounce(result: dict) -> bool:
+    """Whether a failed send means the recipient address does not exist"""
+    code = result.get('smtp_code')
+    if code is not None:
+        return code in HARD_BOUNCE_CODES
+    # API providers only report the reply in the error text
+    error = result.get('error', '')
+    return '550' in error or '554' in error
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with jitter: seconds before retry number ``attempt``"""
+    backoff = min(settings.CAMPAIGN_RETRY_BASE_DELAY * 2 ** (attempt - 1), settings.CAMPAIGN_RETRY_MAX_DELAY)
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def schedule_retry(recipient, now=None) -> bool:
+    """
+    Defer a CampaignRecipient after a soft failure, unless it has used up
+    CAMPAIGN_RETRY_MAX_ATTEMPTS or was first deferred more than
+    CAMPAIGN_RETRY_MAX_AGE seconds ago. Only updates the instance; the
+    caller saves the state and RETRY_FIELDS.
+    Returns: True if a retry was scheduled
+    """
+    now = now or timezone.now()
+    first_deferred = recipient.deferred_at or now
+    if recipient.attempts >= settings.CAMPAIGN_RETRY_MAX_ATTEMPTS:
+        return False
+    if (now - first_deferred).total_seconds() >= settings.CAMPAIGN_RETRY_MAX_AGE:
+        return False
+
+    recipient.attempts += 1
+    recipient.deferred_at = first_deferred
+    recipient.retry_at = now + timedelta(seconds=retry_delay(recipient.attempts))
+    recipient.state = 'deferred'
+    return True
+
+
+def claim_due_retries(limit: int) -> Dict[int, List[int]]:
+    """
+    Claim up to ``limit`` deferred recipients whose retry time has come,
+    oldest first, by moving them to 'queued'. Recipients of paused or
+    cancelled campaigns stay deferred. Rows locked by a concurrent poller
+    are skipped.
+    Returns: Dict of campaign id to claimed recipient ids
+    """
+    from .models import CampaignRecipient
+
+    with transaction.atomic():
+        CampaignRecipient.lock_for_claim()
+        due = list(
+            CampaignRecipient.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(state='deferred', retry_at__lte=timezone.now(), campaign__status__in=['sending', 'sent'])
+            .order_by('retry_at')
+            .values_list('id', 'campaign_id')[:limit]
+        )
+        CampaignRecipient.objects.filter(id__in=[recipient_id for recipient_id, _ in due]).update(state='queued')
+
+    claimed = defaultdict(list)
+    for recipient_id, campaign_id in due:
+        claimed[campaign_id].append(recipient_id)
+    return dict(claimed)
@@ -0,0 +1,54 @@
+import math
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+
+from .provider_registry import get_counters
+from .smtp_service import SMTPManager
+
+
+def window_end(campaign):
+    """When a paced campaign should have released its last recipient"""
+    return campaign.scheduled_at + timedelta(hours=campaign.send_window_hours)
+
+
+def campaign_capacity(campaign) -> Optional[int]:
+    """
+    Messages per minute the providers of a campaign can take: the sum of
+    SMTPManager.provider_weight over its allowed providers in 'multi' send
+    mode, otherwise that of its own provider.
+    Returns: Messages per minute, or None when no provider could be found
+    """
+    if campaign.send_mode == 'multi':
+        providers = SMTPManager.get_campaign_providers(campaign)
+    else:
+        providers = [campaign.smtp_provider] if campaign.smtp_provider else []
+    if not providers:
+        return None
+
+    counters = get_counters([provider.pk for provider in providers])
+    return sum(SMTPManager.provider_weight(provider, counters[provider.pk]) for provider in providers)
+
+
+def release_size(campaign, unreleased: int, now) -> int:
+    """
+    How many of a paced campaign's ``unreleased`` recipients to hand to the
+    send pipeline now, spread over the rest of its send window and capped by
+    what its providers can send
+    """
+    interval = settings.CAMPAIGN_SCHEDULER_INTERVAL
+    if campaign.released_at is None:
+        elapsed = interval
+    else:
+        elapsed = min((now - campaign.released_at).total_seconds(), interval * 2)
+    if elapsed <= 0 or not unreleased:
+        return 0
+
+    remaining = (window_end(campaign) - now).total_seconds() + elapsed
+    count = unreleased if remaining <= elapsed else math.ceil(unreleased * elapsed / remaining)
+
+    capacity = campaign_capacity(campaign)
+    if capacity is not None:
+        count = min(count, math.ceil(capacity * elapsed / 60))
+    return count
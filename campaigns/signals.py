@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import SMTPProvider
+from .provider_registry import RUNTIME_FIELDS, registry
+
+
+@receiver(post_save, sender=SMTPProvider)
+def invalidate_provider_registry_on_save(sender, instance, update_fields=None, **kwargs):
+    """Refresh cached provider configs everywhere, unless only send statistics changed"""
+    if update_fields and set(update_fields) <= RUNTIME_FIELDS:
+        return
+    registry.invalidate()
+
+
+@receiver(post_delete, sender=SMTPProvider)
+def invalidate_provider_registry_on_delete(sender, instance, **kwargs):
+    registry.invalidate()
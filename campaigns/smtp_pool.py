@@ -0,0 +1,206 @@
+import atexit
+import logging
+import smtplib
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection slot frees up within the acquire timeout"""
+
+
+class PooledConnection:
+    """An authenticated SMTP session plus the bookkeeping needed to recycle it"""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.message_count = 0
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    def idle_time(self) -> float:
+        return time.monotonic() - self.last_used
+
+    def close(self):
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+
+class ProviderConnectionPool:
+    """
+    Pool of authenticated SMTP sessions for a single SMTPProvider.
+
+    Connections are handed out LIFO so that the most recently used (and most
+    likely still alive) session is reused first. A connection is recycled once
+    it has sent ``max_messages`` messages or is older than ``max_age`` seconds.
+    """
+
+    # Idle connections older than this are probed with NOOP before reuse
+    PROBE_AFTER_IDLE = 15
+
+    def __init__(self, provider):
+        self.provider_id = provider.pk
+        self.fingerprint = self.make_fingerprint(provider)
+        self.max_size = max(1, provider.max_connections)
+        self.max_messages = max(1, provider.max_messages_per_connection)
+        self.max_age = max(1, provider.max_connection_age)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+
+    @staticmethod
+    def make_fingerprint(provider) -> tuple:
+        """Settings which, when changed, invalidate every open session"""
+        return (
+            provider.host, provider.port, provider.use_tls, provider.use_ssl,
+            provider.skip_tls_verify, provider.username, provider.password,
+            provider.max_connections, provider.max_messages_per_connection,
+            provider.max_connection_age,
+        )
+
+    def acquire(self, provider, timeout: Optional[float] = None) -> PooledConnection:
+        """Check out a live connection, opening a new one if none is idle"""
+        if not self._slots.acquire(timeout=timeout if timeout is not None else -1):
+            raise PoolExhausted(f'No SMTP connection available for provider {provider.name}')
+
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.pop() if self._idle else None
+                if conn is None:
+                    return PooledConnection(open_smtp_connection(provider))
+                if self._is_reusable(conn):
+                    return conn
+                conn.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn: PooledConnection, discard: bool = False):
+        """Return a connection to the pool, resetting it for the next transaction"""
+        try:
+            conn.last_used = time.monotonic()
+            if discard or self._is_expired(conn):
+                conn.close()
+                return
+            try:
+                conn.server.rset()
+            except smtplib.SMTPException:
+                conn.close()
+                return
+            with self._lock:
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _is_expired(self, conn: PooledConnection) -> bool:
+        return conn.message_count >= self.max_messages or conn.age() >= self.max_age
+
+    def _is_reusable(self, conn: PooledConnection) -> bool:
+        if self._is_expired(conn):
+            return False
+        if conn.idle_time() < self.PROBE_AFTER_IDLE:
+            return True
+        try:
+            code, _ = conn.server.noop()
+            return code == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+
+def open_smtp_connection(provider) -> smtplib.SMTP:
+    """Open, secure and authenticate an SMTP session for the given provider"""
+    # Special handling for Gmail
+    if provider.host == 'smtp.gmail.com':
+        # Gmail requires STARTTLS on port 587
+        server = smtplib.SMTP(provider.host, provider.port)
+        server.starttls()
+    else:
+        context = ssl.create_default_context()
+        if provider.skip_tls_verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+
+        if provider.use_ssl:
+            server = smtplib.SMTP_SSL(provider.host, provider.port, context=context)
+        else:
+            server = smtplib.SMTP(provider.host, provider.port)
+            if provider.use_tls:
+                server.starttls(context=context)
+
+    if provider.username and provider.password:
+        server.login(provider.username, provider.password)
+
+    return server
+
+
+_pools: Dict[int, ProviderConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(provider) -> ProviderConnectionPool:
+    """Return the process-wide pool for a provider, rebuilding it if the provider settings changed"""
+    fingerprint = ProviderConnectionPool.make_fingerprint(provider)
+    with _pools_lock:
+        pool = _pools.get(provider.pk)
+        if pool is not None and pool.fingerprint == fingerprint:
+            return pool
+        stale = pool
+        pool = _pools[provider.pk] = ProviderConnectionPool(provider)
+    if stale is not None:
+        logger.info(f'SMTP settings changed for provider {provider.name}, draining old connection pool')
+        stale.close_all()
+    return pool
+
+
+@contextmanager
+def smtp_connection(provider, timeout: Optional[float] = None):
+    """
+    Borrow a pooled connection for one SMTP transaction.
+
+    The connection is discarded rather than returned to the pool if the block
+    raises anything other than a per-message SMTP refusal.
+    """
+    pool = get_pool(provider)
+    conn = pool.acquire(provider, timeout=timeout)
+    discard = False
+    try:
+        yield conn
+    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+        raise
+    except Exception:
+        discard = True
+        raise
+    finally:
+        pool.release(conn, discard=discard)
+
+
+def close_all_pools():
+    """Close every idle pooled connection in this process"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+
+atexit.register(close_all_pools)
@@ -4,18 +4,49 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-import time
-from typing import Optional, Dict, Any
+import base64
+import json
+import os
+import random
+import re
+from email.utils import make_msgid
+from typing import Optional, Dict, Any, List, Tuple
 import logging
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-import requests
 from django.utils import timezone
+from .smtp_pool import smtp_connection
+from .http_pool import get_session
+from .aws_signing import sign_request
+from .attachment_cache import EncodedAttachment
+from .provider_registry import registry, get_counters, record_sent
+from .domain_throttle import smtp_reply_code
+from .circuit_breaker import CircuitBreaker, is_connection_error
+from .rate_limit import bulk_share
 
 logger = logging.getLogger(__name__)
 
+# Provider types that deliver over an HTTP API rather than SMTP
+API_PROVIDER_TYPES = ['sendgrid', 'mailgun', 'ses', 'postmark']
+
+# Most recipients a provider's batch API takes in one request
+API_BATCH_LIMITS = {
+    'sendgrid': 1000,  # personalizations per /v3/mail/send
+    'postmark': 500,  # messages per /email/batch
+    'mailgun': 1000,  # recipients per message with recipient-variables
+    'ses': 50,  # entries per SES v2 SendBulkEmail
+}
+
+# Batch APIs that send each message with the Message-ID we give it
+CUSTOM_MESSAGE_ID_PROVIDERS = {'sendgrid', 'mailgun'}
+
+
+def new_message_id(from_email: str) -> str:
+    """A globally unique Message-ID in the sender's domain"""
+    return make_msgid(domain=from_email.rpartition('@')[2] or None)
+
 
 class SMTPService:
     """Comprehensive SMTP service for email delivery"""
@@ -30,7 +61,7 @@ class SMTPService:
         Returns: Dict with success status and message
         """
         try:
-            if self.provider.provider_type in ['sendgrid', 'mailgun', 'ses', 'postmark']:
+            if self.provider.provider_type in API_PROVIDER_TYPES:
                 return self._test_api_connection()
             else:
                 return self._test_smtp_connection(recipient_email=recipient_email)
@@ -168,13 +199,13 @@ class SMTPService:
 
     def _test_sendgrid_connection(self) -> Dict[str, Any]:
         """Test SendGrid API connection"""
-        url = "https://api.sendgrid.com/v3/user/email"
+        url = f"{settings.SENDGRID_API_URL}/v3/user/email"
         headers = {
             'Authorization': f'Bearer {self.provider.api_key}',
             'Content-Type': 'application/json'
         }
 
-        response = requests.get(url, headers=headers)
+        response = get_session(self.provider).get(url, headers=headers)
         if response.status_code == 200:
             return {
                 'success': True,
@@ -188,29 +219,43 @@ class SMTPService:
 
     def _test_mailgun_connection(self) -> Dict[str, Any]:
         """Test Mailgun API connection"""
-        # Mailgun validation would go here
-        return {
-            'success': True,
-            'message': 'Mailgun API connection test (implement based on Mailgun docs)'
-        }
+        url = f"{settings.MAILGUN_API_URL}/v3/domains/{self._mailgun_domain()}"
+
+        response = get_session(self.provider).get(url, auth=('api', self.provider.api_key))
+        if response.status_code == 200:
+            return {
+                'success': True,
+                'message': 'Mailgun API connection successful'
+            }
+        else:
+            return {
+                'success': False,
+                'message': f'Mailgun API error: {response.status_code} - {response.text}'
+            }
 
     def _test_ses_connection(self) -> Dict[str, Any]:
         """Test Amazon SES connection"""
-        # SES validation would go here
-        return {
-            'success': True,
-            'message': 'Amazon SES connection test (implement based on AWS SES docs)'
-        }
+        response = self._ses_request('GET', '/v2/email/account')
+        if response.status_code == 200:
+            return {
+                'success': True,
+                'message': 'Amazon SES API connection successful'
+            }
+        else:
+            return {
+                'success': False,
+                'message': f'Amazon SES API error: {response.status_code} - {response.text}'
+            }
 
     def _test_postmark_connection(self) -> Dict[str, Any]:
         """Test Postmark API connection"""
-        url = "https://api.postmarkapp.com/sender"
+        url = f"{settings.POSTMARK_API_URL}/sender"
         headers = {
             'X-Postmark-Server-Token': self.provider.api_key,
             'Content-Type': 'application/json'
         }
 
-        response = requests.get(url, headers=headers)
+        response = get_session(self.provider).get(url, headers=headers)
         if response.status_code == 200:
             return {
                 'success': True,
@@ -241,7 +286,7 @@ class SMTPService:
             final_from_email = from_email or self.provider.from_email
             final_from_name = from_name or self.provider.from_name
 
-            if self.provider.provider_type in ['sendgrid', 'mailgun', 'ses', 'postmark']:
+            if self.provider.provider_type in API_PROVIDER_TYPES:
                 return self._send_via_api(to_email, subject, html_content, text_content, attachments, final_from_email, final_from_name, cc_recipients, bcc_recipients)
             else:
                 return self._send_via_smtp(to_email, subject, html_content, text_content, attachments, final_from_email, final_from_name, cc_recipients, bcc_recipients)
@@ -249,71 +294,65 @@ class SMTPService:
             logger.error(f"Email sending failed for {to_email}: {str(e)}")
             return {
                 'success': False,
-                'error': str(e)
+                'error': str(e),
+                'connection_error': is_connection_error(e)
             }
 
-    def _send_via_smtp(self, to_email: str, subject: str, html_content: str,
-                       text_content: str = None, attachments: list = None,
-                       from_email: str = None, from_name: str = None,
-                       cc_recipients: list = None, bcc_recipients: list = None) -> Dict[str, Any]:
-        """Send email via traditional SMTP"""
-        try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = f"{from_name} <{from_email}>"
-            msg['To'] = to_email
+    def build_message(self, to_email: str, subject: str, html_content: str,
+                      text_content: str = None, attachments: list = None,
+                      from_email: str = None, from_name: str = None,
+                      cc_recipients: list = None, bcc_recipients: list = None,
+                      message_id: str = None) -> Tuple[str, list]:
+        """
+        Build the MIME message for one recipient
+        Returns: Tuple of the serialized message and the full SMTP envelope recipient list
+        """
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = f"{from_name} <{from_email}>"
+        msg['To'] = to_email
+        if message_id:
+            msg['Message-ID'] = message_id
 
-            if cc_recipients:
-                msg['Cc'] = ', '.join(cc_recipients)
-            
-            all_recipients = [to_email]
-            if cc_recipients:
-                all_recipients.extend(cc_recipients)
-            if bcc_recipients:
-                all_recipients.extend(bcc_recipients)
+        if cc_recipients:
+            msg['Cc'] = ', '.join(cc_recipients)
 
-            if self.provider.reply_to_email:
-                msg['Reply-To'] = self.provider.reply_to_email
+        all_recipients = [to_email]
+        if cc_recipients:
+            all_recipients.extend(cc_recipients)
+        if bcc_recipients:
+            all_recipients.extend(bcc_recipients)
 
-            # Add content
-            if text_content:
-                msg.attach(MIMEText(text_content, 'plain'))
-            msg.attach(MIMEText(html_content, 'html'))
+        if self.provider.reply_to_email:
+            msg['Reply-To'] = self.provider.reply_to_email
 
-            # Add attachments
-            if attachments:
-                for attachment in attachments:
-                    self._add_attachment(msg, attachment)
+        # Add content
+        if text_content:
+            msg.attach(MIMEText(text_content, 'plain'))
+        msg.attach(MIMEText(html_content, 'html'))
 
-            # Send email
-            # Special handling for Gmail
-            if self.provider.host == 'smtp.gmail.com':
-                server = smtplib.SMTP(self.provider.host, self.provider.port)
-                server.starttls()
-            else:
-                context = ssl.create_default_context()
-                if self.provider.skip_tls_verify:
-                    context.check_hostname = False
-                    context.verify_mode = ssl.CERT_NONE
+        # Add attachments
+        if attachments:
+            for attachment in attachments:
+                self._add_attachment(msg, attachment)
 
-                if self.provider.use_ssl:
-                    server = smtplib.SMTP_SSL(self.provider.host, self.provider.port, context=context)
-                else:
-                    server = smtplib.SMTP(self.provider.host, self.provider.port)
-                    if self.provider.use_tls:
-                        server.starttls(context=context)
-
-            if self.provider.username and self.provider.password:
-                server.login(self.provider.username, self.provider.password)
+        return msg.as_string(), all_recipients
 
-            # Send the email
-            text = msg.as_string()
-            server.sendmail(from_email, all_recipients, text)
-            server.quit()
+    def _send_via_smtp(self, to_email: str, subject: str, html_content: str,
+                       text_content: str = None, attachments: list = None,
+                       from_email: str = None, from_name: str = None,
+                       cc_recipients: list = None, bcc_recipients: list = None) -> Dict[str, Any]:
+        """Send email via traditional SMTP"""
+        try:
+            # A real Message-ID header, so bounces and replies can be matched to the log
+            message_id = new_message_id(from_email)
+            text, all_recipients = self.build_message(
+                to_email, subject, html_content, text_content, attachments,
+                from_email, from_name, cc_recipients, bcc_recipients, message_id
+            )
 
-            # Generate a message ID for tracking
-            message_id = f"{int(time.time())}@{self.provider.host}"
+            # Send the email over a pooled, already-authenticated session
+            self._deliver_via_pool(from_email, all_recipients, text)
 
             return {
                 'success': True,
@@ -323,19 +362,63 @@ class SMTPService:
         except Exception as e:
             return {
                 'success': False,
-                'error': str(e)
+                'error': str(e),
+                'smtp_code': smtp_reply_code(e),
+                'connection_error': is_connection_error(e)
             }
 
+    def send_raw(self, from_email: str, recipients: list, message: bytes,
+                 message_id: str = None) -> Dict[str, Any]:
+        """
+        Send an already serialized message over a pooled SMTP session
+        Returns: Dict with success status and message_id or error
+        """
+        try:
+            self._deliver_via_pool(from_email, recipients, message)
+            return {
+                'success': True,
+                'message_id': message_id or new_message_id(from_email)
+            }
+        except Exception as e:
+            logger.error(f"Email sending failed for {recipients[0]}: {str(e)}")
+            return {
+                'success': False,
+                'error': str(e),
+                'smtp_code': smtp_reply_code(e),
+                'connection_error': is_connection_error(e)
+            }
+
+    def _deliver_via_pool(self, from_email: str, recipients: list, message):
+        """
+        Run one SMTP transaction on a pooled connection.
+
+        A connection that turns out to be dead mid-transaction is discarded and
+        the message is retried once on a fresh session.
+        """
+        for attempt in range(2):
+            try:
+                with smtp_connection(self.provider) as conn:
+                    conn.server.sendmail(from_email, recipients, message)
+                    conn.message_count += 1
+                    return
+            except smtplib.SMTPServerDisconnected:
+                if attempt:
+                    raise
+                logger.info(f"Pooled SMTP connection to {self.provider.host} was closed, reconnecting")
+
     def _send_via_api(self, to_email: str, subject: str, html_content: str,
                       text_content: str = None, attachments: list = None,
                       from_email: str = None, from_name: str = None,
                       cc_recipients: list = None, bcc_recipients: list = None) -> Dict[str, Any]:
         """Send email via API-based services"""
         if self.provider.provider_type == 'sendgrid':
-            return self._send_sendgrid_email(to_email, subject, html_content, text_content, from_email, from_name, cc_recipients, bcc_recipients)
+            return self._send_sendgrid_email(to_email, subject, html_content, text_content, from_email, from_name, cc_recipients, bcc_recipients, attachments)
         elif self.provider.provider_type == 'postmark':
-            return self._send_postmark_email(to_email, subject, html_content, text_content, from_email, from_name, cc_recipients, bcc_recipients)
-        # Add other API providers as needed
+            return self._send_postmark_email(to_email, subject, html_content, text_content, from_email, from_name, cc_recipients, bcc_recipients, attachments)
+        elif self.provider.provider_type == 'mailgun':
+            return self._send_mailgun_email(to_email, subject, html_content, text_content, from_email, from_name, cc_recipients, bcc_recipients, attachments)
+        elif self.provider.provider_type == 'ses':
+            return self._send_ses_email(to_email, subject, html_content, text_content, from_email, from_name, cc_recipients, bcc_recipients, attachments)
         else:
             return {
                 'success': False,
@@ -344,9 +427,10 @@ class SMTPService:
 
     def _send_sendgrid_email(self, to_email: str, subject: str, html_content: str,
                              text_content: str = None, from_email: str = None, from_name: str = None,
-                             cc_recipients: list = None, bcc_recipients: list = None) -> Dict[str, Any]:
+                             cc_recipients: list = None, bcc_recipients: list = None,
+                             attachments: list = None) -> Dict[str, Any]:
         """Send email via SendGrid API"""
-        url = "https://api.sendgrid.com/v3/mail/send"
+        url = f"{settings.SENDGRID_API_URL}/v3/mail/send"
         headers = {
             'Authorization': f'Bearer {self.provider.api_key}',
             'Content-Type': 'application/json'
@@ -377,24 +461,29 @@ class SMTPService:
         if self.provider.reply_to_email:
             data['reply_to'] = {'email': self.provider.reply_to_email}
 
-        response = requests.post(url, headers=headers, json=data)
+        if attachments:
+            data['attachments'] = self._sendgrid_attachments(attachments)
+
+        response = get_session(self.provider).post(url, headers=headers, json=data)
 
         if response.status_code in [200, 201, 202]:
             return {
                 'success': True,
-                'message_id': response.headers.get('X-Message-Id', 'sendgrid-' + str(int(time.time())))
+                'message_id': response.headers.get('X-Message-Id', new_message_id(from_email))
             }
         else:
             return {
                 'success': False,
-                'error': f'SendGrid API error: {response.status_code} - {response.text}'
+                'error': f'SendGrid API error: {response.status_code} - {response.text}',
+                'status_code': response.status_code
             }
 
     def _send_postmark_email(self, to_email: str, subject: str, html_content: str,
                              text_content: str = None, from_email: str = None, from_name: str = None,
-                             cc_recipients: list = None, bcc_recipients: list = None) -> Dict[str, Any]:
+                             cc_recipients: list = None, bcc_recipients: list = None,
+                             attachments: list = None) -> Dict[str, Any]:
         """Send email via Postmark API"""
-        url = "https://api.postmarkapp.com/email"
+        url = f"{settings.POSTMARK_API_URL}/email"
         headers = {
             'X-Postmark-Server-Token': self.provider.api_key,
             'Content-Type': 'application/json'
@@ -419,27 +508,539 @@ class SMTPService:
         if self.provider.reply_to_email:
             data['ReplyTo'] = self.provider.reply_to_email
 
-        response = requests.post(url, headers=headers, json=data)
+        if attachments:
+            data['Attachments'] = self._postmark_attachments(attachments)
+
+        response = get_session(self.provider).post(url, headers=headers, json=data)
+
+        if response.status_code == 200:
+            return {
+                'success': True,
+                'message_id': response.json().get('MessageID', new_message_id(from_email))
+            }
+        else:
+            return {
+                'success': False,
+                'error': f'Postmark API error: {response.status_code} - {response.text}',
+                'status_code': response.status_code
+            }
+
+    def supports_batch(self) -> bool:
+        """Whether send_batch() can pack several recipients into one API request"""
+        return self.provider.provider_type in API_BATCH_LIMITS
+
+    def send_batch(self, to_emails: List[str], subject: str, html_content: str,
+                   text_content: str = None, substitutions: List[dict] = None,
+                   from_email: str = None, from_name: str = None,
+                   cc_recipients: list = None, bcc_recipients: list = None,
+                   message_ids: List[str] = None, attachments: list = None) -> List[Dict[str, Any]]:
+        """
+        Send one message to many recipients in as few API requests as the
+        provider's batch limit allows. ``substitutions`` holds one dict of
+        substitution tag to value per recipient, applied to the subject and
+        content. ``message_ids`` optionally gives each message its
+        Message-ID, where the provider allows it.
+        Returns: List of result dicts, one per recipient and in the same order
+        """
+        from_email = from_email or self.provider.from_email
+        from_name = from_name or self.provider.from_name
+        substitutions = substitutions or [{} for _ in to_emails]
+        limit = API_BATCH_LIMITS.get(self.provider.provider_type)
+        if limit is None:
+            return [{'success': False, 'error': 'Batch sending not supported by this provider'} for _ in to_emails]
+
+        send = {
+            'sendgrid': self._send_sendgrid_batch,
+            'postmark': self._fill_postmark_batch,
+            'mailgun': self._send_mailgun_batch,
+            'ses': self._send_ses_batch,
+        }[self.provider.provider_type]
+
+        results = []
+        for start in range(0, len(to_emails), limit):
+            batch = to_emails[start:start + limit]
+            extra = {}
+            if message_ids and self.provider.provider_type in CUSTOM_MESSAGE_ID_PROVIDERS:
+                extra['message_ids'] = message_ids[start:start + limit]
+            if attachments:
+                extra['attachments'] = attachments
+            try:
+                results.extend(send(
+                    batch, subject, html_content, text_content, substitutions[start:start + limit],
+                    from_email, from_name, cc_recipients, bcc_recipients, **extra
+                ))
+            except Exception as e:
+                logger.error(f"Batch send of {len(batch)} emails via {self.provider.name} failed: {str(e)}")
+                failure = {'success': False, 'error': str(e), 'connection_error': is_connection_error(e)}
+                results.extend(dict(failure) for _ in batch)
+        return results
+
+    def _send_sendgrid_batch(self, to_emails: List[str], subject: str, html_content: str,
+                             text_content: str, substitutions: List[dict], from_email: str, from_name: str,
+                             cc_recipients: list = None, bcc_recipients: list = None,
+                             message_ids: List[str] = None, attachments: list = None) -> List[Dict[str, Any]]:
+        """One /v3/mail/send request with a personalization per recipient"""
+        url = f"{settings.SENDGRID_API_URL}/v3/mail/send"
+        headers = {
+            'Authorization': f'Bearer {self.provider.api_key}',
+            'Content-Type': 'application/json'
+        }
+
+        # SendGrid reports one status for the whole request, so each message
+        # carries its own Message-ID for bounces and webhooks to refer to
+        message_ids = message_ids or [new_message_id(from_email) for _ in to_emails]
+        personalizations = []
+        for to_email, values, message_id in zip(to_emails, substitutions, message_ids):
+            personalization = {
+                'to': [{'email': to_email}],
+                'headers': {'Message-ID': message_id},
+                'custom_args': {'message_id': message_id},
+            }
+            if values:
+                personalization['substitutions'] = values
+            if cc_recipients:
+                personalization['cc'] = [{'email': email} for email in cc_recipients]
+            if bcc_recipients:
+                personalization['bcc'] = [{'email': email} for email in bcc_recipients]
+            personalizations.append(personalization)
+
+        data = {
+            'personalizations': personalizations,
+            'from': {
+                'email': from_email,
+                'name': from_name
+            },
+            'subject': subject,
+            'content': []
+        }
+        if text_content:
+            data['content'].append({'type': 'text/plain', 'value': text_content})
+        data['content'].append({'type': 'text/html', 'value': html_content})
+
+        if self.provider.reply_to_email:
+            data['reply_to'] = {'email': self.provider.reply_to_email}
+
+        if attachments:
+            data['attachments'] = self._sendgrid_attachments(attachments)
+
+        response = get_session(self.provider).post(url, headers=headers, json=data)
+
+        if response.status_code in [200, 201, 202]:
+            return [{'success': True, 'message_id': message_id} for message_id in message_ids]
+        error = f'SendGrid API error: {response.status_code} - {response.text}'
+        return [{'success': False, 'error': error, 'status_code': response.status_code} for _ in to_emails]
+
+    @staticmethod
+    def _retag(contents: list, substitutions: List[dict], tag_for, literals: dict = None) -> Tuple[list, List[dict]]:
+        """
+        Rewrite substitution tags into a provider's own placeholder syntax.
+        ``tag_for`` turns a variable name into the provider's placeholder and
+        ``literals`` maps text outside the tags to what it must be replaced
+        with, e.g. to escape the provider's own template syntax.
+        Returns: (rewritten contents, per-recipient dicts keyed by variable name)
+        """
+        tags = sorted(set().union(*substitutions), key=len, reverse=True)
+        literals = literals or {}
+        if not tags and not literals:
+            return contents, [{} for _ in substitutions]
+        names = {tag: f'v{index}' for index, tag in enumerate(tags)}
+        replacements = {tag: tag_for(name) for tag, name in names.items()}
+        # Tags come first in the pattern, so they win over literals at the same position
+        pattern = re.compile('|'.join(
+            [re.escape(tag) for tag in tags]
+            + [re.escape(literal) for literal in sorted(literals, key=len, reverse=True) if literal not in replacements]
+        ))
+        replacements = {**literals, **replacements}
+        rewritten = [
+            pattern.sub(lambda match: replacements[match.group(0)], content) if content else content
+            for content in contents
+        ]
+        variables = [{names[tag]: value for tag, value in values.items()} for values in substitutions]
+        return rewritten, variables
+
+    def _mailgun_domain(self) -> str:
+        """The Mailgun sending domain: that of the SMTP login (postmaster@domain), else of the sender"""
+        if '@' in self.provider.username:
+            return self.provider.username.rpartition('@')[2]
+        return self.provider.from_email.rpartition('@')[2]
+
+    def _send_mailgun_email(self, to_email: str, subject: str, html_content: str,
+                            text_content: str = None, from_email: str = None, from_name: str = None,
+                            cc_recipients: list = None, bcc_recipients: list = None,
+                            attachments: list = None) -> Dict[str, Any]:
+        """Send email via Mailgun API"""
+        url = f"{settings.MAILGUN_API_URL}/v3/{self._mailgun_domain()}/messages"
+
+        data = [
+            ('from', f"{from_name} <{from_email}>"),
+            ('to', to_email),
+            ('subject', subject),
+            ('html', html_content),
+        ]
+        if text_content:
+            data.append(('text', text_content))
+        if cc_recipients:
+            data.append(('cc', ', '.join(cc_recipients)))
+        if bcc_recipients:
+            data.append(('bcc', ', '.join(bcc_recipients)))
+        if self.provider.reply_to_email:
+            data.append(('h:Reply-To', self.provider.reply_to_email))
+
+        response = get_session(self.provider).post(
+            url, auth=('api', self.provider.api_key), data=data, files=self._mailgun_attachments(attachments)
+        )
+
+        if response.status_code == 200:
+            return {
+                'success': True,
+                'message_id': response.json().get('id', new_message_id(from_email))
+            }
+        else:
+            return {
+                'success': False,
+                'error': f'Mailgun API error: {response.status_code} - {response.text}',
+                'status_code': response.status_code
+            }
+
+    def _send_mailgun_batch(self, to_emails: List[str], subject: str, html_content: str,
+                            text_content: str, substitutions: List[dict], from_email: str, from_name: str,
+                            cc_recipients: list = None, bcc_recipients: list = None,
+                            message_ids: List[str] = None, attachments: list = None) -> List[Dict[str, Any]]:
+        """One Mailgun message to many recipients, personalized with recipient-variables"""
+        url = f"{settings.MAILGUN_API_URL}/v3/{self._mailgun_domain()}/messages"
+        (subject, html_content, text_content), variables = self._retag(
+            [subject, html_content, text_content], substitutions, lambda name: f'%recipient.{name}%'
+        )
+
+        # Mailgun returns one id for the whole request, so each message gets
+        # its own Message-Id header through recipient-variables, and the same
+        # id as a custom variable for webhooks to refer to
+        message_ids = message_ids or [new_message_id(from_email) for _ in to_emails]
+        recipient_variables = {}
+        for to_email, values, message_id in zip(to_emails, variables, message_ids):
+            recipient_variables[to_email] = dict(values, message_id=message_id)
+
+        data = [
+            ('from', f"{from_name} <{from_email}>"),
+            ('subject', subject),
+            ('html', html_content),
+            ('recipient-variables', json.dumps(recipient_variables)),
+            ('h:Message-Id', '%recipient.message_id%'),
+            ('v:message_id', '%recipient.message_id%'),
+        ]
+        data.extend(('to', to_email) for to_email in to_emails)
+        if text_content:
+            data.append(('text', text_content))
+        if cc_recipients:
+            data.append(('cc', ', '.join(cc_recipients)))
+        if bcc_recipients:
+            data.append(('bcc', ', '.join(bcc_recipients)))
+        if self.provider.reply_to_email:
+            data.append(('h:Reply-To', self.provider.reply_to_email))
+
+        response = get_session(self.provider).post(
+            url, auth=('api', self.provider.api_key), data=data, files=self._mailgun_attachments(attachments)
+        )
+
+        if response.status_code == 200:
+            return [{'success': True, 'message_id': message_id} for message_id in message_ids]
+        error = f'Mailgun API error: {response.status_code} - {response.text}'
+        return [{'success': False, 'error': error, 'status_code': response.status_code} for _ in to_emails]
+
+    def _ses_request(self, method: str, path: str, payload: dict = None):
+        """Call the SES v2 API, signing the request with the provider's access key (api_key) and secret (api_secret)"""
+        region = settings.AWS_SES_REGION_NAME
+        url = f"{settings.SES_API_URL or f'https://email.{region}.amazonaws.com'}{path}"
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        headers = sign_request(
+            method, url, body, self.provider.api_key, self.provider.api_secret, region, 'ses',
+            headers={'Content-Type': 'application/json'},
+        )
+        return get_session(self.provider).request(method, url, headers=headers, data=body)
+
+    def _ses_destination(self, to_email: str, cc_recipients: list = None, bcc_recipients: list = None) -> dict:
+        destination = {'ToAddresses': [to_email]}
+        if cc_recipients:
+            destination['CcAddresses'] = cc_recipients
+        if bcc_recipients:
+            destination['BccAddresses'] = bcc_recipients
+        return destination
+
+    def _send_ses_email(self, to_email: str, subject: str, html_content: str,
+                        text_content: str = None, from_email: str = None, from_name: str = None,
+                        cc_recipients: list = None, bcc_recipients: list = None,
+                        attachments: list = None) -> Dict[str, Any]:
+        """Send email via the Amazon SES v2 API"""
+        if attachments:
+            # Simple content has no attachments, so the whole MIME message is sent
+            message, _ = self.build_message(
+                to_email, subject, html_content, text_content, attachments, from_email, from_name, cc_recipients
+            )
+            content = {'Raw': {'Data': base64.b64encode(message.encode('utf-8')).decode('ascii')}}
+        else:
+            body = {'Html': {'Data': html_content, 'Charset': 'UTF-8'}}
+            if text_content:
+                body['Text'] = {'Data': text_content, 'Charset': 'UTF-8'}
+            content = {'Simple': {'Subject': {'Data': subject, 'Charset': 'UTF-8'}, 'Body': body}}
+
+        payload = {
+            'FromEmailAddress': f"{from_name} <{from_email}>",
+            'Destination': self._ses_destination(to_email, cc_recipients, bcc_recipients),
+            'Content': content,
+        }
+        if self.provider.reply_to_email:
+            payload['ReplyToAddresses'] = [self.provider.reply_to_email]
+
+        response = self._ses_request('POST', '/v2/email/outbound-emails', payload)
 
         if response.status_code == 200:
             return {
                 'success': True,
-                'message_id': response.json().get('MessageID', 'postmark-' + str(int(time.time())))
+                'message_id': response.json().get('MessageId', new_message_id(from_email))
             }
         else:
             return {
                 'success': False,
-                'error': f'Postmark API error: {response.status_code} - {response.text}'
+                'error': f'Amazon SES API error: {response.status_code} - {response.text}',
+                'status_code': response.status_code
             }
 
+    def _send_ses_batch(self, to_emails: List[str], subject: str, html_content: str,
+                        text_content: str, substitutions: List[dict], from_email: str, from_name: str,
+                        cc_recipients: list = None, bcc_recipients: list = None,
+                        attachments: list = None) -> List[Dict[str, Any]]:
+        """One SES v2 SendBulkEmail request with an inline template and per-recipient template data"""
+        if attachments:
+            # Bulk templates cannot carry attachments, so each message is sent on its own
+            return [self.send_email(**email) for email in self._fill_substitutions(
+                to_emails, subject, html_content, text_content, substitutions,
+                from_email, from_name, cc_recipients, bcc_recipients, attachments
+            )]
+
+        # Triple braces, since HTML values are already escaped. Braces of the
+        # content itself come from template data too, so a literal {{ in the
+        # HTML is never read as a Handlebars tag
+        (subject, html_content, text_content), variables = self._retag(
+            [subject, html_content, text_content], substitutions, lambda name: '{{{' + name + '}}}',
+            literals={'{': '{{{lb}}}', '}': '{{{rb}}}'},
+        )
+        variables = [dict(values, lb='{', rb='}') for values in variables]
+
+        template = {'Subject': subject, 'Html': html_content}
+        if text_content:
+            template['Text'] = text_content
+
+        payload = {
+            'FromEmailAddress': f"{from_name} <{from_email}>",
+            'DefaultContent': {'Template': {'TemplateContent': template, 'TemplateData': '{}'}},
+            'BulkEmailEntries': [
+                {
+                    'Destination': self._ses_destination(to_email, cc_recipients, bcc_recipients),
+                    'ReplacementEmailContent': {
+                        'ReplacementTemplate': {'ReplacementTemplateData': json.dumps(values)}
+                    },
+                }
+                for to_email, values in zip(to_emails, variables)
+            ],
+        }
+        if self.provider.reply_to_email:
+            payload['ReplyToAddresses'] = [self.provider.reply_to_email]
+
+        response = self._ses_request('POST', '/v2/email/outbound-bulk-emails', payload)
+
+        if response.status_code != 200:
+            error = f'Amazon SES API error: {response.status_code} - {response.text}'
+            return [{'success': False, 'error': error, 'status_code': response.status_code} for _ in to_emails]
+
+        # One entry per destination, in request order
+        results = []
+        for entry in response.json().get('BulkEmailEntryResults', []):
+            if entry.get('Status') == 'SUCCESS':
+                results.append({'success': True, 'message_id': entry.get('MessageId', '')})
+            else:
+                results.append({
+                    'success': False,
+                    'error': f"Amazon SES API error: {entry.get('Status')} - {entry.get('Error', '')}"
+                })
+        if len(results) != len(to_emails):
+            error = f'Amazon SES API error: expected {len(to_emails)} results, got {len(results)}'
+            return [{'success': False, 'error': error} for _ in to_emails]
+        return results
+
+    def send_email_batch(self, emails: List[dict]) -> List[Dict[str, Any]]:
+        """
+        Send fully personalized messages, each given as send_email keyword
+        arguments, packed into Postmark batch requests. Other providers send
+        them one by one.
+        Returns: List of result dicts, one per message and in the same order
+        """
+        if self.provider.provider_type != 'postmark':
+            return [self.send_email(**email) for email in emails]
+
+        limit = API_BATCH_LIMITS['postmark']
+        results = []
+        for start in range(0, len(emails), limit):
+            batch = emails[start:start + limit]
+            try:
+                results.extend(self._send_postmark_batch(batch))
+            except Exception as e:
+                logger.error(f"Batch send of {len(batch)} emails via {self.provider.name} failed: {str(e)}")
+                failure = {'success': False, 'error': str(e), 'connection_error': is_connection_error(e)}
+                results.extend(dict(failure) for _ in batch)
+        return results
+
+    def _fill_postmark_batch(self, to_emails: List[str], subject: str, html_content: str,
+                             text_content: str, substitutions: List[dict], from_email: str, from_name: str,
+                             cc_recipients: list = None, bcc_recipients: list = None,
+                             attachments: list = None) -> List[Dict[str, Any]]:
+        """Postmark has no substitution tags, so they are filled in here before sending"""
+        return self._send_postmark_batch(self._fill_substitutions(
+            to_emails, subject, html_content, text_content, substitutions,
+            from_email, from_name, cc_recipients, bcc_recipients, attachments
+        ))
+
+    @staticmethod
+    def _fill_substitutions(to_emails: List[str], subject: str, html_content: str,
+                            text_content: str, substitutions: List[dict], from_email: str, from_name: str,
+                            cc_recipients: list = None, bcc_recipients: list = None,
+                            attachments: list = None) -> List[dict]:
+        """
+        Fill substitution tags in for each recipient
+        Returns: List of send_email keyword arguments, one per recipient
+        """
+        tags = set().union(*substitutions)
+        pattern = re.compile('|'.join(re.escape(tag) for tag in sorted(tags, key=len, reverse=True))) if tags else None
+
+        def fill(content, values):
+            if content is None or pattern is None:
+                return content
+            return pattern.sub(lambda match: values.get(match.group(0), ''), content)
+
+        return [
+            {
+                'to_email': to_email,
+                'subject': fill(subject, values),
+                'html_content': fill(html_content, values),
+                'text_content': fill(text_content, values),
+                'from_email': from_email,
+                'from_name': from_name,
+                'cc_recipients': cc_recipients,
+                'bcc_recipients': bcc_recipients,
+                'attachments': attachments,
+            }
+            for to_email, values in zip(to_emails, substitutions)
+        ]
+
+    def _send_postmark_batch(self, emails: List[dict]) -> List[Dict[str, Any]]:
+        """One /email/batch request for up to 500 personalized messages"""
+        url = f"{settings.POSTMARK_API_URL}/email/batch"
+        headers = {
+            'X-Postmark-Server-Token': self.provider.api_key,
+            'Content-Type': 'application/json'
+        }
+
+        messages = []
+        for email in emails:
+            from_email = email.get('from_email') or self.provider.from_email
+            from_name = email.get('from_name') or self.provider.from_name
+            message = {
+                'From': f"{from_name} <{from_email}>",
+                'To': email['to_email'],
+                'Subject': email['subject'],
+                'HtmlBody': email['html_content'],
+            }
+            if email.get('cc_recipients'):
+                message['Cc'] = ', '.join(email['cc_recipients'])
+            if email.get('bcc_recipients'):
+                message['Bcc'] = ', '.join(email['bcc_recipients'])
+            if email.get('text_content'):
+                message['TextBody'] = email['text_content']
+            if self.provider.reply_to_email:
+                message['ReplyTo'] = self.provider.reply_to_email
+            if email.get('attachments'):
+                message['Attachments'] = self._postmark_attachments(email['attachments'])
+            messages.append(message)
+
+        response = get_session(self.provider).post(url, headers=headers, json=messages)
+
+        if response.status_code != 200:
+            error = f'Postmark API error: {response.status_code} - {response.text}'
+            return [{'success': False, 'error': error, 'status_code': response.status_code} for _ in emails]
+
+        # One entry per message, in request order
+        results = []
+        for entry in response.json():
+            if entry.get('ErrorCode', 0) == 0:
+                results.append({'success': True, 'message_id': entry.get('MessageID', '')})
+            else:
+                results.append({
+                    'success': False,
+                    'error': f"Postmark API error: {entry.get('ErrorCode')} - {entry.get('Message', '')}"
+                })
+        if len(results) != len(emails):
+            error = f'Postmark API error: expected {len(emails)} results, got {len(results)}'
+            return [{'success': False, 'error': error} for _ in emails]
+        return results
+
+    @staticmethod
+    def _encode_attachments(attachments: list) -> List[Tuple[str, str]]:
+        """
+        Base64-encode attachments for the JSON APIs
+        Returns: List of (filename, base64 content) tuples
+        """
+        encoded = []
+        for attachment in attachments or []:
+            if isinstance(attachment, EncodedAttachment):
+                encoded.append((attachment.filename, attachment.payload().replace('\r\n', '')))
+                continue
+            attachment.open('rb')
+            try:
+                content = attachment.read()
+            finally:
+                attachment.close()
+            encoded.append((os.path.basename(attachment.name), base64.b64encode(content).decode('ascii')))
+        return encoded
+
+    def _sendgrid_attachments(self, attachments: list) -> List[dict]:
+        """Attachments in SendGrid's /v3/mail/send format"""
+        return [
+            {'content': content, 'filename': filename, 'type': 'application/octet-stream', 'disposition': 'attachment'}
+            for filename, content in self._encode_attachments(attachments)
+        ]
+
+    def _postmark_attachments(self, attachments: list) -> List[dict]:
+        """Attachments in Postmark's message format"""
+        return [
+            {'Name': filename, 'Content': content, 'ContentType': 'application/octet-stream'}
+            for filename, content in self._encode_attachments(attachments)
+        ]
+
+    def _mailgun_attachments(self, attachments: list) -> List[tuple]:
+        """Attachments as multipart files for the Mailgun messages API"""
+        return [
+            ('attachment', (filename, base64.b64decode(content), 'application/octet-stream'))
+            for filename, content in self._encode_attachments(attachments)
+        ]
+
     def _add_attachment(self, msg: MIMEMultipart, attachment_file):
-        """Add attachment to email message from a file object"""
-        import os
-        from django.core.files.uploadedfile import InMemoryUploadedFile
+        """Add attachment to email message from a file object or a pre-encoded EncodedAttachment"""
+        if isinstance(attachment_file, EncodedAttachment):
+            # Already base64-encoded once for the whole campaign
+            part = MIMEBase('application', 'octet-stream')
+            part.set_payload(attachment_file.payload())
+            part['Content-Transfer-Encoding'] = 'base64'
+            part.add_header('Content-Disposition', 'attachment', filename=attachment_file.filename)
+            msg.attach(part)
+            return
 
         filename = os.path.basename(attachment_file.name)
-        content = attachment_file.read()
-        
+        # Read from the start: the same file object may be attached to many messages
+        attachment_file.open('rb')
+        try:
+            content = attachment_file.read()
+        finally:
+            attachment_file.close()
+
         part = MIMEBase('application', 'octet-stream')
         part.set_payload(content)
         encoders.encode_base64(part)
@@ -465,16 +1066,23 @@ class SMTPManager:
         3. Bounce rate
         4. IP Rotation (Round-Robin based on last used time)
         """
-        from .models import SMTPProvider
-
-        providers = SMTPProvider.objects.filter(is_active=True)
+        providers = registry.providers()
 
         if not providers:
             return None
 
+        counters = get_counters([provider.pk for provider in providers])
+
         # Filter providers within rate limits and check bounce rate
         available_providers = []
         for provider in providers:
+            if not provider.is_active:
+                continue
+
+            # Skip providers whose circuit is open after an outage
+            if not CircuitBreaker(provider).available():
+                continue
+
             # Deactivate provider if bounce rate is too high
             if provider.get_bounce_rate() > provider.bounce_rate_threshold:
                 provider.is_active = False
@@ -482,24 +1090,92 @@ class SMTPManager:
                 logger.warning(f'Provider {provider.name} deactivated due to high bounce rate.')
                 continue
 
+            sent = counters[provider.pk]
+
             # Check warm-up limits
-            is_within_warmup, limit = provider.is_within_warmup_limits()
+            is_within_warmup, limit = provider.is_within_warmup_limits(sent_today=sent['sent_today'])
             if not is_within_warmup:
                 logger.info(f'Provider {provider.name} is in warm-up and has reached its daily limit of {limit}.')
                 continue
 
-            if provider.is_within_limits():
-                available_providers.append(provider)
+            # A limit of 0 means unlimited, as in ProviderRateLimiter
+            if provider.emails_per_day > 0 and sent['sent_today'] >= provider.emails_per_day:
+                continue
+            if provider.emails_per_hour > 0 and sent['sent_this_hour'] >= provider.emails_per_hour:
+                continue
+
+            available_providers.append(provider)
 
         if not available_providers:
             return None
 
         # Sort providers by last used time for round-robin rotation.
         # Providers that have never been used (last_used is None) are prioritized.
-        available_providers.sort(key=lambda p: (p.last_used is not None, p.last_used))
+        def last_used(provider):
+            return counters[provider.pk]['last_used'] or provider.last_used
+
+        available_providers.sort(key=lambda p: (last_used(p) is not None, last_used(p)))
 
         return available_providers[0]
 
+    @staticmethod
+    def is_provider_active(provider) -> bool:
+        """Whether the provider is still active, according to the provider registry"""
+        return any(active.pk == provider.pk for active in registry.providers())
+
+    @staticmethod
+    def get_campaign_providers(campaign) -> list:
+        """Active providers a multi-provider campaign may send through; all of them if none are selected"""
+        allowed = set(campaign.allowed_providers.values_list('id', flat=True))
+        return [
+            provider for provider in registry.providers()
+            if provider.is_active and (not allowed or provider.pk in allowed)
+        ]
+
+    @staticmethod
+    def provider_weight(provider, sent: dict) -> int:
+        """
+        How many messages a provider can take over the next minute: its
+        emails_per_second rate, capped by what is left of its hourly, daily and
+        warm-up quotas, less the share held back for transactional mail
+        """
+        capacities = [bulk_share(provider.emails_per_second) * 60 if provider.emails_per_second > 0 else 60000]
+        if provider.emails_per_hour > 0:
+            capacities.append(bulk_share(provider.emails_per_hour) - sent['sent_this_hour'])
+        if provider.emails_per_day > 0:
+            capacities.append(bulk_share(provider.emails_per_day) - sent['sent_today'])
+
+        is_within_warmup, limit = provider.is_within_warmup_limits(sent_today=sent['sent_today'])
+        if not is_within_warmup:
+            return 0
+        if limit is not None:
+            capacities.append(limit - sent['sent_today'])
+
+        return max(0, min(capacities))
+
+    @staticmethod
+    def select_campaign_provider(campaign, exclude=()) -> Optional['SMTPProvider']:
+        """
+        Pick a provider for part of a multi-provider campaign, at random
+        weighted by provider_weight so that faster providers with more quota
+        left take a proportionally larger share of the recipients
+        """
+        providers = [
+            provider for provider in SMTPManager.get_campaign_providers(campaign)
+            if provider.pk not in exclude
+            and provider.get_bounce_rate() <= provider.bounce_rate_threshold
+            and CircuitBreaker(provider).available()
+        ]
+        if not providers:
+            return None
+
+        counters = get_counters([provider.pk for provider in providers])
+        weights = [SMTPManager.provider_weight(provider, counters[provider.pk]) for provider in providers]
+        if not any(weights):
+            return None
+
+        return random.choices(providers, weights=weights)[0]
+
     @staticmethod
     def test_all_providers() -> Dict[str, Any]:
         """Test all active SMTP providers"""
@@ -516,11 +1192,15 @@ class SMTPManager:
     def send_with_fallback(to_email: str, subject: str, html_content: str,
                           text_content: str = None, attachments: list = None) -> Dict[str, Any]:
         """
-        Send email with automatic fallback to other providers if primary fails
+        Send email with automatic fallback to other providers if primary fails.
+        Providers whose circuit breaker is open are skipped without trying them.
         """
         providers = list(SMTPManager.get_active_providers())
 
         for provider in providers:
+            breaker = CircuitBreaker(provider)
+            if not breaker.allow()[0]:
+                continue
             service = SMTPService(provider)
 
             # Update last_used timestamp
@@ -528,8 +1208,10 @@ class SMTPManager:
             provider.save(update_fields=['last_used'])
 
             result = service.send_email(to_email, subject, html_content, text_content, attachments)
+            breaker.record_results([result])
 
             if result['success']:
+                record_sent(provider.pk)
                 return result
 
         return {
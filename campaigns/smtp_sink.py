@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import random
+import threading
+from collections import Counter
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INJECTED_REJECTION = b'550 5.1.1 Mailbox unavailable (injected)'
+INJECTED_DEFERRAL = b'451 4.7.1 Try again later (injected)'
+
+
+class SMTPSink:
+    """
+    Local SMTP server that accepts and discards mail for throughput
+    benchmarks, refusing or deferring recipients at ``error_rate`` and
+    ``defer_rate``
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 2525, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, defer_rate: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.defer_rate = defer_rate
+        self.stats = Counter()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    async def serve(self, ready: threading.Event = None):
+        """Run the sink on the current event loop until it is cancelled or stopped"""
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"SMTP sink listening on {self.host}:{self.port}")
+        if ready is not None:
+            ready.set()
+        async with self._server:
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    def start(self) -> Tuple[str, int]:
+        """
+        Run the sink on its own event loop in a background thread, e.g. next
+        to a benchmark in the same process. Port 0 picks a free port.
+        Returns: (host, port) the sink listens on
+        """
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.serve(ready))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        if not ready.wait(timeout=5):
+            raise RuntimeError(f"SMTP sink could not listen on {self.host}:{self.port}")
+        return self.host, self.port
+
+    def stop(self):
+        """Stop a sink started with start()"""
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._thread.join(timeout=5)
+
+    def _verdict(self) -> Optional[bytes]:
+        roll = random.random()
+        if roll < self.error_rate:
+            return INJECTED_REJECTION
+        if roll < self.error_rate + self.defer_rate:
+            return INJECTED_DEFERRAL
+        return None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.stats['connections'] += 1
+
+        async def reply(line: bytes):
+            writer.write(line + b'\r\n')
+            await writer.drain()
+
+        recipients = 0
+        try:
+            await reply(b'220 smtp-sink ESMTP ready')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.strip().partition(b' ')
+                command = command.upper()
+
+                if command == b'EHLO':
+                    await reply(b'250-smtp-sink\r\n250-8BITMIME\r\n250-SIZE 52428800\r\n250 AUTH PLAIN LOGIN')
+                elif command == b'HELO':
+                    await reply(b'250 smtp-sink')
+                elif command == b'AUTH':
+                    await self._authenticate(reader, reply, argument)
+                elif command == b'MAIL':
+                    recipients = 0
+                    await reply(b'250 2.1.0 OK')
+                elif command == b'RCPT':
+                    verdict = self._verdict()
+                    if verdict is None:
+                        recipients += 1
+                        await reply(b'250 2.1.5 OK')
+                    else:
+                        self.stats['refused' if verdict is INJECTED_REJECTION else 'deferred'] += 1
+                        await reply(verdict)
+                elif command == b'DATA':
+                    if not recipients:
+                        await reply(b'554 5.5.1 No valid recipients')
+                        continue
+                    await reply(b'354 End data with <CR><LF>.<CR><LF>')
+                    while (await reader.readline()) not in (b'.\r\n', b'.\n', b''):
+                        pass
+                    delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+                    if delay:
+                        await asyncio.sleep(delay)
+                    self.stats['messages'] += 1
+                    self.stats['accepted'] += recipients
+                    recipients = 0
+                    await reply(b'250 2.0.0 OK queued')
+                elif command == b'RSET':
+                    recipients = 0
+                    await reply(b'250 2.0.0 OK')
+                elif command == b'NOOP':
+                    await reply(b'250 2.0.0 OK')
+                elif command == b'VRFY':
+                    await reply(b'252 2.5.2 Cannot verify')
+                elif command == b'QUIT':
+                    await reply(b'221 2.0.0 Bye')
+                    break
+                else:
+                    await reply(b'502 5.5.2 Command not implemented')
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _authenticate(self, reader: asyncio.StreamReader, reply, argument: bytes):
+        mechanism, _, initial_response = argument.partition(b' ')
+        mechanism = mechanism.upper()
+        if mechanism == b'PLAIN':
+            if not initial_response:
+                await reply(b'334 ')
+                await reader.readline()
+        elif mechanism == b'LOGIN':
+            if not initial_response:
+                await reply(b'334 VXNlcm5hbWU6')
+                await reader.readline()
+            await reply(b'334 UGFzc3dvcmQ6')
+            await reader.readline()
+        else:
+            await reply(b'504 5.5.4 Unrecognized authentication type')
+            return
+        await reply(b'235 2.7.0 Authentication successful')
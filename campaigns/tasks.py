@@ -1,37 +1,88 @@
 from subscribers.models import Subscriber
-from celery import shared_task
+from celery import shared_task, chord
+from celery.exceptions import Retry
+from django.conf import settings
 from django.utils import timezone
-from django.core.cache import cache
-from .models import Campaign, EmailLog, SMTPProvider
-from .smtp_service import SMTPService, SMTPManager
+from .models import Campaign, CampaignRecipient, EmailLog, SMTPProvider
+from .smtp_service import SMTPService, SMTPManager, API_PROVIDER_TYPES
+from .rate_limit import ProviderRateLimiter
+from .circuit_breaker import CircuitBreaker, is_provider_failure
+from .pacing import PacingController
+from .domain_throttle import DomainBatcher, is_deferral
+from .send_window import release_size
+from .retry_queue import RETRY_FIELDS, classify_failure, is_hard_bounce, schedule_retry, claim_due_retries
+from .provider_registry import record_sent
+from .log_writer import email_log_writer, stat_counters
+from .async_delivery import AsyncDeliveryEngine, OutgoingMessage
+from .attachment_cache import get_campaign_attachments, evict_campaign_attachments
+from .personalization import get_campaign_personalization, evict_campaign_personalization
+from .message_template import MessageTemplate, get_campaign_message_template, evict_campaign_message_template
+from .message_ids import make_message_id, decode_message_id
 import logging
+import math
 import time
 from django.db import transaction
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task
-def send_campaign_email(campaign_id: int, subscriber_email: str, email_content: dict) -> dict:
+@shared_task(bind=True, max_retries=None)
+def send_campaign_email(self, campaign_id: int, subscriber_email: str, email_content: dict) -> dict:
     """
     Send a single campaign email to a subscriber
     """
+    result = None
     try:
         campaign = Campaign.objects.get(id=campaign_id)
 
+        # A paused or cancelled campaign puts the recipient back in the queue
+        # untouched, so resuming sends it exactly once
+        status = Campaign.get_cached_status(campaign_id)
+        if status in ['paused', 'cancelled']:
+            CampaignRecipient.objects.filter(campaign=campaign, email=subscriber_email, state='queued').update(state='pending')
+            return {
+                'success': False,
+                'error': f'Campaign is {status}',
+                'subscriber_email': subscriber_email
+            }
+
         # Get best available SMTP provider
         provider = SMTPManager.select_best_provider()
 
         if not provider:
             logger.error(f"No active SMTP providers available for campaign {campaign_id}")
+            _defer_unsent_recipient(campaign_id, subscriber_email)
             return {
                 'success': False,
                 'error': 'No SMTP providers available',
                 'subscriber_email': subscriber_email
             }
 
-        # Create email log entry
-        email_log = EmailLog.objects.create(
+        # Claim the recipient's delivery key; a redelivered or duplicate task
+        # finds it already taken and sends nothing
+        claimed = CampaignRecipient.objects.filter(
+            campaign=campaign, email=subscriber_email, state='queued'
+        ).update(state='sending')
+        if not claimed:
+            logger.info(f"Email to {subscriber_email} for campaign {campaign_id} was already handled, skipping")
+            return {
+                'success': False,
+                'duplicate': True,
+                'error': 'Recipient already handled',
+                'subscriber_email': subscriber_email
+            }
+
+        # Take a send token; when the provider is at its limit, hand the claim
+        # back and try again once one refills
+        granted, wait = ProviderRateLimiter(provider).reserve(1)
+        if not granted:
+            CampaignRecipient.objects.filter(
+                campaign=campaign, email=subscriber_email, state='sending'
+            ).update(state='queued')
+            raise self.retry(countdown=wait)
+
+        # Email log entry, written through the buffered log writer once the outcome is known
+        email_log = EmailLog(
             campaign=campaign,
             subscriber_email=subscriber_email,
             smtp_provider=provider,
@@ -49,21 +100,30 @@ def send_campaign_email(campaign_id: int, subscriber_email: str, email_content:
             attachments=email_content.get('attachments', [])
         )
 
+        # A send lost to a provider outage is retried once its circuit has
+        # opened, so select_best_provider picks another provider
+        if CircuitBreaker(provider).record_results([result]) == 'open' and is_provider_failure(result):
+            CampaignRecipient.objects.filter(
+                campaign=campaign, email=subscriber_email, state='sending'
+            ).update(state='queued')
+            raise self.retry(countdown=0)
+
         # Update email log based on result
         with transaction.atomic():
             if result['success']:
                 email_log.status = 'sent'
                 email_log.sent_at = timezone.now()
                 email_log.message_id = result.get('message_id', '')
-                email_log.save()
+                email_log_writer.add(email_log)
 
-                # Update campaign statistics
-                campaign.total_sent += 1
-                campaign.save(update_fields=['total_sent'])
+                # Update campaign and provider statistics
+                stat_counters.increment(Campaign, campaign.pk, total_sent=1)
+                stat_counters.increment(SMTPProvider, provider.pk, total_sent=1)
+                record_sent(provider.pk)
 
-                # Update provider statistics
-                provider.total_sent += 1
-                provider.save(update_fields=['total_sent'])
+                CampaignRecipient.objects.filter(campaign=campaign, email=subscriber_email).update(
+                    state='sent', processed_at=email_log.sent_at
+                )
 
                 logger.info(f"Email sent successfully to {subscriber_email} via {provider.name}")
 
@@ -74,14 +134,31 @@ def send_campaign_email(campaign_id: int, subscriber_email: str, email_content:
                     'provider': provider.name
                 }
             else:
+                # Temporary failures go to the retry queue instead of failing
+                if classify_failure(result) == 'soft':
+                    recipient = CampaignRecipient.objects.filter(campaign=campaign, email=subscriber_email).first()
+                    if recipient is not None and schedule_retry(recipient):
+                        recipient.save(update_fields=['state'] + RETRY_FIELDS)
+                        logger.info(f"Deferred email to {subscriber_email}, retry {recipient.attempts} at {recipient.retry_at}: {result.get('error')}")
+                        return {
+                            'success': False,
+                            'deferred': True,
+                            'error': result.get('error'),
+                            'subscriber_email': subscriber_email
+                        }
+
                 email_log.status = 'failed'
                 email_log.failed_at = timezone.now()
                 email_log.error_message = result.get('error', 'Unknown error')
-                email_log.save()
+                email_log_writer.add(email_log)
+
+                CampaignRecipient.objects.filter(campaign=campaign, email=subscriber_email).update(
+                    state='failed', processed_at=email_log.failed_at
+                )
 
                 # Check for hard bounce
                 error_message = result.get('error', '')
-                if '550' in error_message or '554' in error_message:
+                if is_hard_bounce(result):
                     try:
                         subscriber = Subscriber.objects.get(email=subscriber_email)
                         subscriber.status = 'bounced'
@@ -105,8 +182,21 @@ def send_campaign_email(campaign_id: int, subscriber_email: str, email_content:
             'error': 'Campaign not found',
             'subscriber_email': subscriber_email
         }
+    except Retry:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error sending email to {subscriber_email}: {str(e)}")
+        if result and result['success']:
+            # The provider accepted the message; requeueing it would send it twice
+            CampaignRecipient.objects.filter(campaign_id=campaign_id, email=subscriber_email).update(
+                state='sent', processed_at=timezone.now()
+            )
+            return {
+                'success': True,
+                'message_id': result.get('message_id'),
+                'subscriber_email': subscriber_email
+            }
+        _defer_unsent_recipient(campaign_id, subscriber_email)
         return {
             'success': False,
             'error': str(e),
@@ -114,10 +204,634 @@ def send_campaign_email(campaign_id: int, subscriber_email: str, email_content:
         }
 
 
+def _defer_unsent_recipient(campaign_id: int, subscriber_email: str):
+    """
+    Hand a recipient that send_campaign_email claimed but could not send to
+    the retry queue, or mark it failed once it has used up its retries, so
+    it is never left 'queued' or 'sending' while the campaign is finished.
+    """
+    recipient = CampaignRecipient.objects.filter(
+        campaign_id=campaign_id, email=subscriber_email, state__in=['queued', 'sending']
+    ).first()
+    if recipient is None:
+        return
+    if schedule_retry(recipient):
+        recipient.save(update_fields=['state'] + RETRY_FIELDS)
+        logger.info(f"Deferred email to {subscriber_email}, retry {recipient.attempts} at {recipient.retry_at}")
+    else:
+        recipient.state = 'failed'
+        recipient.processed_at = timezone.now()
+        recipient.save(update_fields=['state', 'processed_at'])
+
+
+@shared_task(bind=True, max_retries=None)
+def send_transactional_email(self, to_email: str, subject: str, html_content: str = None,
+                             text_content: str = None, template_path: str = None, context: dict = None,
+                             provider_id: int = None) -> dict:
+    """
+    Send a one-off email (test emails, password resets, notifications) on
+    the transactional lane. The task is routed to its own queue and takes
+    its send token from the 'transactional' lane of the provider rate
+    limiter, which may use the share of quota campaigns hold back.
+    Uses the given provider, or the best available one.
+    """
+    if provider_id:
+        provider = SMTPProvider.objects.filter(pk=provider_id, is_active=True).first()
+    else:
+        provider = SMTPManager.select_best_provider()
+    if provider is None:
+        logger.error(f"No SMTP provider available for transactional email to {to_email}")
+        return {
+            'success': False,
+            'error': 'No SMTP providers available'
+        }
+
+    granted, wait = ProviderRateLimiter(provider, lane='transactional').reserve(1)
+    if not granted:
+        raise self.retry(countdown=wait)
+
+    result = SMTPService(provider).send_email(
+        to_email=to_email,
+        subject=subject,
+        html_content=html_content,
+        text_content=text_content,
+        template_path=template_path,
+        context=context
+    )
+    CircuitBreaker(provider).record_results([result])
+
+    if result['success']:
+        stat_counters.increment(SMTPProvider, provider.pk, total_sent=1)
+        record_sent(provider.pk)
+        logger.info(f"Transactional email sent to {to_email} via {provider.name}")
+    else:
+        logger.error(f"Failed to send transactional email to {to_email}: {result.get('error')}")
+    return result
+
+
+def dispatch_campaign_send(campaign) -> int:
+    """
+    Materialize the audience of a campaign and enqueue its send pipeline.
+
+    The CampaignRecipient queue is filled once and then handed to
+    enqueue_pending_chunks, or, for a campaign with a send window, released
+    bit by bit by release_paced_recipients. Returns the number of recipients.
+    """
+    campaign.total_recipients = CampaignRecipient.populate(campaign)
+    campaign.release_cursor = 0
+    campaign.released_at = None
+    campaign.save(update_fields=['total_recipients', 'release_cursor', 'released_at'])
+
+    if campaign.send_window_hours:
+        release_paced_recipients(campaign)
+    else:
+        enqueue_pending_chunks(campaign)
+    return campaign.total_recipients
+
+
+def enqueue_pending_chunks(campaign, first_id: int = None, last_id: int = None) -> int:
+    """
+    Enqueue one send_campaign_chunk per CAMPAIGN_SEND_CHUNK_SIZE pending
+    recipients, optionally only those with ids in [first_id, last_id].
+    Returns: Number of recipients enqueued
+    """
+    recipient_ids = CampaignRecipient.objects.filter(campaign=campaign, state='pending')
+    if first_id is not None:
+        recipient_ids = recipient_ids.filter(id__gte=first_id)
+    if last_id is not None:
+        recipient_ids = recipient_ids.filter(id__lte=last_id)
+    recipient_ids = recipient_ids.order_by('id').values_list('id', flat=True)
+
+    chunk_size = max(1, settings.CAMPAIGN_SEND_CHUNK_SIZE)
+    chunks = []
+    pending_count = 0
+    for recipient_id in recipient_ids.iterator():
+        if pending_count % chunk_size == 0:
+            chunks.append([recipient_id, recipient_id])
+        else:
+            chunks[-1][1] = recipient_id
+        pending_count += 1
+
+    if not chunks:
+        finalize_campaign_send.delay([], campaign.id)
+        return 0
+
+    chord(
+        send_campaign_chunk.s(campaign.id, first_id, last_id) for first_id, last_id in chunks
+    )(finalize_campaign_send.s(campaign.id))
+
+    logger.info(f"Campaign {campaign.id} queued for {pending_count} recipients in {len(chunks)} chunks")
+    return pending_count
+
+
+def release_paced_recipients(campaign, now=None) -> int:
+    """
+    Hand the next share of a paced campaign's recipients, sized by
+    release_size, to the send pipeline.
+    Returns: The number of recipients released
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        # Locked so overlapping dispatcher runs never release the same recipients twice
+        campaign = Campaign.objects.select_for_update().select_related('smtp_provider').get(pk=campaign.pk)
+        if campaign.status != 'sending':
+            return 0
+        unreleased = CampaignRecipient.objects.filter(
+            campaign=campaign, state='pending', id__gt=campaign.release_cursor
+        )
+        count = release_size(campaign, unreleased.count(), now)
+        recipient_ids = list(unreleased.order_by('id').values_list('id', flat=True)[:count])
+        if not recipient_ids:
+            return 0
+        campaign.release_cursor = recipient_ids[-1]
+        campaign.released_at = now
+        campaign.save(update_fields=['release_cursor', 'released_at'])
+
+    return enqueue_pending_chunks(campaign, first_id=recipient_ids[0], last_id=recipient_ids[-1])
+
+
+def _compose_campaign_email(campaign, recipient, from_email: str, from_name: str, attachments: list) -> dict:
+    """Personalized send_email keyword arguments for one recipient of a campaign"""
+    return {
+        'to_email': recipient.email,
+        **get_campaign_personalization(campaign).render(recipient),
+        'from_email': from_email,
+        'from_name': from_name,
+        'cc_recipients': campaign.cc_recipients.split(',') if campaign.cc_recipients else None,
+        'bcc_recipients': campaign.bcc_recipients.split(',') if campaign.bcc_recipients else None,
+        'attachments': attachments,
+    }
+
+
+def _send_block_api(service: SMTPService, campaign, block: list, from_email: str, from_name: str,
+                    attachments: list) -> list:
+    """
+    Send a block of recipients through an API provider, in as few batch
+    requests as the provider allows. One shared message with substitution
+    tags is sent when the content has no conditionals; otherwise every
+    recipient's message is rendered here.
+    Returns: List of (subject, result) pairs in block order
+    """
+    personalization = get_campaign_personalization(campaign)
+    substitution = personalization.substitution
+    if service.supports_batch() and substitution is not None:
+        domain = from_email.rpartition('@')[2]
+        results = service.send_batch(
+            [recipient.email for recipient in block],
+            substitution.subject,
+            substitution.html_content,
+            substitution.text_content,
+            substitutions=[substitution.values(recipient) for recipient in block],
+            from_email=from_email,
+            from_name=from_name,
+            cc_recipients=campaign.cc_recipients.split(',') if campaign.cc_recipients else None,
+            bcc_recipients=campaign.bcc_recipients.split(',') if campaign.bcc_recipients else None,
+            message_ids=[make_message_id(domain, campaign.id, recipient.id) for recipient in block],
+            attachments=attachments,
+        )
+        return [
+            (personalization.subject.render(recipient), result)
+            for recipient, result in zip(block, results)
+        ]
+
+    if service.supports_batch():
+        emails = [_compose_campaign_email(campaign, recipient, from_email, from_name, attachments) for recipient in block]
+        return [(email['subject'], result) for email, result in zip(emails, service.send_email_batch(emails))]
+
+    sent = []
+    for recipient in block:
+        email = _compose_campaign_email(campaign, recipient, from_email, from_name, attachments)
+        try:
+            result = service.send_email(**email)
+        except Exception as e:
+            logger.exception(f"Error sending email to {recipient.email}")
+            result = {'success': False, 'error': f'Error sending email: {str(e)}'}
+        sent.append((email['subject'], result))
+    return sent
+
+
+def _send_block_smtp(service: SMTPService, template: MessageTemplate, block: list,
+                     engine: AsyncDeliveryEngine = None) -> list:
+    """
+    Render a block of recipients from the campaign's precomposed message and
+    deliver it over pooled sessions, or concurrently through the asyncio engine.
+    Returns: List of (subject, result) pairs in block order
+    """
+    sent = [None] * len(block)
+    outgoing = []
+    positions = []
+    for position, recipient in enumerate(block):
+        try:
+            subject = template.render_subject(recipient)
+            message_id = template.new_message_id(recipient)
+            content = template.render(recipient, message_id)
+        except Exception as e:
+            logger.exception(f"Error building email to {recipient.email}")
+            sent[position] = (template.subject, {'success': False, 'error': f'Error sending email: {str(e)}'})
+            continue
+        envelope = template.envelope_recipients(recipient.email)
+        if engine:
+            outgoing.append(OutgoingMessage(template.from_email, envelope, content, message_id))
+            positions.append((position, subject))
+        else:
+            sent[position] = (subject, service.send_raw(template.from_email, envelope, content, message_id))
+
+    if outgoing:
+        for (position, subject), result in zip(positions, engine.deliver(outgoing)):
+            sent[position] = (subject, result)
+    return sent
+
+
+class _ProviderSession:
+    """What a campaign chunk needs to send through one provider"""
+
+    def __init__(self, campaign, provider, engine: str = None, concurrency: int = None):
+        self.provider = provider
+        self.service = SMTPService(provider)
+        self.limiter = ProviderRateLimiter(provider)
+        self.breaker = CircuitBreaker(provider)
+        self.from_email = campaign.from_email or provider.from_email
+        self.from_name = campaign.from_name or provider.from_name
+        self.sent_count = 0
+        self.block_size = settings.CAMPAIGN_SEND_BLOCK_SIZE
+        self.pacing = PacingController(provider) if settings.CAMPAIGN_ADAPTIVE_PACING else None
+
+        # SMTP providers render every recipient from one precomposed MIME skeleton
+        self.template = None
+        self.attachments = None
+        self.async_engine = None
+        if provider.provider_type in API_PROVIDER_TYPES:
+            self.attachments = get_campaign_attachments(campaign)
+            if self.service.supports_batch():
+                self.block_size = settings.CAMPAIGN_API_BLOCK_SIZE
+        else:
+            self.template = get_campaign_message_template(campaign, provider)
+            if (engine or settings.CAMPAIGN_DELIVERY_ENGINE) == 'async':
+                self.async_engine = AsyncDeliveryEngine(provider, concurrency=concurrency)
+                self.max_sessions = self.async_engine.concurrency
+
+        if self.pacing:
+            self._apply(self.pacing.targets())
+
+    def send(self, campaign, block: list) -> list:
+        started = time.monotonic()
+        if self.template:
+            results = _send_block_smtp(self.service, self.template, block, self.async_engine)
+        else:
+            results = _send_block_api(self.service, campaign, block, self.from_email, self.from_name, self.attachments)
+
+        if self.pacing:
+            # Messages go out one after another on each session, or one batch request per block
+            if self.template:
+                sessions = min(self.async_engine.concurrency, len(block)) if self.async_engine else 1
+                rounds = math.ceil(len(block) / sessions)
+            else:
+                rounds = 1 if self.service.supports_batch() else len(block)
+            latency = (time.monotonic() - started) / max(1, rounds)
+            self._apply(self.pacing.record([result for _, result in results], latency))
+        return results
+
+    def _apply(self, targets):
+        """Pace the limiter and size the async engine to the provider's PacingController targets"""
+        if targets is None:
+            return
+        rate, concurrency = targets
+        # At its maximum the rate is left to the provider's own limits
+        self.limiter.set_pace(rate if rate < self.pacing.max_rate else None)
+        if self.async_engine:
+            self.async_engine.resize(min(concurrency, self.max_sessions))
+
+    def close(self):
+        if self.async_engine:
+            self.async_engine.close()
+        if self.sent_count:
+            stat_counters.increment(SMTPProvider, self.provider.pk, total_sent=self.sent_count)
+
+
+def _defer_claimed_retries(recipient_ids: list):
+    """
+    Hand retries claimed from the retry queue that could not be sent back to
+    it as a failed attempt, or mark them failed once they have used up their
+    retries.
+    """
+    now = timezone.now()
+    recipients = list(CampaignRecipient.objects.filter(id__in=recipient_ids, state='queued'))
+    for recipient in recipients:
+        if not schedule_retry(recipient, now):
+            recipient.state = 'failed'
+            recipient.processed_at = now
+    CampaignRecipient.objects.bulk_update(recipients, ['state', 'processed_at'] + RETRY_FIELDS)
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=None)
+def send_campaign_chunk(self, campaign_id: int, first_id: int, last_id: int, engine: str = None,
+                        concurrency: int = None, recipient_ids: list = None) -> dict:
+    """
+    Send a campaign to its pending recipients with ids in [first_id, last_id],
+    or to the retries in ``recipient_ids``, block by block. Waits for capacity
+    are slept through or retry the chunk.
+    """
+    try:
+        campaign = Campaign.objects.select_related('smtp_provider').get(id=campaign_id)
+    except Campaign.DoesNotExist:
+        logger.error(f"Campaign {campaign_id} not found")
+        return {
+            'success': False,
+            'error': 'Campaign not found'
+        }
+
+    multi_provider = campaign.send_mode == 'multi'
+    if multi_provider:
+        provider = SMTPManager.select_campaign_provider(campaign)
+    else:
+        provider = campaign.smtp_provider
+    if provider is None:
+        if multi_provider and not self.request.called_directly:
+            # Every allowed provider is at its limit or unavailable; wait like a rate limit
+            retry_in = settings.CAMPAIGN_RATE_LIMIT_MAX_SLEEP
+            logger.info(f"No SMTP provider available for chunk {first_id}-{last_id} of campaign {campaign_id}, retrying in {retry_in:.0f}s")
+            raise self.retry(countdown=retry_in)
+        logger.error(f"No SMTP provider available for campaign {campaign_id}")
+        if recipient_ids is not None:
+            _defer_claimed_retries(recipient_ids)
+        return {
+            'success': False,
+            'error': 'No SMTP provider available'
+        }
+
+    if recipient_ids is not None:
+        queryset = CampaignRecipient.objects.filter(campaign_id=campaign_id, state='queued', id__in=recipient_ids)
+        # Retries carry on after the rest of the campaign has been sent
+        active_statuses = ['sending', 'sent']
+        claim_state = 'queued'
+    else:
+        queryset = CampaignRecipient.objects.filter(
+            campaign_id=campaign_id, state='pending', id__gte=first_id, id__lte=last_id
+        )
+        active_statuses = ['sending']
+        claim_state = 'pending'
+    recipients = list(queryset.select_related('subscriber').order_by('id'))
+
+    session = _ProviderSession(campaign, provider, engine, concurrency)
+    batcher = DomainBatcher(recipients)
+    exhausted = set()
+    sent_count = 0
+    failed_count = 0
+    halted = False
+    retry_in = None
+    next_status_check = 0
+
+    try:
+        while len(batcher):
+            now = time.monotonic()
+            if now >= next_status_check:
+                status = Campaign.get_cached_status(campaign_id)
+                if status not in active_statuses:
+                    logger.info(f"Campaign {campaign_id} is {status}, stopping chunk {first_id}-{last_id}")
+                    halted = True
+                    break
+                next_status_check = now + settings.CAMPAIGN_STATUS_CHECK_INTERVAL
+
+                # Move off a provider that was deactivated mid-run
+                if multi_provider and not SMTPManager.is_provider_active(session.provider):
+                    exhausted.add(session.provider.pk)
+                    replacement = SMTPManager.select_campaign_provider(campaign, exclude=exhausted)
+                    if replacement is None:
+                        retry_in = settings.CAMPAIGN_RATE_LIMIT_MAX_SLEEP
+                        break
+                    logger.info(f"Provider {session.provider.name} is no longer active, campaign {campaign_id} continues on {replacement.name}")
+                    session.close()
+                    session = _ProviderSession(campaign, replacement, engine, concurrency)
+
+            # Move off, or wait out, a provider whose circuit is open
+            allowed, wait = session.breaker.allow()
+            if not allowed:
+                if multi_provider:
+                    exhausted.add(session.provider.pk)
+                    replacement = SMTPManager.select_campaign_provider(campaign, exclude=exhausted)
+                    if replacement is not None:
+                        logger.info(f"Circuit for provider {session.provider.name} is open, campaign {campaign_id} continues on {replacement.name}")
+                        session.close()
+                        session = _ProviderSession(campaign, replacement, engine, concurrency)
+                        continue
+                if wait <= settings.CAMPAIGN_RATE_LIMIT_MAX_SLEEP or self.request.called_directly:
+                    time.sleep(wait)
+                    continue
+                retry_in = wait
+                break
+
+            # Only recipients whose domains are not paused or at their limits
+            block, wait = batcher.next_block(max(1, session.block_size))
+            if not block:
+                if wait <= settings.CAMPAIGN_RATE_LIMIT_MAX_SLEEP or self.request.called_directly:
+                    time.sleep(wait)
+                    continue
+                retry_in = wait
+                break
+
+            # A partial grant shrinks the block to the tokens available
+            granted, wait = session.limiter.acquire(len(block), max_wait=0 if multi_provider else None)
+            batcher.requeue(block[granted:])
+            block = block[:granted]
+            if not granted and multi_provider:
+                exhausted.add(session.provider.pk)
+                replacement = SMTPManager.select_campaign_provider(campaign, exclude=exhausted)
+                if replacement is not None:
+                    session.close()
+                    session = _ProviderSession(campaign, replacement, engine, concurrency)
+                    continue
+                # Every allowed provider is at its limit; wait on the current one
+                exhausted.clear()
+            if not granted:
+                if wait <= settings.CAMPAIGN_RATE_LIMIT_MAX_SLEEP or self.request.called_directly:
+                    time.sleep(wait)
+                    continue
+                retry_in = wait
+                break
+
+            # Claim the block; recipients an overlapping or redelivered run
+            # already took are dropped rather than sent twice
+            claimed = CampaignRecipient.claim([recipient.id for recipient in block], claim_state)
+            if len(claimed) < len(block):
+                batcher.release([recipient for recipient in block if recipient.id not in claimed])
+                block = [recipient for recipient in block if recipient.id in claimed]
+                if not block:
+                    continue
+
+            try:
+                results = session.send(campaign, block)
+            finally:
+                batcher.release(block)
+
+            # Provider failures count towards its circuit breaker
+            provider_down = session.breaker.record_results([result for _, result in results]) == 'open'
+
+            logs = []
+            domain_deferrals = []
+            block_sent = 0
+            for recipient, (subject, result) in zip(block, results):
+                # A domain-level deferral also backs off the whole domain
+                if is_deferral(result):
+                    domain_deferrals.append(recipient)
+                # Temporary failures go to the retry queue, as do sends lost to a provider outage
+                if not result['success']:
+                    retry = classify_failure(result) == 'soft' or (provider_down and is_provider_failure(result))
+                    if retry and schedule_retry(recipient):
+                        continue
+                recipient.processed_at = timezone.now()
+                if result['success']:
+                    block_sent += 1
+                    recipient.state = 'sent'
+                    logs.append(EmailLog(
+                        campaign=campaign,
+                        subscriber_email=recipient.email,
+                        smtp_provider=session.provider,
+                        subject=subject,
+                        status='sent',
+                        sent_at=recipient.processed_at,
+                        message_id=result.get('message_id', '')
+                    ))
+                else:
+                    failed_count += 1
+                    recipient.state = 'failed'
+                    logger.error(f"SMTP service failed to send email to {recipient.email} for campaign {campaign_id}: {result.get('error')}")
+                    logs.append(EmailLog(
+                        campaign=campaign,
+                        subscriber_email=recipient.email,
+                        smtp_provider=session.provider,
+                        subject=subject,
+                        status='failed',
+                        error_message=result.get('error', 'SMTP service failed to send email.'),
+                        failed_at=recipient.processed_at
+                    ))
+            if domain_deferrals:
+                batcher.defer(domain_deferrals)
+            batcher.delivered([recipient for recipient in block if recipient.state == 'sent'])
+            email_log_writer.add_many(logs)
+            CampaignRecipient.objects.bulk_update(block, ['state', 'processed_at'] + RETRY_FIELDS)
+            record_sent(session.provider.pk, block_sent)
+            session.sent_count += block_sent
+            sent_count += block_sent
+    finally:
+        session.close()
+        if sent_count:
+            stat_counters.increment(Campaign, campaign_id, total_sent=sent_count)
+        email_log_writer.flush()
+        stat_counters.flush()
+
+    if retry_in is not None:
+        if self.request.called_directly:
+            halted = True
+        else:
+            logger.info(f"Chunk {first_id}-{last_id} of campaign {campaign_id} is waiting for send capacity, retrying in {retry_in:.0f}s")
+            raise self.retry(countdown=retry_in)
+
+    if halted and recipient_ids is not None:
+        # Claimed retries that were not reached go back to the retry queue
+        CampaignRecipient.objects.filter(id__in=recipient_ids, state='queued').update(state='deferred')
+
+    return {
+        'success': True,
+        'campaign_id': campaign_id,
+        'emails_sent': sent_count,
+        'emails_failed': failed_count,
+        'halted': halted
+    }
+
+
+@shared_task
+def finalize_campaign_send(chunk_results: list, campaign_id: int) -> dict:
+    """Mark a campaign as sent once every chunk of its send pipeline has finished"""
+    try:
+        campaign = Campaign.objects.get(id=campaign_id)
+    except Campaign.DoesNotExist:
+        logger.error(f"Campaign {campaign_id} not found")
+        return {
+            'success': False,
+            'error': 'Campaign not found'
+        }
+
+    emails_sent = sum(result.get('emails_sent', 0) for result in chunk_results if result)
+    emails_failed = sum(result.get('emails_failed', 0) for result in chunk_results if result)
+
+    # A paused or cancelled campaign keeps its status; one that was resumed
+    # while this pipeline was stopping still has pending recipients and is
+    # finalized by the newer pipeline instead
+    has_pending = CampaignRecipient.objects.filter(campaign=campaign, state='pending').exists()
+    if campaign.status == 'sending' and not has_pending:
+        campaign.status = 'sent'
+        campaign.sent_at = timezone.now()
+        campaign.save(update_fields=['status', 'sent_at'])
+        evict_campaign_message_template(campaign_id)
+        evict_campaign_attachments(campaign_id)
+        evict_campaign_personalization(campaign_id)
+
+    logger.info(f"Campaign {campaign_id} finished: {emails_sent} sent, {emails_failed} failed")
+
+    return {
+        'success': True,
+        'emails_sent': emails_sent,
+        'emails_failed': emails_failed
+    }
+
+
+@shared_task
+def process_retry_queue(batch_size: int = None) -> dict:
+    """
+    Hand deferred recipients whose retry time has come to send_campaign_chunk,
+    one task per campaign. Run periodically by Celery beat, so no worker ever
+    sleeps waiting for a retry.
+    """
+    claimed = claim_due_retries(batch_size or settings.CAMPAIGN_RETRY_BATCH_SIZE)
+    for campaign_id, recipient_ids in claimed.items():
+        send_campaign_chunk.delay(campaign_id, min(recipient_ids), max(recipient_ids), recipient_ids=recipient_ids)
+
+    retried = sum(len(recipient_ids) for recipient_ids in claimed.values())
+    if retried:
+        logger.info(f"Retrying {retried} deferred recipients of {len(claimed)} campaigns")
+    return {
+        'success': True,
+        'retried': retried
+    }
+
+
+@shared_task
+def dispatch_scheduled_campaigns() -> dict:
+    """
+    Start scheduled campaigns whose time has come and release the next share
+    of every campaign being sent over a send window. Run periodically by
+    Celery beat.
+    """
+    now = timezone.now()
+    started = 0
+    for campaign in Campaign.objects.filter(status='scheduled', scheduled_at__lte=now):
+        # Only the dispatcher run that moves the campaign to sending starts it
+        if not Campaign.objects.filter(pk=campaign.pk, status='scheduled').update(status='sending'):
+            continue
+        campaign.status = 'sending'
+        campaign.save(update_fields=['status'])
+        total_recipients = dispatch_campaign_send(campaign)
+        logger.info(f"Scheduled campaign {campaign.id} started for {total_recipients} recipients")
+        started += 1
+
+    released = 0
+    for campaign in Campaign.objects.filter(status='sending', send_window_hours__gt=0):
+        released += release_paced_recipients(campaign, now)
+
+    if released:
+        logger.info(f"Released {released} recipients of paced campaigns")
+    return {
+        'success': True,
+        'started': started,
+        'released': released
+    }
+
+
 @shared_task
 def send_bulk_campaign(campaign_id: int, batch_size: int = 50, delay: int = 1) -> dict:
     """
-    Send campaign emails in batches with rate limiting
+    Send campaign emails in batches; send_campaign_email enforces the
+    provider rate limits
     """
     try:
         campaign = Campaign.objects.get(id=campaign_id)
@@ -128,21 +842,15 @@ def send_bulk_campaign(campaign_id: int, batch_size: int = 50, delay: int = 1) -
                 'error': f'Campaign status is {campaign.status}, cannot send'
             }
 
-        # Get subscribers who haven't received this campaign yet
-        from subscribers.models import Subscriber
-
-        sent_emails = EmailLog.objects.filter(
-            campaign=campaign,
-            status='sent'
-        ).values_list('subscriber_email', flat=True)
+        # Build the recipient queue on the first run, then take the next
+        # page of pending recipients straight off the (campaign, state, id) index
+        if not CampaignRecipient.objects.filter(campaign=campaign).exists():
+            campaign.total_recipients = CampaignRecipient.populate(campaign)
+            campaign.save(update_fields=['total_recipients'])
 
-        pending_subscribers = Subscriber.objects.exclude(
-            email__in=sent_emails
-        ).filter(
-            is_active=True
-        ).select_related()[:batch_size]
+        pending_recipients = CampaignRecipient.next_batch(campaign.id, limit=batch_size)
 
-        if not pending_subscribers:
+        if not pending_recipients:
             # Mark campaign as sent if no more subscribers
             campaign.status = 'sent'
             campaign.sent_at = timezone.now()
@@ -154,6 +862,11 @@ def send_bulk_campaign(campaign_id: int, batch_size: int = 50, delay: int = 1) -
                 'emails_sent': 0
             }
 
+        # Only enqueue what this run claimed, so overlapping runs never
+        # enqueue the same recipient twice
+        claimed = CampaignRecipient.claim([recipient.id for recipient in pending_recipients], 'pending', 'queued')
+        pending_recipients = [recipient for recipient in pending_recipients if recipient.id in claimed]
+
         # Prepare email content
         email_content = {
             'subject': campaign.subject,
@@ -165,27 +878,28 @@ def send_bulk_campaign(campaign_id: int, batch_size: int = 50, delay: int = 1) -
         sent_count = 0
         failed_count = 0
 
-        for subscriber in pending_subscribers:
-            # Check rate limits before sending
-            cache_key = f"smtp_rate_limit_{timezone.now().strftime('%Y%m%d%H%M')}"
-            current_minute_sends = cache.get(cache_key, 0)
+        halted = False
+        next_status_check = 0
 
-            if current_minute_sends >= 30:  # Max 30 emails per minute
-                logger.info(f"Rate limit reached, pausing for {delay} seconds")
-                time.sleep(delay)
-                cache.set(cache_key, 0, 60)  # Reset counter
+        for index, recipient in enumerate(pending_recipients):
+            # Stop enqueueing as soon as the campaign is paused or cancelled
+            now = time.monotonic()
+            if now >= next_status_check:
+                if Campaign.get_cached_status(campaign_id) not in ['scheduled', 'sending']:
+                    CampaignRecipient.objects.filter(
+                        id__in=[r.id for r in pending_recipients[index:]]
+                    ).update(state='pending')
+                    halted = True
+                    break
+                next_status_check = now + settings.CAMPAIGN_STATUS_CHECK_INTERVAL
 
             # Send email asynchronously
-            send_campaign_email.delay(campaign_id, subscriber.email, email_content)
+            send_campaign_email.delay(campaign_id, recipient.email, email_content)
 
             sent_count += 1
-            cache.incr(cache_key)
-
-            # Small delay between emails
-            time.sleep(0.1)
 
         # Update campaign status if still sending
-        if sent_count > 0:
+        if sent_count > 0 and not halted:
             campaign.status = 'sending'
             campaign.save(update_fields=['status'])
 
@@ -193,7 +907,8 @@ def send_bulk_campaign(campaign_id: int, batch_size: int = 50, delay: int = 1) -
             'success': True,
             'emails_sent': sent_count,
             'emails_failed': failed_count,
-            'batch_size': batch_size
+            'batch_size': batch_size,
+            'halted': halted
         }
 
     except Campaign.DoesNotExist:
@@ -235,23 +950,35 @@ def process_bounced_emails():
                     email_log.status = 'bounced'
                     email_log.bounced_at = bounce.get('bounced_at', timezone.now())
                     email_log.error_message = bounce.get('error', 'Bounced')
-                    email_log.save()
+                    email_log_writer.update(email_log, ['status', 'bounced_at', 'error_message'])
 
                     # Update subscriber status
                     subscriber = Subscriber.objects.get(email=email_log.subscriber_email)
                     subscriber.status = 'bounced'
                     subscriber.save(update_fields=['status'])
 
-                    # Update campaign stats
-                    campaign = email_log.campaign
-                    campaign.total_bounced += 1
-                    campaign.save(update_fields=['total_bounced'])
+                    # Update campaign and provider stats
+                    stat_counters.increment(Campaign, email_log.campaign_id, total_bounced=1)
+                    stat_counters.increment(SMTPProvider, email_log.smtp_provider_id, total_bounced=1)
 
                     total_bounces_processed += 1
                     logger.info(f"Processed bounce for {email_log.subscriber_email} (Message ID: {bounce['message_id']}) ")
 
             except EmailLog.DoesNotExist:
-                logger.warning(f"Could not find EmailLog with Message ID: {bounce['message_id']}")
+                # The log may not be written yet; our Message-IDs say who the message went to
+                identity = decode_message_id(bounce['message_id'])
+                recipient = None
+                if identity is not None:
+                    campaign_id, recipient_id = identity
+                    recipient = CampaignRecipient.objects.filter(id=recipient_id, campaign_id=campaign_id).first()
+                if recipient is None:
+                    logger.warning(f"Could not find EmailLog with Message ID: {bounce['message_id']}")
+                    continue
+                Subscriber.objects.filter(email=recipient.email).update(status='bounced')
+                stat_counters.increment(Campaign, campaign_id, total_bounced=1)
+                stat_counters.increment(SMTPProvider, provider.pk, total_bounced=1)
+                total_bounces_processed += 1
+                logger.info(f"Processed bounce for {recipient.email} of campaign {campaign_id} (Message ID: {bounce['message_id']})")
             except Subscriber.DoesNotExist:
                 logger.warning(f"Could not find Subscriber for email: {email_log.subscriber_email}")
             except Exception as e:
@@ -0,0 +1,843 @@
+import base64
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock, skipIf
+from urllib.parse import parse_qsl
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from campaigns import domain_throttle, rate_limit
+from campaigns.attachment_cache import EncodedAttachment
+from campaigns.aws_signing import sign_request
+from campaigns.circuit_breaker import CircuitBreaker
+from campaigns.http_pool import close_all_sessions
+from campaigns.log_writer import email_log_writer, stat_counters
+from campaigns.models import Blacklist, Campaign, CampaignRecipient, SMTPProvider
+from campaigns.pacing import PacingController
+from campaigns.rate_limit import ProviderRateLimiter, TokenBucket, bulk_share
+from campaigns.smtp_service import SMTPService
+from campaigns.tasks import send_campaign_chunk, send_campaign_email, send_transactional_email
+from subscribers.models import Segment, Subscriber
+
+try:
+    import fakeredis
+    # The token bucket is a Lua script, so the stand-in needs lupa as well
+    fakeredis.FakeRedis().eval('return 1', 0)
+except Exception:
+    fakeredis = None
+
+
+@skipIf(fakeredis is None, 'fakeredis with Lua support is not installed')
+@override_settings(CAMPAIGN_TRANSACTIONAL_RESERVE=0.1)
+class TokenBucketTests(SimpleTestCase):
+    """The Redis token bucket script, run against fakeredis"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('campaigns.rate_limit.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rate_limit._scripts.clear()
+        self.addCleanup(rate_limit._scripts.clear)
+
+    def provider(self, per_second=0, per_hour=0, per_day=0):
+        return SimpleNamespace(
+            pk=1, name='test', emails_per_second=per_second,
+            emails_per_hour=per_hour, emails_per_day=per_day,
+        )
+
+    def test_grants_what_the_tightest_window_allows(self):
+        bucket = TokenBucket('test:{1}', [(5, 3600), (3, 60)])
+
+        granted, wait = bucket.reserve(10)
+        self.assertEqual(granted, 3)
+        # The minute window is empty: one token comes back every 20 seconds
+        self.assertAlmostEqual(wait, 20, delta=0.1)
+
+        self.assertEqual(bucket.reserve(10)[0], 0)
+        # Nothing was debited from the hour window by the refused call
+        self.assertEqual(TokenBucket('test:{1}', [(5, 3600)]).reserve(10)[0], 2)
+
+    def test_zero_tokens_only_peeks(self):
+        bucket = TokenBucket('test:{1}', [(2, 3600)])
+
+        self.assertEqual(bucket.reserve(0), (0, 0.0))
+        self.assertTrue(bucket.has_capacity())
+        self.assertEqual(bucket.reserve(2)[0], 2)
+
+        granted, wait = bucket.reserve(0)
+        self.assertEqual(granted, 0)
+        self.assertAlmostEqual(wait, 1800, delta=1)
+        self.assertFalse(bucket.has_capacity())
+
+    def test_unlimited_windows_are_ignored(self):
+        bucket = TokenBucket('test:{1}', [(0, 1), (-1, 60)])
+
+        self.assertEqual(bucket.windows, [])
+        self.assertEqual(bucket.reserve(1000), (1000, 0.0))
+
+    def test_bulk_lane_leaves_the_transactional_reserve(self):
+        provider = self.provider(per_hour=100)
+        bulk = ProviderRateLimiter(provider, lane='bulk')
+        transactional = ProviderRateLimiter(provider, lane='transactional')
+
+        self.assertEqual(bulk.reserve(1000)[0], 90)
+        self.assertEqual(bulk_share(100), 90)
+
+        granted, wait = bulk.reserve(1)
+        self.assertEqual(granted, 0)
+        self.assertAlmostEqual(wait, 36, delta=0.1)
+
+        self.assertEqual(transactional.reserve(1000)[0], 10)
+        self.assertFalse(transactional.has_capacity())
+
+    def test_held_back_floor_leaves_one_token(self):
+        bucket = TokenBucket('test:{1}', [(5, 3600)], held_back=1.0)
+
+        self.assertEqual(bucket.reserve(10)[0], 1)
+        self.assertEqual(bucket.reserve(10)[0], 0)
+        with override_settings(CAMPAIGN_TRANSACTIONAL_RESERVE=1.0):
+            self.assertEqual(bulk_share(5), 1)
+
+    def test_held_back_rounds_against_the_holder(self):
+        bucket = TokenBucket('test:{1}', [(5, 3600)], held_back=0.5)
+
+        self.assertEqual(bucket.reserve(10)[0], 2)
+
+    def test_pace_window_is_not_held_back(self):
+        bulk = ProviderRateLimiter(self.provider(per_hour=1000), lane='bulk')
+        bulk.set_pace(10)
+
+        self.assertEqual(bulk.reserve(100)[0], 10)
+
+        bulk.set_pace(None)
+        self.assertEqual(bulk.windows, [(1000, 3600)])
+
+    def test_fails_open_without_redis(self):
+        bucket = TokenBucket('test:{1}', [(5, 3600)])
+
+        with mock.patch('campaigns.rate_limit.get_redis', side_effect=ConnectionError('down')):
+            self.assertEqual(bucket.reserve(7), (7, 0.0))
+
+
+@skipIf(fakeredis is None, 'fakeredis with Lua support is not installed')
+@override_settings(
+    CAMPAIGN_PACING_MAX_RATE=200, CAMPAIGN_PACING_INCREASE_INTERVAL=0, CAMPAIGN_PACING_DECREASE_INTERVAL=0,
+    CAMPAIGN_PACING_RATE_STEP=2, CAMPAIGN_PACING_DECREASE_FACTOR=0.5, CAMPAIGN_TRANSACTIONAL_RESERVE=0.1,
+)
+class PacingControllerTests(SimpleTestCase):
+    """AIMD pacing targets, run against fakeredis"""
+
+    ok = {'success': True}
+    deferred = {'success': False, 'smtp_code': 451}
+
+    def setUp(self):
+        redis = fakeredis.FakeRedis()
+        for module in ['rate_limit', 'pacing']:
+            patcher = mock.patch(f'campaigns.{module}.get_redis', return_value=redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        rate_limit._scripts.clear()
+        self.addCleanup(rate_limit._scripts.clear)
+
+    def pacing(self, per_second=0):
+        return PacingController(SimpleNamespace(
+            pk=1, name='test', emails_per_second=per_second, max_connections=8
+        ))
+
+    def test_starts_at_the_provider_limits(self):
+        self.assertEqual(self.pacing().targets(), (200, 8))
+        self.assertEqual(self.pacing(per_second=50).targets(), (45, 8))
+
+    def test_healthy_sends_stay_at_the_maximum(self):
+        pacing = self.pacing()
+
+        self.assertEqual(pacing.record([self.ok] * 10, 0.01), (200, 8))
+        self.assertEqual(pacing.targets(), (200, 8))
+
+    def test_backs_off_after_push_back_and_recovers(self):
+        pacing = self.pacing(per_second=50)
+
+        self.assertEqual(pacing.record([self.ok, self.deferred], 0.01), (22, 4))
+        self.assertEqual(pacing.record([self.ok] * 2, 0.01), (24, 5))
+        self.assertEqual(pacing.targets(), (24, 5))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Records every request and answers with the next queued (status, JSON body)"""
+
+    def do_POST(self):
+        self.server.requests.append({
+            'method': self.command,
+            'path': self.path,
+            'headers': dict(self.headers),
+            'body': self.rfile.read(int(self.headers.get('Content-Length', 0))),
+        })
+        status, payload = self.server.responses.pop(0)
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ProviderAPITestCase(SimpleTestCase):
+    """Points every provider API at a local HTTP server standing in for it"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        cls.server.daemon_threads = True
+        cls.api_url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.responses = []
+        self.enterContext(self.settings(
+            SENDGRID_API_URL=self.api_url,
+            POSTMARK_API_URL=self.api_url,
+            MAILGUN_API_URL=self.api_url,
+            SES_API_URL=self.api_url,
+        ))
+        self.addCleanup(close_all_sessions)
+
+    def service(self, provider_type, **fields):
+        fields = dict({
+            'pk': 1, 'name': provider_type, 'provider_type': provider_type, 'api_key': 'key',
+            'from_email': 'news@example.com', 'from_name': 'News',
+        }, **fields)
+        return SMTPService(SMTPProvider(**fields))
+
+    def respond(self, *responses):
+        """Queue (status, JSON body) answers for the next requests"""
+        self.server.responses.extend(responses)
+
+    def json_body(self, request):
+        return json.loads(request['body'])
+
+    def attachment(self, filename='report.pdf', content=b'%PDF-1.4 report'):
+        return EncodedAttachment(
+            attachment_id=1, filename=filename, size=len(content), headers=b'',
+            body=base64.encodebytes(content).replace(b'\n', b'\r\n'),
+        )
+
+
+class SendGridBatchTests(ProviderAPITestCase):
+    """SMTPService.send_batch through the SendGrid v3 API"""
+
+    def test_one_personalization_per_recipient(self):
+        self.respond((202, None))
+        results = self.service('sendgrid').send_batch(
+            ['ann@example.org', 'bob@example.org'], 'Hi -name-', '<p>Hello -name-</p>',
+            text_content='Hello -name-',
+            substitutions=[{'-name-': 'Ann'}, {'-name-': 'Bob'}],
+            message_ids=['<1@example.com>', '<2@example.com>'],
+        )
+
+        self.assertEqual(results, [
+            {'success': True, 'message_id': '<1@example.com>'},
+            {'success': True, 'message_id': '<2@example.com>'},
+        ])
+        [request] = self.server.requests
+        self.assertEqual(request['path'], '/v3/mail/send')
+        self.assertEqual(request['headers']['Authorization'], 'Bearer key')
+        data = self.json_body(request)
+        self.assertEqual(data['personalizations'], [
+            {
+                'to': [{'email': 'ann@example.org'}],
+                'headers': {'Message-ID': '<1@example.com>'},
+                'custom_args': {'message_id': '<1@example.com>'},
+                'substitutions': {'-name-': 'Ann'},
+            },
+            {
+                'to': [{'email': 'bob@example.org'}],
+                'headers': {'Message-ID': '<2@example.com>'},
+                'custom_args': {'message_id': '<2@example.com>'},
+                'substitutions': {'-name-': 'Bob'},
+            },
+        ])
+        self.assertEqual(data['from'], {'email': 'news@example.com', 'name': 'News'})
+        self.assertEqual(data['subject'], 'Hi -name-')
+        self.assertEqual(data['content'], [
+            {'type': 'text/plain', 'value': 'Hello -name-'},
+            {'type': 'text/html', 'value': '<p>Hello -name-</p>'},
+        ])
+
+    def test_generates_message_ids(self):
+        self.respond((202, None))
+        results = self.service('sendgrid').send_batch(['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>')
+
+        personalizations = self.json_body(self.server.requests[0])['personalizations']
+        self.assertEqual(
+            [result['message_id'] for result in results],
+            [personalization['headers']['Message-ID'] for personalization in personalizations],
+        )
+        self.assertNotEqual(results[0]['message_id'], results[1]['message_id'])
+        self.assertTrue(results[0]['message_id'].endswith('@example.com>'))
+        self.assertNotIn('substitutions', personalizations[0])
+
+    def test_splits_at_the_batch_limit(self):
+        self.respond((202, None), (202, None))
+        with mock.patch.dict('campaigns.smtp_service.API_BATCH_LIMITS', {'sendgrid': 2}):
+            results = self.service('sendgrid').send_batch(
+                ['a@example.org', 'b@example.org', 'c@example.org'], 'Hi', '<p>Hi</p>',
+                message_ids=['<a@x>', '<b@x>', '<c@x>'],
+            )
+
+        self.assertEqual([result['message_id'] for result in results], ['<a@x>', '<b@x>', '<c@x>'])
+        self.assertEqual(
+            [len(self.json_body(request)['personalizations']) for request in self.server.requests], [2, 1]
+        )
+
+    def test_attachments_go_in_the_request(self):
+        self.respond((202, None))
+        self.service('sendgrid').send_batch(
+            ['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>', attachments=[self.attachment()]
+        )
+
+        self.assertEqual(self.json_body(self.server.requests[0])['attachments'], [{
+            'content': base64.b64encode(b'%PDF-1.4 report').decode('ascii'), 'filename': 'report.pdf',
+            'type': 'application/octet-stream', 'disposition': 'attachment',
+        }])
+
+    def test_error_fails_every_recipient(self):
+        self.respond((400, {'errors': [{'message': 'bad request'}]}))
+        results = self.service('sendgrid').send_batch(['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>')
+
+        self.assertEqual([result['success'] for result in results], [False, False])
+        self.assertEqual([result['status_code'] for result in results], [400, 400])
+        self.assertIn('bad request', results[0]['error'])
+
+
+class PostmarkBatchTests(ProviderAPITestCase):
+    """SMTPService.send_batch and send_email_batch through the Postmark batch API"""
+
+    def test_fills_each_message_and_maps_partial_failures(self):
+        self.respond((200, [
+            {'ErrorCode': 0, 'Message': 'OK', 'MessageID': 'pm-1', 'To': 'ann@example.org'},
+            {'ErrorCode': 406, 'Message': 'Inactive recipient', 'To': 'bob@example.org'},
+            {'ErrorCode': 0, 'Message': 'OK', 'MessageID': 'pm-3', 'To': 'cy@example.org'},
+        ]))
+        results = self.service('postmark', reply_to_email='help@example.com').send_batch(
+            ['ann@example.org', 'bob@example.org', 'cy@example.org'], 'Hi -name-', '<p>Hello -name-</p>',
+            text_content='Hello -name-',
+            substitutions=[{'-name-': 'Ann'}, {'-name-': 'Bob'}, {}],
+        )
+
+        self.assertEqual(results, [
+            {'success': True, 'message_id': 'pm-1'},
+            {'success': False, 'error': 'Postmark API error: 406 - Inactive recipient'},
+            {'success': True, 'message_id': 'pm-3'},
+        ])
+        [request] = self.server.requests
+        self.assertEqual(request['path'], '/email/batch')
+        self.assertEqual(request['headers']['X-Postmark-Server-Token'], 'key')
+        self.assertEqual(self.json_body(request), [
+            {
+                'From': 'News <news@example.com>', 'To': 'ann@example.org', 'Subject': 'Hi Ann',
+                'HtmlBody': '<p>Hello Ann</p>', 'TextBody': 'Hello Ann', 'ReplyTo': 'help@example.com',
+            },
+            {
+                'From': 'News <news@example.com>', 'To': 'bob@example.org', 'Subject': 'Hi Bob',
+                'HtmlBody': '<p>Hello Bob</p>', 'TextBody': 'Hello Bob', 'ReplyTo': 'help@example.com',
+            },
+            {
+                'From': 'News <news@example.com>', 'To': 'cy@example.org', 'Subject': 'Hi ',
+                'HtmlBody': '<p>Hello </p>', 'TextBody': 'Hello ', 'ReplyTo': 'help@example.com',
+            },
+        ])
+
+    def test_send_email_batch_keeps_each_message(self):
+        self.respond((200, [
+            {'ErrorCode': 0, 'MessageID': 'pm-1'},
+            {'ErrorCode': 0, 'MessageID': 'pm-2'},
+        ]))
+        results = self.service('postmark').send_email_batch([
+            {'to_email': 'ann@example.org', 'subject': 'One', 'html_content': '<p>1</p>'},
+            {'to_email': 'bob@example.org', 'subject': 'Two', 'html_content': '<p>2</p>',
+             'from_email': 'sales@example.com', 'cc_recipients': ['cc@example.org']},
+        ])
+
+        self.assertEqual([result['message_id'] for result in results], ['pm-1', 'pm-2'])
+        self.assertEqual(self.json_body(self.server.requests[0]), [
+            {'From': 'News <news@example.com>', 'To': 'ann@example.org', 'Subject': 'One', 'HtmlBody': '<p>1</p>'},
+            {'From': 'News <sales@example.com>', 'To': 'bob@example.org', 'Subject': 'Two', 'HtmlBody': '<p>2</p>',
+             'Cc': 'cc@example.org'},
+        ])
+
+    def test_attachments_go_in_every_message(self):
+        self.respond((200, [{'ErrorCode': 0, 'MessageID': 'pm-1'}, {'ErrorCode': 0, 'MessageID': 'pm-2'}]))
+        self.service('postmark').send_batch(
+            ['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>', attachments=[self.attachment()]
+        )
+
+        self.assertEqual(
+            [message['Attachments'] for message in self.json_body(self.server.requests[0])],
+            [[{
+                'Name': 'report.pdf', 'Content': base64.b64encode(b'%PDF-1.4 report').decode('ascii'),
+                'ContentType': 'application/octet-stream',
+            }]] * 2,
+        )
+
+    def test_result_count_mismatch_fails_every_recipient(self):
+        self.respond((200, [{'ErrorCode': 0, 'MessageID': 'pm-1'}]))
+        results = self.service('postmark').send_batch(['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>')
+
+        self.assertEqual(results, [
+            {'success': False, 'error': 'Postmark API error: expected 2 results, got 1'},
+            {'success': False, 'error': 'Postmark API error: expected 2 results, got 1'},
+        ])
+
+    def test_error_fails_every_recipient(self):
+        self.respond((422, {'ErrorCode': 300, 'Message': 'Invalid email request'}))
+        results = self.service('postmark').send_batch(['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>')
+
+        self.assertEqual([result['status_code'] for result in results], [422, 422])
+        self.assertIn('Invalid email request', results[1]['error'])
+
+    def test_unreachable_api_is_a_connection_error(self):
+        with self.settings(POSTMARK_API_URL='http://127.0.0.1:1', CAMPAIGN_API_MAX_RETRIES=0), \
+                self.assertLogs('campaigns.smtp_service', 'ERROR'):
+            results = self.service('postmark').send_batch(['ann@example.org'], 'Hi', '<p>Hi</p>')
+
+        self.assertFalse(results[0]['success'])
+        self.assertTrue(results[0]['connection_error'])
+
+
+class MailgunBatchTests(ProviderAPITestCase):
+    """SMTPService.send_batch through the Mailgun messages API"""
+
+    def test_one_message_with_recipient_variables(self):
+        self.respond((200, {'id': '<batch@mg.example.com>', 'message': 'Queued. Thank you.'}))
+        results = self.service('mailgun', username='postmaster@mg.example.com').send_batch(
+            ['ann@example.org', 'bob@example.org'], 'Hi -name-', '<p>Hello -name-</p>',
+            substitutions=[{'-name-': 'Ann'}, {'-name-': 'Bob'}],
+            message_ids=['<1@example.com>', '<2@example.com>'],
+        )
+
+        self.assertEqual(results, [
+            {'success': True, 'message_id': '<1@example.com>'},
+            {'success': True, 'message_id': '<2@example.com>'},
+        ])
+        [request] = self.server.requests
+        self.assertEqual(request['path'], '/v3/mg.example.com/messages')
+        self.assertEqual(
+            request['headers']['Authorization'], 'Basic ' + base64.b64encode(b'api:key').decode('ascii')
+        )
+        fields = parse_qsl(request['body'].decode('utf-8'))
+        data = dict(fields)
+        self.assertEqual([value for name, value in fields if name == 'to'], ['ann@example.org', 'bob@example.org'])
+        self.assertEqual(data['from'], 'News <news@example.com>')
+        self.assertEqual(data['subject'], 'Hi %recipient.v0%')
+        self.assertEqual(data['html'], '<p>Hello %recipient.v0%</p>')
+        self.assertEqual(data['h:Message-Id'], '%recipient.message_id%')
+        self.assertEqual(data['v:message_id'], '%recipient.message_id%')
+        self.assertEqual(json.loads(data['recipient-variables']), {
+            'ann@example.org': {'v0': 'Ann', 'message_id': '<1@example.com>'},
+            'bob@example.org': {'v0': 'Bob', 'message_id': '<2@example.com>'},
+        })
+
+    def test_domain_falls_back_to_the_sender(self):
+        self.respond((200, {'id': '<batch@example.com>'}), (200, {'id': '<batch@example.com>'}))
+        self.service('mailgun').send_batch(['ann@example.org'], 'Hi', '<p>Hi</p>')
+        self.service('mailgun', username='api').send_batch(['ann@example.org'], 'Hi', '<p>Hi</p>')
+
+        self.assertEqual(
+            [request['path'] for request in self.server.requests],
+            ['/v3/example.com/messages', '/v3/example.com/messages'],
+        )
+
+    def test_attachments_are_uploaded_as_files(self):
+        self.respond((200, {'id': '<batch@example.com>'}))
+        self.service('mailgun').send_batch(
+            ['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>', attachments=[self.attachment()]
+        )
+
+        [request] = self.server.requests
+        self.assertTrue(request['headers']['Content-Type'].startswith('multipart/form-data'))
+        self.assertIn(b'name="attachment"; filename="report.pdf"', request['body'])
+        self.assertIn(b'%PDF-1.4 report', request['body'])
+        self.assertIn(b'name="recipient-variables"', request['body'])
+
+    def test_error_fails_every_recipient(self):
+        self.respond((401, {'message': 'Forbidden'}))
+        results = self.service('mailgun').send_batch(['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>')
+
+        self.assertEqual([result['status_code'] for result in results], [401, 401])
+        self.assertIn('Forbidden', results[0]['error'])
+
+
+class SESBatchTests(ProviderAPITestCase):
+    """SMTPService.send_batch through the SES v2 SendBulkEmail API"""
+
+    def service(self, provider_type='ses', **fields):
+        return super().service(provider_type, api_key='AKIDEXAMPLE', api_secret='secret', **fields)
+
+    def test_inline_template_with_per_entry_results(self):
+        self.respond((200, {'BulkEmailEntryResults': [
+            {'Status': 'SUCCESS', 'MessageId': 'ses-1'},
+            {'Status': 'MESSAGE_REJECTED', 'Error': 'Email address is not verified.'},
+        ]}))
+        results = self.service().send_batch(
+            ['ann@example.org', 'bob@example.org'], 'Hi -name-',
+            '<style>p {color: red}</style><p>Hello -name-, {{not a tag}}</p>',
+            text_content='Hello -name-',
+            substitutions=[{'-name-': 'Ann'}, {'-name-': '{{Bob}}'}],
+            message_ids=['<1@example.com>', '<2@example.com>'],
+        )
+
+        self.assertEqual(results, [
+            {'success': True, 'message_id': 'ses-1'},
+            {'success': False, 'error': 'Amazon SES API error: MESSAGE_REJECTED - Email address is not verified.'},
+        ])
+        [request] = self.server.requests
+        self.assertEqual(request['path'], '/v2/email/outbound-bulk-emails')
+        self.assertTrue(request['headers']['Authorization'].startswith(
+            'AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/'
+        ))
+        self.assertIn('/us-east-1/ses/aws4_request', request['headers']['Authorization'])
+        self.assertIn('X-Amz-Date', request['headers'])
+
+        data = self.json_body(request)
+        self.assertEqual(data['FromEmailAddress'], 'News <news@example.com>')
+        # Literal braces of the content come from template data, never as Handlebars tags
+        self.assertEqual(data['DefaultContent']['Template']['TemplateContent'], {
+            'Subject': 'Hi {{{v0}}}',
+            'Html': '<style>p {{{lb}}}color: red{{{rb}}}</style>'
+                    '<p>Hello {{{v0}}}, {{{lb}}}{{{lb}}}not a tag{{{rb}}}{{{rb}}}</p>',
+            'Text': 'Hello {{{v0}}}',
+        })
+        entries = data['BulkEmailEntries']
+        self.assertEqual(
+            [entry['Destination'] for entry in entries],
+            [{'ToAddresses': ['ann@example.org']}, {'ToAddresses': ['bob@example.org']}],
+        )
+        self.assertEqual(
+            [json.loads(entry['ReplacementEmailContent']['ReplacementTemplate']['ReplacementTemplateData'])
+             for entry in entries],
+            [{'v0': 'Ann', 'lb': '{', 'rb': '}'}, {'v0': '{{Bob}}', 'lb': '{', 'rb': '}'}],
+        )
+
+    def test_attachments_send_each_message_raw(self):
+        self.respond((200, {'MessageId': 'ses-1'}), (200, {'MessageId': 'ses-2'}))
+        results = self.service().send_batch(
+            ['ann@example.org', 'bob@example.org'], 'Hi -name-', '<p>Hi</p>',
+            substitutions=[{'-name-': 'Ann'}, {'-name-': 'Bob'}], attachments=[self.attachment()],
+        )
+
+        self.assertEqual([result['message_id'] for result in results], ['ses-1', 'ses-2'])
+        self.assertEqual(
+            [request['path'] for request in self.server.requests], ['/v2/email/outbound-emails'] * 2
+        )
+        data = self.json_body(self.server.requests[1])
+        self.assertEqual(data['Destination'], {'ToAddresses': ['bob@example.org']})
+        message = base64.b64decode(data['Content']['Raw']['Data']).decode('utf-8')
+        self.assertIn('Subject: Hi Bob', message)
+        self.assertIn('filename="report.pdf"', message)
+
+    def test_result_count_mismatch_fails_every_recipient(self):
+        self.respond((200, {'BulkEmailEntryResults': [{'Status': 'SUCCESS', 'MessageId': 'ses-1'}]}))
+        results = self.service().send_batch(['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>')
+
+        self.assertEqual([result['success'] for result in results], [False, False])
+        self.assertEqual(results[0]['error'], 'Amazon SES API error: expected 2 results, got 1')
+
+    def test_error_fails_every_recipient(self):
+        self.respond((403, {'message': 'The security token included in the request is invalid.'}))
+        results = self.service().send_batch(['ann@example.org', 'bob@example.org'], 'Hi', '<p>Hi</p>')
+
+        self.assertEqual([result['status_code'] for result in results], [403, 403])
+        self.assertIn('security token', results[1]['error'])
+
+
+class SignRequestTests(SimpleTestCase):
+    """sign_request against known answers from the AWS Signature Version 4 test suite"""
+
+    now = datetime(2015, 8, 30, 12, 36, 0, tzinfo=timezone.utc)
+    secret = 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY'
+
+    def sign(self, url, service='service', headers=None):
+        return sign_request('GET', url, b'', 'AKIDEXAMPLE', self.secret, 'us-east-1', service,
+                            headers=headers, now=self.now)
+
+    def test_vanilla_get(self):
+        headers = self.sign('https://example.amazonaws.com/')
+
+        self.assertEqual(headers['X-Amz-Date'], '20150830T123600Z')
+        self.assertEqual(
+            headers['Authorization'],
+            'AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/20150830/us-east-1/service/aws4_request, '
+            'SignedHeaders=host;x-amz-date, '
+            'Signature=5fa00fa31553b73ebf1942676e86291e8372ff2a2260956d9b8aae1d763fbf31',
+        )
+
+    def test_query_parameters_are_sorted(self):
+        headers = self.sign('https://example.amazonaws.com/?Param2=value2&Param1=value1')
+
+        self.assertTrue(headers['Authorization'].endswith(
+            'Signature=b97d918cfa904a5beff61c982a1b6f458b799221646efd99d3219ec94cdf2500'
+        ))
+
+    def test_extra_headers_are_signed(self):
+        headers = self.sign(
+            'https://iam.amazonaws.com/?Action=ListUsers&Version=2010-05-08', service='iam',
+            headers={'Content-Type': 'application/x-www-form-urlencoded; charset=utf-8'},
+        )
+
+        self.assertEqual(
+            headers['Authorization'],
+            'AWS4-HMAC-SHA256 Credential=AKIDEXAMPLE/20150830/us-east-1/iam/aws4_request, '
+            'SignedHeaders=content-type;host;x-amz-date, '
+            'Signature=5d672d79c15b13162d9279b0855cfba6789a8edb4c82c400e06b5924a6f2b5d7',
+        )
+        self.assertEqual(headers['Content-Type'], 'application/x-www-form-urlencoded; charset=utf-8')
+
+
+@skipIf(fakeredis is None, 'fakeredis with Lua support is not installed')
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CampaignTaskTestCase(TestCase):
+    """Runs the send tasks eagerly, with fakeredis behind the rate limiters and throttles"""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        for module in ['rate_limit', 'domain_throttle', 'pacing']:
+            patcher = mock.patch(f'campaigns.{module}.get_redis', return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        rate_limit._scripts.clear()
+        self.addCleanup(rate_limit._scripts.clear)
+        cache.clear()
+        # Buffered rows belong to the test's transaction
+        self.addCleanup(stat_counters.flush)
+        self.addCleanup(email_log_writer.flush)
+
+        self.provider = SMTPProvider.objects.create(
+            name='Test SMTP', provider_type='custom', host='127.0.0.1', from_email='news@example.com',
+            emails_per_second=0, emails_per_hour=0, emails_per_day=0,
+        )
+        self.campaign = Campaign.objects.create(
+            name='Test', subject='Hello', from_email='news@example.com', from_name='News',
+            html_content='<p>Hello</p>', smtp_provider=self.provider, status='sending',
+        )
+
+    def add_recipients(self, *emails, state='pending'):
+        recipients = []
+        for email in emails:
+            subscriber = Subscriber.objects.create(email=email)
+            recipients.append(CampaignRecipient.objects.create(
+                campaign=self.campaign, subscriber=subscriber, email=email, state=state
+            ))
+        return recipients
+
+    def run_chunk(self, recipients, **kwargs):
+        return send_campaign_chunk.apply(
+            args=(self.campaign.pk, recipients[0].pk, recipients[-1].pk), kwargs=dict(engine='sync', **kwargs)
+        )
+
+    def states(self):
+        return dict(CampaignRecipient.objects.filter(campaign=self.campaign).values_list('email', 'state'))
+
+
+@mock.patch.object(SMTPService, 'send_raw', return_value={'success': True, 'message_id': '<1@example.com>'})
+class SendCampaignChunkTests(CampaignTaskTestCase):
+    """send_campaign_chunk waiting for capacity across task retries"""
+
+    def test_waits_for_send_capacity_as_often_as_needed(self, send_raw):
+        recipients = self.add_recipients('ann@example.org', 'bob@example.org')
+        waits = [(0, 3600.0)] * 5 + [(2, 0.0)]
+
+        with mock.patch.object(ProviderRateLimiter, 'acquire', side_effect=waits) as acquire:
+            result = self.run_chunk(recipients)
+
+        self.assertTrue(result.successful(), result.traceback)
+        self.assertEqual(acquire.call_count, 6)
+        self.assertEqual(send_raw.call_count, 2)
+        self.assertEqual(self.states(), {'ann@example.org': 'sent', 'bob@example.org': 'sent'})
+
+    def test_multi_provider_chunk_waits_for_a_provider(self, send_raw):
+        self.campaign.send_mode = 'multi'
+        self.campaign.save(update_fields=['send_mode'])
+        recipients = self.add_recipients('ann@example.org', 'bob@example.org')
+        picks = iter([None] * 5)
+
+        def select(campaign, exclude=()):
+            return next(picks, self.provider)
+
+        with mock.patch('campaigns.tasks.SMTPManager.select_campaign_provider', side_effect=select), \
+                mock.patch('campaigns.tasks.SMTPManager.is_provider_active', return_value=True):
+            result = self.run_chunk(recipients)
+
+        self.assertTrue(result.successful(), result.traceback)
+        self.assertEqual(result.result['emails_sent'], 2)
+        self.assertEqual(self.states(), {'ann@example.org': 'sent', 'bob@example.org': 'sent'})
+
+    @override_settings(CAMPAIGN_RETRY_MAX_ATTEMPTS=3)
+    def test_retries_without_a_provider_use_up_their_attempts(self, send_raw):
+        self.campaign.smtp_provider = None
+        self.campaign.save(update_fields=['smtp_provider'])
+        fresh, last = self.add_recipients('ann@example.org', 'bob@example.org', state='queued')
+        CampaignRecipient.objects.filter(pk=last.pk).update(attempts=3)
+
+        result = self.run_chunk([fresh, last], recipient_ids=[fresh.pk, last.pk])
+
+        self.assertFalse(result.result['success'])
+        self.assertEqual(self.states(), {'ann@example.org': 'deferred', 'bob@example.org': 'failed'})
+        self.assertEqual(CampaignRecipient.objects.get(pk=fresh.pk).attempts, 1)
+        send_raw.assert_not_called()
+
+    @override_settings(CAMPAIGN_SEND_BLOCK_SIZE=1)
+    def test_waits_out_repeated_domain_deferrals(self, send_raw):
+        recipients = self.add_recipients(*[f'user{i}@example.org' for i in range(6)])
+        deferral = {'success': False, 'error': '451 Try again later', 'smtp_code': 451}
+        send_raw.side_effect = [deferral] * 5 + [{'success': True, 'message_id': '<1@example.com>'}]
+        deferred_domains = domain_throttle.deferred_domains
+
+        def pause_elapses(domains):
+            # Each retry's countdown outlasts the pause it waited for
+            paused = deferred_domains(domains)
+            for key in self.redis.keys('domain_backoff:*'):
+                self.redis.delete(key)
+            return paused
+
+        with mock.patch('campaigns.domain_throttle.deferred_domains', side_effect=pause_elapses):
+            result = self.run_chunk(recipients)
+
+        self.assertTrue(result.successful(), result.traceback)
+        self.assertEqual(send_raw.call_count, 6)
+        self.assertEqual(list(self.states().values()), ['deferred'] * 5 + ['sent'])
+
+
+@mock.patch.object(SMTPService, 'send_email', return_value={'success': True, 'message_id': '<1@example.com>'})
+class SendCampaignEmailTests(CampaignTaskTestCase):
+    """send_campaign_email waiting for capacity across task retries"""
+
+    content = {'subject': 'Hello', 'html_content': '<p>Hello</p>'}
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('campaigns.tasks.SMTPManager.select_best_provider', return_value=self.provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_task(self, email):
+        return send_campaign_email.apply(args=(self.campaign.pk, email, self.content))
+
+    def test_waits_for_send_capacity_as_often_as_needed(self, send_email):
+        self.add_recipients('ann@example.org', state='queued')
+        waits = [(0, 60.0)] * 5 + [(1, 0.0)]
+
+        with mock.patch.object(ProviderRateLimiter, 'reserve', side_effect=waits) as reserve:
+            result = self.run_task('ann@example.org')
+
+        self.assertTrue(result.successful(), result.traceback)
+        self.assertTrue(result.result['success'])
+        self.assertEqual(reserve.call_count, 6)
+        send_email.assert_called_once()
+        self.assertEqual(self.states(), {'ann@example.org': 'sent'})
+
+    def test_error_after_the_send_does_not_requeue_the_recipient(self, send_email):
+        self.add_recipients('ann@example.org', state='queued')
+
+        with mock.patch('campaigns.tasks.record_sent', side_effect=ConnectionError('Redis is down')):
+            result = self.run_task('ann@example.org')
+
+        self.assertTrue(result.result['success'])
+        send_email.assert_called_once()
+        self.assertEqual(self.states(), {'ann@example.org': 'sent'})
+
+    def test_error_before_the_send_defers_the_recipient(self, send_email):
+        self.add_recipients('ann@example.org', state='queued')
+        send_email.side_effect = RuntimeError('Template error')
+
+        result = self.run_task('ann@example.org')
+
+        self.assertFalse(result.result['success'])
+        self.assertEqual(self.states(), {'ann@example.org': 'deferred'})
+
+    def test_retries_sends_lost_to_an_open_circuit_as_often_as_needed(self, send_email):
+        self.add_recipients('ann@example.org', state='queued')
+        outage = {'success': False, 'error': 'Connection refused', 'connection_error': True}
+        send_email.side_effect = [outage] * 5 + [{'success': True, 'message_id': '<1@example.com>'}]
+
+        with mock.patch.object(CircuitBreaker, 'record_results', side_effect=['open'] * 5 + ['closed']):
+            result = self.run_task('ann@example.org')
+
+        self.assertTrue(result.successful(), result.traceback)
+        self.assertTrue(result.result['success'])
+        self.assertEqual(send_email.call_count, 6)
+        self.assertEqual(self.states(), {'ann@example.org': 'sent'})
+
+
+@mock.patch.object(SMTPService, 'send_email', return_value={'success': True, 'message_id': '<1@example.com>'})
+class SendTransactionalEmailTests(CampaignTaskTestCase):
+    """send_transactional_email waiting for the transactional lane"""
+
+    def test_waits_for_send_capacity_as_often_as_needed(self, send_email):
+        waits = [(0, 60.0)] * 5 + [(1, 0.0)]
+
+        with mock.patch.object(ProviderRateLimiter, 'reserve', side_effect=waits) as reserve:
+            result = send_transactional_email.apply(kwargs={
+                'to_email': 'ann@example.org', 'subject': 'Reset your password',
+                'html_content': '<p>Reset</p>', 'provider_id': self.provider.pk,
+            })
+
+        self.assertTrue(result.successful(), result.traceback)
+        self.assertTrue(result.result['success'])
+        self.assertEqual(reserve.call_count, 6)
+        send_email.assert_called_once()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PopulateTests(TestCase):
+    """CampaignRecipient.populate"""
+
+    def setUp(self):
+        self.campaign = Campaign.objects.create(
+            name='Test', subject='Hello', from_email='news@example.com', from_name='News', html_content='<p>Hello</p>',
+        )
+
+    def segment(self, *subscribers):
+        segment = Segment.objects.create(name='Segment')
+        segment.subscribers.add(*subscribers)
+        self.campaign.subscriber_segments.add(segment)
+        return segment
+
+    @override_settings(CAMPAIGN_POPULATE_BATCH_SIZE=2)
+    def test_queues_each_eligible_subscriber_once(self):
+        ann, bob, cy, dee, eve = [
+            Subscriber.objects.create(email=f'{name}@example.org', name=name.title())
+            for name in ['ann', 'bob', 'cy', 'dee', 'eve']
+        ]
+        dee.status = 'unsubscribed'
+        dee.save()
+        Blacklist.objects.create(email='eve@example.org', reason='Complaint')
+        self.segment(ann, bob, dee)
+        self.segment(bob, cy, eve)
+        CampaignRecipient.objects.create(campaign=self.campaign, subscriber=cy, email=cy.email, state='sent')
+
+        self.assertEqual(CampaignRecipient.populate(self.campaign), 2)
+        self.assertEqual(
+            sorted(CampaignRecipient.objects.values_list('email', 'name', 'state', 'subscriber_id')),
+            [
+                ('ann@example.org', 'Ann', 'pending', ann.id),
+                ('bob@example.org', 'Bob', 'pending', bob.id),
+                ('cy@example.org', '', 'sent', cy.id),
+            ],
+        )
+        self.assertEqual(CampaignRecipient.populate(self.campaign), 0)
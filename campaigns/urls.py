@@ -17,6 +17,9 @@ urlpatterns = [
     path('<int:pk>/preview/', views.campaign_preview, name='campaign_preview'),
     path('<int:pk>/clone/', views.campaign_clone, name='campaign_clone'),
     path('<int:pk>/send/', views.campaign_send, name='campaign_send'),
+    path('<int:pk>/pause/', views.campaign_pause, name='campaign_pause'),
+    path('<int:pk>/resume/', views.campaign_resume, name='campaign_resume'),
+    path('<int:pk>/cancel/', views.campaign_cancel, name='campaign_cancel'),
 
     path('media/', views.MediaListView.as_view(), name='media_list'),
     path('media/upload/', views.MediaUploadView.as_view(), name='media_upload'),
@@ -6,9 +6,11 @@ from django.contrib.auth.decorators import login_required
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.forms import formset_factory, modelformset_factory
-from .models import SMTPProvider, Campaign, EmailLog, EmailTemplate, Attachment
+from .models import SMTPProvider, Campaign, CampaignRecipient, EmailLog, EmailTemplate, Attachment
 from .forms import CampaignForm, TemplateForm, SMTPProviderForm, AttachmentForm
 from .smtp_service import SMTPService, SMTPManager
+from .pacing import get_pacing
+from .tasks import dispatch_campaign_send, enqueue_pending_chunks, send_transactional_email
 from subscribers.models import Subscriber
 import logging
 import json
@@ -24,8 +26,13 @@ from .models import Blacklist
 def smtp_manager(request):
     """View for managing SMTP providers with user-specific permissions"""
     # Users can only see their own SMTP providers
-    providers = SMTPProvider.objects.filter(created_by=request.user)
-    
+    providers = list(SMTPProvider.objects.filter(created_by=request.user))
+
+    # Current adaptive send targets, see PacingController
+    pacing = get_pacing(providers)
+    for provider in providers:
+        provider.pacing = pacing.get(provider.pk)
+
     context = {
         'providers': providers,
     }
@@ -135,18 +142,15 @@ def send_test_email(request):
             if not default_provider:
                 messages.error(request, 'No default SMTP provider set.')
             else:
-                # Send test email
-                service = SMTPService(default_provider)
-                result = service.send_email(
+                # Test emails go out from the transactional queue, on the share of
+                # the provider quota running campaigns cannot use up
+                send_transactional_email.delay(
                     to_email=to_email,
                     subject='Test Email',
-                    template_path='campaigns/test_email.html'  # Use the new template
+                    template_path='campaigns/test_email.html',
+                    provider_id=default_provider.pk
                 )
-        
-                if result['success']:
-                    messages.success(request, 'Test email sent successfully!')
-                else:
-                    messages.error(request, f'Failed to send test email: {result.get("error", "Unknown error")}')
+                messages.success(request, f'Test email to {to_email} queued for sending.')
 
     # For GET or after POST, show the form
     default_provider = SMTPProvider.objects.filter(is_default=True, is_active=True).first()
@@ -361,13 +365,16 @@ def campaign_clone(request, pk):
         text_content=original_campaign.text_content,
         template=original_campaign.template,
         smtp_provider=original_campaign.smtp_provider,
+        send_mode=original_campaign.send_mode,
+        send_window_hours=original_campaign.send_window_hours,
         status='draft', # Cloned campaigns start as drafts
         created_by=request.user # Assign current user as creator
     )
     new_campaign.save()
 
-    # Copy ManyToMany relationships (subscriber_segments)
+    # Copy ManyToMany relationships (subscriber_segments, allowed_providers)
     new_campaign.subscriber_segments.set(original_campaign.subscriber_segments.all())
+    new_campaign.allowed_providers.set(original_campaign.allowed_providers.all())
 
     messages.success(request, f'Campaign "{new_campaign.name}" cloned successfully!')
     return redirect('campaigns:campaign_edit', pk=new_campaign.pk)
@@ -395,7 +402,12 @@ def campaign_send(request, pk):
             messages.error(request, f'Campaign "{campaign.name}" has no target segments selected.')
             return redirect('campaigns:campaign_edit', pk=campaign.pk)
 
-        if not campaign.smtp_provider:
+        if campaign.send_mode == 'multi':
+            if not SMTPManager.get_campaign_providers(campaign):
+                logger.error(f'No active SMTP provider available for multi-provider campaign {pk}.')
+                messages.error(request, f'Campaign "{campaign.name}" has no active SMTP provider to send through.')
+                return redirect('campaigns:campaign_edit', pk=campaign.pk)
+        elif not campaign.smtp_provider:
             default_provider = SMTPProvider.objects.filter(is_default=True, is_active=True).first()
             if default_provider:
                 campaign.smtp_provider = default_provider
@@ -406,96 +418,109 @@ def campaign_send(request, pk):
                 messages.error(request, f'Campaign "{campaign.name}" has no SMTP provider selected and no default active provider is set.')
                 return redirect('campaigns:campaign_edit', pk=campaign.pk)
 
+        # dispatch_scheduled_campaigns starts the campaign when its time comes
+        if campaign.scheduled_at and campaign.scheduled_at > timezone.now():
+            campaign.status = 'scheduled'
+            campaign.save()
+            logger.info(f'Campaign {pk} scheduled for {campaign.scheduled_at}.')
+            messages.success(request, f'Campaign "{campaign.name}" is scheduled for {timezone.localtime(campaign.scheduled_at):%Y-%m-%d %H:%M}.')
+            return redirect('campaigns:campaign_list')
+
+        # A send window starts when the campaign does
+        campaign.scheduled_at = timezone.now()
         campaign.status = 'sending'
         campaign.save()
         logger.info(f'Campaign {pk} status set to sending.')
 
-        total_sent_count = 0
-        smtp_service = SMTPService(campaign.smtp_provider)
-        subscribers_to_send = Subscriber.objects.filter(segments__in=campaign.subscriber_segments.all()).distinct()
-
-        # Exclude blacklisted emails
-        blacklisted_emails = Blacklist.objects.values_list('email', flat=True)
-        subscribers_to_send = subscribers_to_send.exclude(email__in=blacklisted_emails)
-
-        for subscriber in subscribers_to_send:
-            try:
-                subject = campaign.subject.replace('{subscriber.name}', subscriber.name or '').replace('{subscriber.email}', subscriber.email)
-                html_content = campaign.html_content.replace('{subscriber.name}', subscriber.name or '').replace('{subscriber.email}', subscriber.email)
-                text_content = campaign.text_content.replace('{subscriber.name}', subscriber.name or '').replace('{subscriber.email}', subscriber.email)
-                from_email = campaign.from_email or campaign.smtp_provider.from_email
-                from_name = campaign.from_name or campaign.smtp_provider.from_name
-
-                logging.warning(f'To: {subscriber.email}, Subject: {subject}')
-
-                attachments = [attachment.file for attachment in campaign.attachments.all()]
-
-                result = smtp_service.send_email(
-                    to_email=subscriber.email,
-                    subject=subject,
-                    html_content=html_content,
-                    text_content=text_content,
-                    from_email=from_email,
-                    from_name=from_name,
-                    cc_recipients=campaign.cc_recipients.split(',') if campaign.cc_recipients else None,
-                    bcc_recipients=campaign.bcc_recipients.split(',') if campaign.bcc_recipients else None,
-                    attachments=attachments
-                )
-
-                if result['success']:
-                    total_sent_count += 1
-                    EmailLog.objects.create(
-                        campaign=campaign,
-                        subscriber_email=subscriber.email,
-                        smtp_provider=campaign.smtp_provider,
-                        subject=subject,
-                        status='sent',
-                        sent_at=timezone.now()
-                    )
-                else:
-                    logger.error(f'SMTP service failed to send email to {subscriber.email} for campaign {pk}.')
-                    EmailLog.objects.create(
-                        campaign=campaign,
-                        subscriber_email=subscriber.email,
-                        smtp_provider=campaign.smtp_provider,
-                        subject=subject,
-                        status='failed',
-                        error_message='SMTP service failed to send email.',
-                        sent_at=timezone.now()
-                    )
-            except Exception as e:
-                logger.exception(f'Error sending email to {subscriber.email} for campaign {pk}.')
-                EmailLog.objects.create(
-                    campaign=campaign,
-                    subscriber_email=subscriber.email,
-                    smtp_provider=campaign.smtp_provider,
-                    subject=campaign.subject,
-                    status='failed',
-                    error_message=f'Error sending email: {str(e)}',
-                    sent_at=timezone.now()
-                )
-                messages.error(request, f'Error sending email to {subscriber.email}: {str(e)}')
-
-        campaign.total_recipients = subscribers_to_send.count()
-        campaign.total_sent = total_sent_count
-        campaign.status = 'sent'
-        campaign.sent_at = timezone.now()
-        campaign.save()
-        logger.info(f'Campaign {pk} sent to {total_sent_count} recipients.')
+        # Hand the actual delivery off to the chunked Celery pipeline
+        total_recipients = dispatch_campaign_send(campaign)
 
-        messages.success(request, f'Campaign "{campaign.name}" sent to {total_sent_count} recipients.')
+        if campaign.send_window_hours:
+            messages.success(request, f'Campaign "{campaign.name}" is being sent to {total_recipients} recipients over {campaign.send_window_hours} hours.')
+        else:
+            messages.success(request, f'Campaign "{campaign.name}" is being sent to {total_recipients} recipients.')
         return redirect('campaigns:campaign_list')
 
     logger.info(f'Rendering confirmation page for campaign {pk}')
     context = {
         'campaign': campaign,
         'is_draft': campaign.status == 'draft',
+        'is_scheduled': campaign.scheduled_at is not None and campaign.scheduled_at > timezone.now(),
         'has_segments': campaign.subscriber_segments.exists(),
-        'has_provider': campaign.smtp_provider is not None or SMTPProvider.objects.filter(is_default=True, is_active=True).exists()
+        'has_provider': (
+            bool(SMTPManager.get_campaign_providers(campaign)) if campaign.send_mode == 'multi'
+            else campaign.smtp_provider is not None or SMTPProvider.objects.filter(is_default=True, is_active=True).exists()
+        )
     }
     return render(request, 'campaigns/campaign_send_confirm.html', context)
 
 
+@login_required
+@require_POST
+def campaign_pause(request, pk):
+    """Pause a campaign that is currently being sent"""
+    campaign = get_object_or_404(Campaign, pk=pk)
+    if campaign.status not in ['scheduled', 'sending']:
+        messages.error(request, f'Campaign "{campaign.name}" is not being sent and cannot be paused.')
+        return redirect('campaigns:campaign_list')
+
+    # A campaign that has not started yet goes back to being a draft
+    if campaign.status == 'scheduled':
+        campaign.status = 'draft'
+        campaign.save(update_fields=['status'])
+        logger.info(f'Campaign {pk} unscheduled.')
+        messages.success(request, f'Campaign "{campaign.name}" unscheduled and returned to drafts.')
+        return redirect('campaigns:campaign_list')
+
+    campaign.status = 'paused'
+    campaign.save(update_fields=['status'])
+    logger.info(f'Campaign {pk} paused.')
+
+    messages.success(request, f'Campaign "{campaign.name}" paused.')
+    return redirect('campaigns:campaign_list')
+
+
+@login_required
+@require_POST
+def campaign_resume(request, pk):
+    """Resume a paused campaign from its last recipient checkpoint"""
+    campaign = get_object_or_404(Campaign, pk=pk)
+    if campaign.status != 'paused':
+        messages.error(request, f'Campaign "{campaign.name}" is not paused.')
+        return redirect('campaigns:campaign_list')
+
+    campaign.status = 'sending'
+    campaign.save(update_fields=['status'])
+    if campaign.send_window_hours:
+        # Only what was already released is re-enqueued; the dispatcher
+        # spreads the rest over what is left of the send window
+        enqueue_pending_chunks(campaign, last_id=campaign.release_cursor)
+        remaining = CampaignRecipient.objects.filter(campaign=campaign, state='pending').count()
+    else:
+        remaining = enqueue_pending_chunks(campaign)
+    logger.info(f'Campaign {pk} resumed with {remaining} recipients remaining.')
+
+    messages.success(request, f'Campaign "{campaign.name}" resumed with {remaining} recipients remaining.')
+    return redirect('campaigns:campaign_list')
+
+
+@login_required
+@require_POST
+def campaign_cancel(request, pk):
+    """Cancel a campaign, stopping any in-flight sending"""
+    campaign = get_object_or_404(Campaign, pk=pk)
+    if campaign.status not in ['scheduled', 'sending', 'paused']:
+        messages.error(request, f'Campaign "{campaign.name}" cannot be cancelled.')
+        return redirect('campaigns:campaign_list')
+
+    campaign.status = 'cancelled'
+    campaign.save(update_fields=['status'])
+    logger.info(f'Campaign {pk} cancelled.')
+
+    messages.success(request, f'Campaign "{campaign.name}" cancelled.')
+    return redirect('campaigns:campaign_list')
+
+
 @login_required
 def template_list(request):
     """List all templates"""
@@ -595,9 +620,11 @@ def webhook_handler(request):
                 email=email,
                 defaults={'reason': reason or 'No reason provided'}
             )
-            # Also update the EmailLog if possible
+            # Also update the EmailLog if possible, by its indexed Message-ID when the provider sends it back
+            message_id = payload.get('message_id')
+            logs = EmailLog.objects.filter(message_id=message_id) if message_id else EmailLog.objects.filter(subscriber_email=email)
             try:
-                log = EmailLog.objects.filter(subscriber_email=email).latest('sent_at')
+                log = logs.latest('sent_at')
                 log.status = 'bounced' if event_type == 'bounce' else 'failed'
                 log.bounce_reason = reason
                 log.save()
@@ -1,6 +1,7 @@
 import os
 from celery import Celery
 from django.conf import settings
+from kombu import Queue
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mail.settings')
@@ -16,10 +17,22 @@ app.autodiscover_tasks()
 
 # Optional configuration, see the application user guide.
 app.conf.update(
+    task_queues=(
+        Queue('transactional'),
+        Queue('campaigns'),
+        Queue('subscribers'),
+        Queue('celery'),
+    ),
     task_routes={
+        # One-off sends get a low-latency lane of their own, so they never
+        # wait behind campaign chunks
+        'campaigns.tasks.send_transactional_email': {'queue': 'transactional'},
         'campaigns.tasks.*': {'queue': 'campaigns'},
         'subscribers.tasks.*': {'queue': 'subscribers'},
     },
+    # Workers check their queues in the order given to -Q, so a worker started
+    # with "-Q transactional,campaigns" always takes transactional mail first
+    broker_transport_options={'queue_order_strategy': 'priority'},
     task_serializer='json',
     accept_content=['json'],
     result_serializer='json',
@@ -297,6 +297,79 @@ EMAIL_SUBJECT_PREFIX = config('EMAIL_SUBJECT_PREFIX', default='[Mail System] ')
 EMAIL_SENDING_RATE_LIMIT = config('EMAIL_SENDING_RATE_LIMIT', default=100, cast=int)  # emails per hour
 EMAIL_BURST_LIMIT = config('EMAIL_BURST_LIMIT', default=10, cast=int)  # emails per minute
 
+# Campaign delivery pipeline
+CAMPAIGN_SEND_CHUNK_SIZE = config('CAMPAIGN_SEND_CHUNK_SIZE', default=500, cast=int)  # recipients per Celery task
+CAMPAIGN_SEND_BLOCK_SIZE = config('CAMPAIGN_SEND_BLOCK_SIZE', default=50, cast=int)  # recipients sent and checkpointed together
+CAMPAIGN_POPULATE_BATCH_SIZE = config('CAMPAIGN_POPULATE_BATCH_SIZE', default=2000, cast=int)  # recipient rows inserted per query when a send starts
+CAMPAIGN_STATUS_CHECK_INTERVAL = config('CAMPAIGN_STATUS_CHECK_INTERVAL', default=1.0, cast=float)  # seconds between pause/cancel checks
+CAMPAIGN_DELIVERY_ENGINE = config('CAMPAIGN_DELIVERY_ENGINE', default='sync')  # 'sync' (pooled smtplib) or 'async' (asyncio engine)
+CAMPAIGN_RATE_LIMIT_MAX_SLEEP = config('CAMPAIGN_RATE_LIMIT_MAX_SLEEP', default=5.0, cast=float)  # longest in-task wait for send tokens before a chunk is retried later
+CAMPAIGN_LOG_FLUSH_SIZE = config('CAMPAIGN_LOG_FLUSH_SIZE', default=500, cast=int)  # buffered EmailLog rows written per flush
+CAMPAIGN_LOG_FLUSH_INTERVAL = config('CAMPAIGN_LOG_FLUSH_INTERVAL', default=2.0, cast=float)  # seconds between background EmailLog flushes
+CAMPAIGN_ATTACHMENT_SPOOL_THRESHOLD = config('CAMPAIGN_ATTACHMENT_SPOOL_THRESHOLD', default=1048576, cast=int)  # encoded attachment bytes kept on the heap before spooling to a memory-mapped file
+CAMPAIGN_DOMAIN_PER_MINUTE = config('CAMPAIGN_DOMAIN_PER_MINUTE', default=0, cast=int)  # default per-domain sends per minute (0 = unlimited)
+CAMPAIGN_DOMAIN_CONCURRENCY = config('CAMPAIGN_DOMAIN_CONCURRENCY', default=0, cast=int)  # default per-domain messages in flight (0 = unlimited)
+CAMPAIGN_DOMAIN_BACKOFF = config('CAMPAIGN_DOMAIN_BACKOFF', default=60.0, cast=float)  # seconds a domain is paused after its first 421/451 deferral, doubling per repeat
+CAMPAIGN_DOMAIN_BACKOFF_MAX = config('CAMPAIGN_DOMAIN_BACKOFF_MAX', default=1800.0, cast=float)  # longest per-domain deferral pause
+CAMPAIGN_API_POOL_SIZE = config('CAMPAIGN_API_POOL_SIZE', default=10, cast=int)  # keep-alive connections per API provider and worker process
+CAMPAIGN_API_CONNECT_TIMEOUT = config('CAMPAIGN_API_CONNECT_TIMEOUT', default=5.0, cast=float)  # seconds to establish an API connection
+CAMPAIGN_API_READ_TIMEOUT = config('CAMPAIGN_API_READ_TIMEOUT', default=30.0, cast=float)  # seconds to wait for an API response
+CAMPAIGN_API_MAX_RETRIES = config('CAMPAIGN_API_MAX_RETRIES', default=3, cast=int)  # retries on connection errors and on 429/503 replies with Retry-After
+CAMPAIGN_API_RETRY_BACKOFF = config('CAMPAIGN_API_RETRY_BACKOFF', default=0.5, cast=float)  # exponential backoff factor between API retries
+CAMPAIGN_API_BLOCK_SIZE = config('CAMPAIGN_API_BLOCK_SIZE', default=500, cast=int)  # recipients per block for API providers with a batch endpoint
+SENDGRID_API_URL = config('SENDGRID_API_URL', default='https://api.sendgrid.com')  # point at a local stand-in for testing
+POSTMARK_API_URL = config('POSTMARK_API_URL', default='https://api.postmarkapp.com')
+MAILGUN_API_URL = config('MAILGUN_API_URL', default='https://api.mailgun.net')  # https://api.eu.mailgun.net for EU domains
+AWS_SES_REGION_NAME = config('AWS_SES_REGION_NAME', default='us-east-1')
+SES_API_URL = config('SES_API_URL', default='')  # defaults to the regional SES endpoint
+CAMPAIGN_RETRY_MAX_ATTEMPTS = config('CAMPAIGN_RETRY_MAX_ATTEMPTS', default=5, cast=int)  # retries of a temporary (4xx) failure before it counts as failed
+CAMPAIGN_RETRY_MAX_AGE = config('CAMPAIGN_RETRY_MAX_AGE', default=172800, cast=int)  # seconds after the first deferral when a recipient stops being retried
+CAMPAIGN_RETRY_BASE_DELAY = config('CAMPAIGN_RETRY_BASE_DELAY', default=60.0, cast=float)  # seconds before the first retry, doubling per attempt (with jitter)
+CAMPAIGN_RETRY_MAX_DELAY = config('CAMPAIGN_RETRY_MAX_DELAY', default=3600.0, cast=float)  # longest wait between retries
+CAMPAIGN_RETRY_POLL_INTERVAL = config('CAMPAIGN_RETRY_POLL_INTERVAL', default=30.0, cast=float)  # seconds between retry queue polls
+CAMPAIGN_RETRY_BATCH_SIZE = config('CAMPAIGN_RETRY_BATCH_SIZE', default=500, cast=int)  # due retries claimed per poll
+CAMPAIGN_CIRCUIT_FAILURE_RATE = config('CAMPAIGN_CIRCUIT_FAILURE_RATE', default=0.5, cast=float)  # share of provider failures (connection, timeout, API errors) that opens a provider's circuit
+CAMPAIGN_CIRCUIT_MIN_REQUESTS = config('CAMPAIGN_CIRCUIT_MIN_REQUESTS', default=10, cast=int)  # sends counted in a window before the failure rate is judged
+CAMPAIGN_CIRCUIT_WINDOW = config('CAMPAIGN_CIRCUIT_WINDOW', default=60.0, cast=float)  # seconds over which send outcomes are counted
+CAMPAIGN_CIRCUIT_COOLDOWN = config('CAMPAIGN_CIRCUIT_COOLDOWN', default=30.0, cast=float)  # seconds an open circuit skips its provider before a probe, doubling after a failed probe
+CAMPAIGN_CIRCUIT_COOLDOWN_MAX = config('CAMPAIGN_CIRCUIT_COOLDOWN_MAX', default=600.0, cast=float)  # longest cool-down
+CAMPAIGN_CIRCUIT_PROBE_TIMEOUT = config('CAMPAIGN_CIRCUIT_PROBE_TIMEOUT', default=60.0, cast=float)  # seconds before a probe that never reported back is given to another caller
+CAMPAIGN_TRANSACTIONAL_RESERVE = config('CAMPAIGN_TRANSACTIONAL_RESERVE', default=0.1, cast=float)  # share of every provider rate limit window campaigns leave to transactional mail
+CAMPAIGN_SCHEDULER_INTERVAL = config('CAMPAIGN_SCHEDULER_INTERVAL', default=60.0, cast=float)  # seconds between scheduled campaign checks and paced chunk releases
+CAMPAIGN_ADAPTIVE_PACING = config('CAMPAIGN_ADAPTIVE_PACING', default=True, cast=bool)  # adjust each provider's send rate and concurrency to its feedback (AIMD)
+CAMPAIGN_PACING_MIN_RATE = config('CAMPAIGN_PACING_MIN_RATE', default=1, cast=int)  # lowest messages per second a provider is slowed to
+CAMPAIGN_PACING_MAX_RATE = config('CAMPAIGN_PACING_MAX_RATE', default=200, cast=int)  # highest messages per second for providers without a per-second limit
+CAMPAIGN_PACING_RATE_STEP = config('CAMPAIGN_PACING_RATE_STEP', default=2, cast=int)  # messages per second added per healthy increase interval
+CAMPAIGN_PACING_INCREASE_INTERVAL = config('CAMPAIGN_PACING_INCREASE_INTERVAL', default=5.0, cast=float)  # seconds between increases
+CAMPAIGN_PACING_DECREASE_FACTOR = config('CAMPAIGN_PACING_DECREASE_FACTOR', default=0.5, cast=float)  # rate and concurrency are multiplied by this when the provider pushes back
+CAMPAIGN_PACING_DECREASE_INTERVAL = config('CAMPAIGN_PACING_DECREASE_INTERVAL', default=5.0, cast=float)  # seconds between decreases
+CAMPAIGN_PACING_ERROR_RATE = config('CAMPAIGN_PACING_ERROR_RATE', default=0.2, cast=float)  # share of provider failures in a block that counts as push-back
+CAMPAIGN_PACING_LATENCY_FACTOR = config('CAMPAIGN_PACING_LATENCY_FACTOR', default=2.0, cast=float)  # per-message latency over this multiple of its baseline counts as push-back
+CAMPAIGN_PACING_LATENCY_SMOOTHING = config('CAMPAIGN_PACING_LATENCY_SMOOTHING', default=0.2, cast=float)  # weight of each block in the latency moving average
+
+# Overrides for large mailbox providers that defer bursts
+CAMPAIGN_DOMAIN_THROTTLES = {
+    'gmail.com': {'per_minute': 600, 'concurrency': 10},
+    'googlemail.com': {'per_minute': 600, 'concurrency': 10},
+    'yahoo.com': {'per_minute': 300, 'concurrency': 5},
+    'outlook.com': {'per_minute': 300, 'concurrency': 5},
+    'hotmail.com': {'per_minute': 300, 'concurrency': 5},
+    'live.com': {'per_minute': 300, 'concurrency': 5},
+}
+
+# Poll the retry queue for deferred recipients that are due, start scheduled
+# campaigns and release paced sends
+CELERY_BEAT_SCHEDULE = {
+    'process-campaign-retries': {
+        'task': 'campaigns.tasks.process_retry_queue',
+        'schedule': CAMPAIGN_RETRY_POLL_INTERVAL,
+    },
+    'dispatch-scheduled-campaigns': {
+        'task': 'campaigns.tasks.dispatch_scheduled_campaigns',
+        'schedule': CAMPAIGN_SCHEDULER_INTERVAL,
+    },
+}
+
 # Authentication settings
 LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/'